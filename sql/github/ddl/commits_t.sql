@@ -7,5 +7,13 @@ CREATE TABLE public.commits (
     created_at TIMESTAMP,
     repo VARCHAR,
     committer_id VARCHAR,
-    CONSTRAINT commits_pk PRIMARY KEY(sha)
-);
+    CONSTRAINT commits_pk PRIMARY KEY(sha, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Monthly partitions are created by the loader (src/engineering/partitions.py)
+CREATE TABLE public.commits_default PARTITION OF public.commits DEFAULT;
+
+CREATE INDEX commits_created_at_brin ON public.commits USING brin (created_at);
+CREATE INDEX commits_repo_created_at_idx ON public.commits (repo, created_at);
+CREATE INDEX commits_committer_id_idx ON public.commits (committer_id, repo);
+CREATE INDEX commits_author_id_idx ON public.commits (author_id);
@@ -0,0 +1,7 @@
+DROP TABLE IF EXISTS public.daily_issues_state;
+
+CREATE TABLE public.daily_issues_state (
+  snapshot varchar,
+  loaded_through timestamp,
+  PRIMARY KEY(snapshot)
+);
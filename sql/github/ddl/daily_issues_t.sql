@@ -10,4 +10,11 @@ CREATE TABLE public.daily_issues (
   date DATE,
   repo varchar,
   PRIMARY KEY(id, updated_at, date)
-);
+) PARTITION BY RANGE (date);
+
+-- Monthly partitions are created by the loader (src/engineering/partitions.py)
+CREATE TABLE public.daily_issues_default PARTITION OF public.daily_issues DEFAULT;
+
+-- Snapshot dates are replaced as a whole
+CREATE INDEX daily_issues_date_idx ON public.daily_issues (date);
+CREATE INDEX daily_issues_repo_date_idx ON public.daily_issues (repo, date);
@@ -16,5 +16,14 @@ CREATE TABLE public.issues (
   closed_at timestamp,
   author_association varchar,
   repo varchar,
+  loaded_at timestamp DEFAULT (now() AT TIME ZONE 'utc'),
   PRIMARY KEY(id, updated_at)
-);
+) PARTITION BY RANGE (updated_at);
+
+-- Monthly partitions are created by the loader (src/engineering/partitions.py)
+CREATE TABLE public.issues_default PARTITION OF public.issues DEFAULT;
+
+-- Revisions loaded after the last incremental snapshot
+CREATE INDEX issues_loaded_at_idx ON public.issues (loaded_at);
+CREATE INDEX issues_updated_at_brin ON public.issues USING brin (updated_at);
+CREATE INDEX issues_repo_updated_at_idx ON public.issues (repo, updated_at);
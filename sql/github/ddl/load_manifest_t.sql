@@ -0,0 +1,12 @@
+DROP TABLE IF EXISTS public.load_manifest;
+
+CREATE TABLE public.load_manifest (
+  path varchar,
+  target varchar,
+  size bigint,
+  mtime_ns bigint,
+  content_hash varchar,
+  loaded_at timestamp,
+  rowcount bigint,
+  PRIMARY KEY(path, target)
+);
@@ -0,0 +1,17 @@
+INSERT INTO public.commits (
+    sha,
+    node_id,
+    author_id,
+    created_at,
+    repo,
+    committer_id
+)
+SELECT
+    sha,
+    node_id,
+    author_id,
+    created_at,
+    repo,
+    committer_id
+FROM staging_commits
+ON CONFLICT DO NOTHING
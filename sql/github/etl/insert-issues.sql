@@ -0,0 +1,35 @@
+INSERT INTO public.issues (
+  url,
+  repository_url,
+  id,
+  node_id,
+  number,
+  title,
+  labels,
+  state,
+  locked,
+  comments,
+  created_at,
+  updated_at,
+  closed_at,
+  author_association,
+  repo
+)
+SELECT
+  url,
+  repository_url,
+  id,
+  node_id,
+  number,
+  title,
+  labels,
+  state,
+  locked,
+  comments,
+  created_at,
+  updated_at,
+  closed_at,
+  author_association,
+  repo
+FROM staging_issues
+ON CONFLICT DO NOTHING
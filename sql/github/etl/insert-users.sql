@@ -0,0 +1,21 @@
+INSERT INTO public.users (
+    login,
+    id,
+    node_id,
+    avatar_url,
+    url,
+    type,
+    user_view_type,
+    site_admin
+)
+SELECT
+    login,
+    id,
+    node_id,
+    avatar_url,
+    url,
+    type,
+    user_view_type,
+    site_admin
+FROM staging_users
+ON CONFLICT DO NOTHING
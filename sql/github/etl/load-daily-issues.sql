@@ -9,22 +9,39 @@ INSERT INTO public.daily_issues (
   repo
 )
 WITH
-    latest_revision AS (
-        SELECT id,
-                MAX(updated_at) AS updated_at
+    revisions AS (
+        -- Every revision is the latest one from its updated_at until the
+        -- next revision of the same issue
+        SELECT
+          id,
+          number,
+          state,
+          created_at,
+          updated_at,
+          closed_at,
+          repo,
+          LEAD(updated_at) OVER (PARTITION BY id ORDER BY updated_at) AS valid_until
         FROM public.issues
-        WHERE updated_at <= {current_date}
-        GROUP BY id
+        WHERE updated_at <= %(end_date)s::date
+),
+    dates AS (
+        SELECT generate_series(
+          %(start_date)s::date,
+          %(end_date)s::date,
+          INTERVAL '1 day'
+        )::date AS date
 )
 SELECT
-  id,
-  number,
-  state,
-  created_at,
-  updated_at,
-  closed_at,
-  DATE {current_date},
-  repo
-FROM public.issues
-JOIN latest_revision USING (id, updated_at)
+  r.id,
+  r.number,
+  r.state,
+  r.created_at,
+  r.updated_at,
+  r.closed_at,
+  d.date,
+  r.repo
+FROM dates d
+JOIN revisions r
+  ON r.updated_at <= d.date
+ AND (r.valid_until IS NULL OR r.valid_until > d.date)
 ON CONFLICT DO NOTHING
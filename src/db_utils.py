@@ -1,17 +1,136 @@
+import atexit
+import os
 from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator
+
+import pandas as pd
 import psycopg
+from psycopg.sql import SQL, Identifier
+from psycopg_pool import ConnectionPool
+
+DEFAULT_POOL_MIN_SIZE = 1
+DEFAULT_POOL_MAX_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 4))
+# Seconds a checkout waits for a free connection before PoolTimeout
+DEFAULT_POOL_TIMEOUT = float(os.environ.get("DATABASE_POOL_TIMEOUT", 30))
+DEFAULT_POOL_MAX_IDLE = 300.0
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = Lock()
+
+
+def _reset(conn: psycopg.Connection):
+    # Session state such as the loaders' temp staging tables must not leak
+    # into the next checkout. Prepared statements stay: psycopg keeps its own
+    # list of them across commits, so DISCARD ALL (which deallocates them)
+    # would break queries it has auto-prepared on the next checkout.
+    conn.autocommit = True
+    conn.execute("RESET ALL")
+    conn.execute("DISCARD TEMP")
+    conn.autocommit = False
+
+
+# One pool per connection string for the whole process, opened on first
+# use. Connections are health checked on checkout and reset on return.
+def get_pool(connection_string: str) -> ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(connection_string)
+        if pool is None:
+            pool = ConnectionPool(
+                connection_string,
+                min_size=DEFAULT_POOL_MIN_SIZE,
+                max_size=DEFAULT_POOL_MAX_SIZE,
+                timeout=DEFAULT_POOL_TIMEOUT,
+                max_idle=DEFAULT_POOL_MAX_IDLE,
+                check=ConnectionPool.check_connection,
+                reset=_reset,
+                name=f"pool-{len(_pools)}",
+                open=True,
+            )
+            _pools[connection_string] = pool
+        return pool
+
+
+def resize(connection_string: str, max_size: int):
+    # Parallel loaders grow the pool to their worker count, it never shrinks
+    # below the default
+    pool = get_pool(connection_string)
+    if max_size > pool.max_size:
+        pool.resize(pool.min_size, max_size)
+
+
+def pool_stats(connection_string: str) -> Dict[str, int]:
+    # Cumulative counters of psycopg_pool, e.g. requests_num, requests_wait_ms,
+    # connections_ms, plus the current pool_size and pool_available
+    return get_pool(connection_string).get_stats()
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_pools)
+
+
+@contextmanager
+def connection(connection_string: str) -> Iterator[psycopg.Connection]:
+    # Like psycopg.connect as a context manager: commits on success and
+    # rolls back on error, but the connection goes back to the pool
+    with get_pool(connection_string).connection() as conn:
+        yield conn
 
 
 @contextmanager
-def cursor(connection_string: str, commit: bool = False):
-    conn = psycopg.connect(connection_string, autocommit=False)
-
-    try:
-        cur = conn.cursor()
-        yield cur
-    except psycopg.Error as e:
-        print(e)
-    finally:
+def cursor(connection_string: str, commit: bool = False) -> Iterator[psycopg.Cursor]:
+    with connection(connection_string) as conn:
+        try:
+            with conn.cursor() as cur:
+                yield cur
+        except Exception:
+            conn.rollback()
+            raise
         if commit:
             conn.commit()
-        conn.close()
+        else:
+            conn.rollback()
+
+
+def _column_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "bigint"
+    if pd.api.types.is_float_dtype(dtype):
+        return "double precision"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "timestamp"
+    return "text"
+
+
+def copy_frame(cur: psycopg.Cursor, df: pd.DataFrame, table: str, replace: bool = True):
+    # Recreates the table from the frame's dtypes and COPYs the rows, the
+    # replacement for DataFrame.to_sql(if_exists="replace")
+    columns = [
+        SQL("{} {}").format(Identifier(str(column)), SQL(_column_type(dtype)))
+        for column, dtype in df.dtypes.items()
+    ]
+    if replace:
+        cur.execute(SQL("DROP TABLE IF EXISTS {}").format(Identifier(table)))
+    cur.execute(
+        SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(
+            Identifier(table), SQL(", ").join(columns)
+        )
+    )
+
+    values = df.astype(object).where(df.notna(), None)
+    with cur.copy(
+        SQL("COPY {} ({}) FROM STDIN").format(
+            Identifier(table),
+            SQL(", ").join(Identifier(str(column)) for column in df.columns),
+        )
+    ) as copy:
+        for row in values.itertuples(index=False, name=None):
+            copy.write_row(row)
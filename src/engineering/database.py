@@ -1,49 +1,486 @@
 from argparse import ArgumentParser
 from dotenv import load_dotenv
 from pathlib import Path
-from src.db_utils import cursor
+from src.db_utils import connection, cursor, pool_stats, resize
+from src.telemetry import phase, record, write_metrics
 from src.utils import Directory
+from src import storage
+from src.engineering.github.extract import copy_typed, parse_lines
+from src.engineering.manifest import FileState, LoadManifest, plan_batches
+from src.engineering.partitions import (
+    PARTITIONED_TABLES,
+    apply_retention,
+    ensure_partitions,
+)
 import sys
 import os
-from psycopg.sql import SQL
+import random
+import uuid
+import psycopg
+from psycopg.sql import SQL, Identifier
 import time
 from loguru import logger
-from datetime import datetime, timedelta
-from typing import List
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Event, Thread
+from typing import Dict, Iterator, List, Optional, Tuple
 
 load_dotenv()
 
 CONNECTION_STRING = os.environ["DATABASE_CONNECTION_STRING"]
 
+DEFAULT_CHUNK_MB = 8
+DEFAULT_PREFETCH_CHUNKS = 4
+DEFAULT_DEADLOCK_RETRIES = 5
+_END_OF_FILES = object()
+
+# Insert scripts of the typed staging tables, per source
+TYPED_LOAD_SCRIPTS = {
+    "commits": [
+        Path("sql/github/etl/insert-commits.sql"),
+        Path("sql/github/etl/insert-users.sql"),
+    ],
+    "issues": [Path("sql/github/etl/insert-issues.sql")],
+}
+
 
 def read_file_to_sql(filepath: Path) -> SQL:
     with open(filepath, "r") as f:
         return SQL(f.read())  # type: ignore
 
 
-def load(directory: Directory, load_script: List[SQL], commit: bool):
-    start = time.time()
-    with cursor(CONNECTION_STRING, commit) as cur:
-        staging_rowcount = 0
-        cur.execute("CREATE TEMP TABLE staging (data JSONB) ON COMMIT DROP")
-        for file in directory.collect("json"):
-            with open(file, "r") as copy_file:
-                data = copy_file.read()
-            with cur.copy(
-                "COPY staging(data) FROM STDIN WITH CSV QUOTE e'\x01' DELIMITER '\x02'"
-            ) as copy:
-                copy.write(data)
-            staging_rowcount += cur.rowcount
-
-        cur.execute("SELECT COUNT(*) FROM staging")
-        for load_script in load_scripts:
+def prefetch_chunks(
+    files: List[Path],
+    chunk_size: int,
+    depth: int,
+    rowcounts: Optional[Dict[Path, int]] = None,
+) -> Iterator[bytes]:
+    # Files are read (and decompressed) on a background thread while earlier
+    # chunks are sent, and at most depth chunks wait in between, so memory
+    # stays flat regardless of partition size. Chunks hold whole lines, so
+    # their newlines count the rows of every file.
+    chunks: Queue = Queue(maxsize=depth)
+    stop = Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for file in files:
+                # Read time excludes waiting for the consumer to take a chunk
+                read_seconds, read_bytes = 0.0, 0
+                chunks_of_file = storage.iter_chunks(file, chunk_size)
+                while True:
+                    started = time.perf_counter()
+                    chunk = next(chunks_of_file, None)
+                    read_seconds += time.perf_counter() - started
+                    if chunk is None:
+                        break
+                    read_bytes += len(chunk)
+                    if rowcounts is not None:
+                        rowcounts[file] = rowcounts.get(file, 0) + chunk.count(b"\n")
+                    if not put(chunk):
+                        return
+                record("read", read_seconds, nbytes=read_bytes)
+            put(_END_OF_FILES)
+        except BaseException as e:
+            put(e)
+
+    thread = Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _END_OF_FILES:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def shard_files(files: List[Path], workers: int) -> List[List[Path]]:
+    # Largest files first onto the lightest shard keeps shards even in bytes
+    shards: List[List[Path]] = [[] for _ in range(workers)]
+    sizes = [0] * workers
+    for file in sorted(files, key=os.path.getsize, reverse=True):
+        lightest = sizes.index(min(sizes))
+        shards[lightest].append(file)
+        sizes[lightest] += os.path.getsize(file)
+    return [shard for shard in shards if shard]
+
+
+def stage_files(
+    cur: psycopg.Cursor,
+    files: List[Path],
+    chunk_size: int,
+    prefetch: int,
+    table: str = "staging",
+    rowcounts: Optional[Dict[Path, int]] = None,
+) -> Tuple[int, int]:
+    # Every file goes through one COPY, a chunk of whole lines at a time
+    with phase("copy") as copied:
+        with cur.copy(
+            SQL(
+                "COPY {}(data) FROM STDIN WITH CSV QUOTE e'\x01' DELIMITER '\x02'"
+            ).format(Identifier(table))
+        ) as copy:
+            for chunk in prefetch_chunks(files, chunk_size, prefetch, rowcounts):
+                copy.write(chunk)
+                copied.bytes += len(chunk)
+        copied.rows = cur.rowcount
+    return copied.rows, copied.bytes
+
+
+def stage_typed(
+    cur: psycopg.Cursor,
+    source: str,
+    files: List[Path],
+    chunk_size: int,
+    prefetch: int,
+    rowcounts: Optional[Dict[Path, int]] = None,
+) -> int:
+    records = parse_lines(prefetch_chunks(files, chunk_size, prefetch, rowcounts))
+    with phase("copy", typed=source) as copied:
+        counts = copy_typed(cur, source, records)
+        copied.rows = sum(counts.values())
+    logger.info(f"Staged {counts}")
+    return sum(counts.values())
+
+
+def finish(conn: psycopg.Connection, commit: bool):
+    with phase("commit" if commit else "rollback"):
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+
+
+def read_scripts(filepaths: List[Path]) -> Dict[str, SQL]:
+    return {Path(path).stem: read_file_to_sql(Path(path)) for path in filepaths}
+
+
+def run_scripts(cur: psycopg.Cursor, load_scripts: Dict[str, SQL]) -> int:
+    rowcount = 0
+    for name, load_script in load_scripts.items():
+        with phase("script", script=name) as script:
             cur.execute(load_script)
+            script.rows = cur.rowcount
+        logger.info(f"{name}: {cur.rowcount} rows")
+        rowcount += cur.rowcount
+    return rowcount
+
+
+def load(
+    directory: Directory,
+    load_scripts: Dict[str, SQL],
+    commit: bool,
+    chunk_size: int = DEFAULT_CHUNK_MB * 1024 * 1024,
+    prefetch: int = DEFAULT_PREFETCH_CHUNKS,
+    workers: int = 1,
+    merge: bool = False,
+    typed: Optional[str] = None,
+    target: Optional[str] = None,
+    since: Optional[date] = None,
+    force: bool = False,
+    batch_partitions: Optional[int] = None,
+    batch_rows: Optional[int] = None,
+):
+    all_files = directory.collect(storage.RAW_FILENAMES)
+    if typed is not None and not load_scripts:
+        load_scripts = read_scripts(TYPED_LOAD_SCRIPTS[typed])
+
+    # Only files that are new or changed since they were last loaded into
+    # the target are staged, unless force or since ask for a reload
+    manifest = LoadManifest(target or typed or "default")
+    with connection(CONNECTION_STRING) as conn:
+        manifest.read(conn.cursor())
+        pending = manifest.changed(all_files, since=since, force=force)
+        # Files that were only touched are not loaded again, their new mtimes
+        # are saved right away so the next run does not hash them again
+        if commit and manifest.refreshed:
+            manifest.refresh(conn.cursor())
+    logger.info(f"{len(pending)} of {len(all_files)} files are new or changed")
+    if not pending:
+        return
+
+    # Partitions are DDL, so they are created up front in their own
+    # transaction rather than by shards racing for the same months
+    if commit:
+        with connection(CONNECTION_STRING) as conn:
+            ensure_partitions(conn.cursor())
 
+    # Every batch commits on its own together with its manifest entries, so
+    # a failed backfill reruns from the first batch that did not commit
+    batches = (
+        plan_batches(pending, batch_partitions, batch_rows)
+        if batch_partitions or batch_rows
+        else [pending]
+    )
+    for i, batch in enumerate(batches):
+        if batch is not pending:
+            logger.info(f"Batch {i}: {len(batch)} files")
+        if workers > 1:
+            load_parallel(
+                batch,
+                load_scripts,
+                commit,
+                chunk_size,
+                prefetch,
+                workers,
+                merge,
+                typed,
+                manifest,
+            )
+        else:
+            load_single(
+                batch, load_scripts, commit, chunk_size, prefetch, typed, manifest
+            )
+        if commit and batch is not pending:
+            with connection(CONNECTION_STRING) as conn:
+                ensure_partitions(conn.cursor())
+
+    if commit:
+        with connection(CONNECTION_STRING) as conn:
+            # Backfilled months landed in the default partitions
+            ensure_partitions(conn.cursor())
+
+
+def log_pool_stats():
+    stats = pool_stats(CONNECTION_STRING)
+    logger.info(
+        f"Pool: {stats.get('requests_num', 0)} checkouts, "
+        f"{stats.get('requests_wait_ms', 0)} ms waited, "
+        f"{stats.get('connections_num', 0)} connections opened"
+    )
+
+
+def load_single(
+    pending: List[FileState],
+    load_scripts: Dict[str, SQL],
+    commit: bool,
+    chunk_size: int,
+    prefetch: int,
+    typed: Optional[str],
+    manifest: LoadManifest,
+):
+    start = time.time()
+    files = [state.path for state in pending]
+    rowcounts: Dict[Path, int] = {}
+    with connection(CONNECTION_STRING) as conn:
+        with conn.cursor() as cur:
+            if typed is not None:
+                staging_rowcount = stage_typed(
+                    cur, typed, files, chunk_size, prefetch, rowcounts
+                )
+                staged_bytes = sum(state.size for state in pending)
+            else:
+                cur.execute("CREATE TEMP TABLE staging (data JSONB) ON COMMIT DROP")
+                staging_rowcount, staged_bytes = stage_files(
+                    cur, files, chunk_size, prefetch, rowcounts=rowcounts
+                )
+            staged = time.time()
+            rowcount = run_scripts(cur, load_scripts)
+            manifest.record(cur, pending, rowcounts)
+        finish(conn, commit)
         end = time.time()
-        rowcount = cur.rowcount
 
-    logger.info(f"Staged {staging_rowcount} rows from {len(directory.files)} files")
-    logger.info(f"Inserted {rowcount} rows in {end - start:.2f} seconds")
+    logger.info(
+        f"Staged {staging_rowcount} rows ({staged_bytes / 1024 / 1024:.2f} MB) "
+        f"from {len(files)} files in {staged - start:.2f} seconds"
+    )
+    logger.info(f"Inserted {rowcount} rows in {end - staged:.2f} seconds")
+    log_pool_stats()
+
+
+def load_shard(
+    shard: int,
+    states: List[FileState],
+    load_scripts: Dict[str, SQL],
+    commit: bool,
+    chunk_size: int,
+    prefetch: int,
+    typed: Optional[str],
+    manifest: LoadManifest,
+) -> Tuple[int, int]:
+    files = [state.path for state in states]
+    rowcounts: Dict[Path, int] = {}
+    with connection(CONNECTION_STRING) as conn:
+        with conn.cursor() as cur:
+            # Session temp tables are private to the connection and never
+            # WAL-logged, so every shard stages into its own "staging"
+            if typed is not None:
+                staging_rowcount = stage_typed(
+                    cur, typed, files, chunk_size, prefetch, rowcounts
+                )
+            else:
+                cur.execute("CREATE TEMP TABLE staging (data JSONB)")
+                staging_rowcount, _ = stage_files(
+                    cur, files, chunk_size, prefetch, rowcounts=rowcounts
+                )
+        conn.commit()
+
+        # Shards inserting the same users can deadlock on ON CONFLICT, the
+        # staged rows survive the rollback so only the scripts are retried
+        attempt = 0
+        while True:
+            try:
+                with conn.cursor() as cur:
+                    rowcount = run_scripts(cur, load_scripts)
+                    manifest.record(cur, states, rowcounts)
+                finish(conn, commit)
+                break
+            except psycopg.errors.DeadlockDetected:
+                conn.rollback()
+                if attempt >= DEFAULT_DEADLOCK_RETRIES:
+                    raise
+                delay = random.uniform(0, 0.5 * 2**attempt)
+                logger.warning(f"Shard {shard} deadlocked, retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    logger.info(
+        f"Shard {shard}: staged {staging_rowcount} rows from {len(files)} files, "
+        f"inserted {rowcount} rows"
+    )
+    return staging_rowcount, rowcount
+
+
+def staging_tables(shards: int) -> List[str]:
+    # Unique per run, so concurrent merge loads don't drop each other's tables
+    run_id = uuid.uuid4().hex[:8]
+    return [f"staging_{run_id}_{i}" for i in range(shards)]
+
+
+def stage_shard(
+    table: str,
+    files: List[Path],
+    chunk_size: int,
+    prefetch: int,
+    rowcounts: Dict[Path, int],
+) -> int:
+    with connection(CONNECTION_STRING) as conn:
+        with conn.cursor() as cur:
+            rows, _ = stage_files(
+                cur, files, chunk_size, prefetch, table=table, rowcounts=rowcounts
+            )
+    return rows
+
+
+def merge_shards(
+    tables: List[str],
+    load_scripts: Dict[str, SQL],
+    commit: bool,
+    manifest: LoadManifest,
+    pending: List[FileState],
+    rowcounts: Dict[Path, int],
+) -> int:
+    with connection(CONNECTION_STRING) as conn:
+        with conn.cursor() as cur:
+            # The scripts read "staging", which becomes a view over the shards
+            cur.execute(
+                SQL("CREATE TEMP VIEW staging AS {}").format(
+                    SQL(" UNION ALL ").join(
+                        SQL("SELECT data FROM {}").format(Identifier(table))
+                        for table in tables
+                    )
+                )
+            )
+            rowcount = run_scripts(cur, load_scripts)
+            manifest.record(cur, pending, rowcounts)
+            cur.execute("DROP VIEW staging")
+        finish(conn, commit)
+    return rowcount
+
+
+# Shards the files across workers connections. By default every shard runs
+# the load scripts in its own transaction; with merge the shards are only
+# staged in parallel into unlogged tables and one transaction runs the
+# scripts over all of them, which keeps the load atomic.
+def load_parallel(
+    pending: List[FileState],
+    load_scripts: Dict[str, SQL],
+    commit: bool,
+    chunk_size: int,
+    prefetch: int,
+    workers: int,
+    merge: bool,
+    typed: Optional[str],
+    manifest: LoadManifest,
+):
+    if merge and typed is not None:
+        raise ValueError("--merge only stages JSONB, it cannot be used with --typed")
+
+    start = time.time()
+    states = {state.path: state for state in pending}
+    shards = shard_files(list(states), workers)
+    # Every shard holds a pooled connection for its whole load
+    resize(CONNECTION_STRING, len(shards))
+
+    if not merge:
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [
+                executor.submit(
+                    load_shard,
+                    i,
+                    [states[file] for file in shard],
+                    load_scripts,
+                    commit,
+                    chunk_size,
+                    prefetch,
+                    typed,
+                    manifest,
+                )
+                for i, shard in enumerate(shards)
+            ]
+            results = [future.result() for future in futures]
+        staging_rowcount = sum(staged for staged, _ in results)
+        rowcount = sum(inserted for _, inserted in results)
+    else:
+        tables = staging_tables(len(shards))
+        with connection(CONNECTION_STRING) as conn:
+            for table in tables:
+                conn.execute(
+                    SQL("CREATE UNLOGGED TABLE {} (data JSONB)").format(
+                        Identifier(table)
+                    )
+                )
+        rowcounts: Dict[Path, int] = {}
+        try:
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                futures = [
+                    executor.submit(
+                        stage_shard, table, shard, chunk_size, prefetch, rowcounts
+                    )
+                    for table, shard in zip(tables, shards)
+                ]
+                staging_rowcount = sum(future.result() for future in futures)
+            rowcount = merge_shards(
+                tables, load_scripts, commit, manifest, pending, rowcounts
+            )
+        finally:
+            with connection(CONNECTION_STRING) as conn:
+                for table in tables:
+                    conn.execute(
+                        SQL("DROP TABLE IF EXISTS {}").format(Identifier(table))
+                    )
+
+    end = time.time()
+    logger.info(
+        f"Staged {staging_rowcount} rows from {len(pending)} files in "
+        f"{len(shards)} shards, inserted {rowcount} rows in {end - start:.2f} seconds"
+    )
+    log_pool_stats()
 
 
 def init_db(commit: bool):
@@ -53,19 +490,82 @@ def init_db(commit: bool):
         cur.execute(read_file_to_sql(Path("sql/github/ddl/users_t.sql")))
         cur.execute(read_file_to_sql(Path("sql/github/ddl/issues_t.sql")))
         cur.execute(read_file_to_sql(Path("sql/github/ddl/daily_issues_t.sql")))
+        cur.execute(read_file_to_sql(Path("sql/github/ddl/load_manifest_t.sql")))
+        cur.execute(read_file_to_sql(Path("sql/github/ddl/daily_issues_state_t.sql")))
+        ensure_partitions(cur)
+
+
+def retention(table: str, keep_months: int, drop: bool, commit: bool):
+    with cursor(CONNECTION_STRING, commit) as cur:
+        partitions = apply_retention(cur, table, keep_months, drop)
+    logger.info(f"{len(partitions)} partitions of {table} past {keep_months} months")
+
+
+def build_daily_issues(cur: psycopg.Cursor, start_date: date, end_date: date) -> int:
+    # Every requested date is rebuilt in one statement, replacing what was
+    # there, so a late revision also corrects the snapshots after it
+    cur.execute(
+        "DELETE FROM public.daily_issues WHERE date BETWEEN %s AND %s",
+        (start_date, end_date),
+    )
+    cur.execute(
+        read_file_to_sql(Path("sql/github/etl/load-daily-issues.sql")),
+        {"start_date": start_date, "end_date": end_date},
+    )
+    return cur.rowcount
 
 
-def daily_issues(num_days: int):
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=num_days)
+def daily_issues(
+    num_days: int,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    incremental: bool = False,
+):
+    end_date = until or datetime.now().date()
+    start_date = since or end_date - timedelta(days=num_days)
 
     with cursor(CONNECTION_STRING, commit=True) as cur:
-        sql = read_file_to_sql(Path("sql/github/etl/load-daily-issues.sql"))
-        while start_date <= end_date:
-            logger.info(f"Creating daily issues for date {start_date}")
-            cur.execute(sql.format(current_date=str(start_date)))
-            logger.info(f"Inserted {cur.rowcount} rows for date {start_date}")
-            start_date = start_date + timedelta(days=1)
+        if incremental:
+            cur.execute(
+                "SELECT loaded_through FROM public.daily_issues_state "
+                "WHERE snapshot = 'daily_issues'"
+            )
+            state = cur.fetchone()
+            loaded_through = state[0] if state else None
+
+            # A revision changes the snapshot of every date from its
+            # updated_at on, so the earliest new revision bounds the rebuild
+            cur.execute(
+                "SELECT MIN(updated_at), MAX(loaded_at) FROM public.issues "
+                "WHERE %(loaded_through)s::timestamp IS NULL "
+                "OR loaded_at > %(loaded_through)s::timestamp",
+                {"loaded_through": loaded_through},
+            )
+            first_update, newest_load = cur.fetchone()  # type: ignore
+            if first_update is None:
+                logger.info("No issue revisions loaded since the last snapshot")
+                return
+            start_date = first_update.date()
+
+        start = time.time()
+        ensure_partitions(cur, ["daily_issues"])
+        with phase("daily_issues") as built:
+            rowcount = build_daily_issues(cur, start_date, end_date)
+            built.rows = rowcount
+        ensure_partitions(cur, ["daily_issues"])
+        logger.info(
+            f"Inserted {rowcount} rows for dates {start_date} - {end_date} "
+            f"in {time.time() - start:.2f} seconds"
+        )
+
+        if incremental:
+            cur.execute(
+                "INSERT INTO public.daily_issues_state (snapshot, loaded_through) "
+                "VALUES ('daily_issues', %s) "
+                "ON CONFLICT (snapshot) DO UPDATE "
+                "SET loaded_through = EXCLUDED.loaded_through",
+                (newest_load,),
+            )
 
 
 if __name__ == "__main__":
@@ -81,11 +581,94 @@ if __name__ == "__main__":
         "--load_script", "-S", nargs="+", type=str
     )
     load_parser.add_argument("--commit", "-c", default=False, action="store_true")
+    load_parser.add_argument(
+        "--chunk-mb",
+        type=int,
+        default=DEFAULT_CHUNK_MB,
+        help="Size of the blocks streamed into COPY",
+    )
+    load_parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=DEFAULT_PREFETCH_CHUNKS,
+        help="Chunks read ahead while the previous ones are sent",
+    )
+    load_parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="Connections the files are sharded across",
+    )
+    load_parser.add_argument(
+        "--merge",
+        default=False,
+        action="store_true",
+        help="Stage shards in parallel but run the load scripts once, atomically",
+    )
+    load_parser.add_argument(
+        "--typed",
+        choices=list(TYPED_LOAD_SCRIPTS),
+        help="Parse rows in Python and binary COPY typed columns (default scripts: "
+        "sql/github/etl/insert-*.sql)",
+    )
+    load_parser.add_argument(
+        "--target",
+        help="Name the load manifest tracks loaded files under "
+        "(default: the typed source or the load script names)",
+    )
+    load_parser.add_argument(
+        "--since",
+        type=lambda x: datetime.strptime(x, "%Y-%m-%d").date(),
+        help="Reload partitions from this date on even if they are unchanged",
+    )
+    load_parser.add_argument(
+        "--force",
+        default=False,
+        action="store_true",
+        help="Reload every file regardless of the load manifest",
+    )
+    load_parser.add_argument(
+        "--metrics-dir",
+        help="Write phase timings to load.json and load.prom in this directory",
+    )
+    load_parser.add_argument(
+        "--batch-partitions",
+        type=int,
+        help="Commit after every this many date partitions, a rerun resumes "
+        "after the last committed batch",
+    )
+    load_parser.add_argument(
+        "--batch-rows",
+        type=int,
+        help="Commit once a batch would exceed this many rows (whole partitions)",
+    )
 
     init_parser = subparsers.add_parser("init")
     init_parser.set_defaults(func=init_db)
     init_parser.add_argument("--commit", "-c", default=False, action="store_true")
 
+    retention_parser = subparsers.add_parser("retention")
+    retention_parser.set_defaults(func=retention)
+    retention_parser.add_argument(
+        "--table", choices=list(PARTITIONED_TABLES), required=True
+    )
+    retention_parser.add_argument(
+        "--keep-months",
+        type=int,
+        required=True,
+        help="Detach monthly partitions older than this many months",
+    )
+    retention_parser.add_argument(
+        "--drop",
+        default=False,
+        action="store_true",
+        help="Drop the detached partitions instead of keeping them as tables",
+    )
+    retention_parser.add_argument(
+        "--commit", "-c", default=False, action="store_true"
+    )
+
     if len(sys.argv) == 1:
         parser.print_help()
         sys.exit()
@@ -94,15 +677,55 @@ if __name__ == "__main__":
 
     daily_measures_parser = subparsers.add_parser("daily")
     daily_measures_parser.add_argument("--num_days", type=int, default=3)
+    daily_measures_parser.add_argument(
+        "--since",
+        type=lambda x: datetime.strptime(x, "%Y-%m-%d").date(),
+        help="First snapshot date to rebuild (takes precedence to --num_days)",
+    )
+    daily_measures_parser.add_argument(
+        "--until",
+        type=lambda x: datetime.strptime(x, "%Y-%m-%d").date(),
+        help="Last snapshot date to rebuild (default: today)",
+    )
+    daily_measures_parser.add_argument(
+        "--incremental",
+        default=False,
+        action="store_true",
+        help="Rebuild only the dates changed by issues loaded since the last run",
+    )
+    daily_measures_parser.add_argument(
+        "--metrics-dir",
+        help="Write phase timings to daily.json and daily.prom in this directory",
+    )
     daily_measures_parser.set_defaults(func=daily_issues)
 
     args = parser.parse_args()
 
     func_name = args.func.__name__
     if func_name == "load":
-        load_scripts = list(map(read_file_to_sql, args.load_script))
-        args.func(args.directory, load_scripts, args.commit)
+        load_scripts = read_scripts(args.load_script or [])
+        args.func(
+            args.directory,
+            load_scripts,
+            args.commit,
+            chunk_size=args.chunk_mb * 1024 * 1024,
+            prefetch=args.prefetch,
+            workers=args.workers,
+            merge=args.merge,
+            typed=args.typed,
+            target=args.target
+            or args.typed
+            or "+".join(Path(script).stem for script in args.load_script or []),
+            since=args.since,
+            force=args.force,
+            batch_partitions=args.batch_partitions,
+            batch_rows=args.batch_rows,
+        )
+        write_metrics(args.metrics_dir, "load")
     elif func_name == "init_db":
         args.func(args.commit)
+    elif func_name == "retention":
+        args.func(args.table, args.keep_months, args.drop, args.commit)
     elif func_name == "daily_issues":
-        args.func(args.num_days)
+        args.func(args.num_days, args.since, args.until, args.incremental)
+        write_metrics(args.metrics_dir, "daily")
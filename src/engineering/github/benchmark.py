@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+from src.engineering.github import collector
+from src.engineering.github.client import DEFAULT_MAX_CONCURRENCY, GithubClient
+from src.engineering.github.collector import Repository, collect_and_paginate
+from src.engineering.github.standin import (
+    SYNTHETIC_SINCE,
+    SYNTHETIC_UNTIL,
+    StandinConfig,
+    serve_in_thread,
+)
+from src.engineering.github.watermarks import parse_timestamp
+from src.storage import RAW_FORMATS
+from src.telemetry import percentile
+
+DEFAULT_REPO_COUNTS = [10, 100, 1000]
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    repos: int
+    seconds: float
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def pages(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, q: float) -> float:
+        return percentile(self.latencies, q)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<20} {self.repos:>5} repos {self.pages:>7} pages "
+            f"{self.seconds:8.2f}s {self.pages / max(self.seconds, 1e-9):9.1f} pages/s "
+            f"p50 {self.percentile(0.5) * 1000:7.1f}ms "
+            f"p99 {self.percentile(0.99) * 1000:7.1f}ms"
+        )
+
+
+@contextmanager
+def timed_requests() -> Iterator[List[float]]:
+    # Every page goes through collector.get_api_data, so timing it measures
+    # what the collector waits for, including queueing and retries
+    latencies: List[float] = []
+    get_api_data = collector.get_api_data
+
+    async def timed_get_api_data(client, url, params=None):
+        started = time.perf_counter()
+        try:
+            return await get_api_data(client, url, params)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    collector.get_api_data = timed_get_api_data
+    try:
+        yield latencies
+    finally:
+        collector.get_api_data = get_api_data
+
+
+@contextmanager
+def api_baseurl(url: str) -> Iterator[None]:
+    baseurl = collector.API_BASEURL
+    collector.API_BASEURL = url
+    try:
+        yield
+    finally:
+        collector.API_BASEURL = baseurl
+
+
+def make_repositories(count: int) -> List[Repository]:
+    return [Repository(f"owner{i % 10}", f"repo{i}") for i in range(count)]
+
+
+def bench_paginate(
+    repo_count: int, max_concurrency: int, fan_out: bool
+) -> BenchmarkResult:
+    params = {
+        "since": parse_timestamp(SYNTHETIC_SINCE),
+        "until": parse_timestamp(SYNTHETIC_UNTIL),
+        "per_page": 100,
+    }
+
+    async def drain(client: GithubClient, repo: Repository):
+        url = collector.construct_api_url("repos", repo.owner, repo.name, "commits")
+        async for _ in collect_and_paginate(client, repo, url, params, fan_out):
+            pass
+
+    async def run():
+        async with GithubClient(tokens=[None], max_concurrency=max_concurrency) as c:
+            await asyncio.gather(*[drain(c, r) for r in make_repositories(repo_count)])
+
+    with timed_requests() as latencies:
+        started = time.perf_counter()
+        asyncio.run(run())
+        seconds = time.perf_counter() - started
+    return BenchmarkResult("collect_and_paginate", repo_count, seconds, latencies)
+
+
+def bench_main(
+    repo_count: int, max_concurrency: int, fan_out: bool, raw_format: str
+) -> BenchmarkResult:
+    repos = [f"{r.owner}/{r.name}" for r in make_repositories(repo_count)]
+    cwd = os.getcwd()
+    # main writes to the relative data/ and .cache/ paths
+    with tempfile.TemporaryDirectory() as tmp_dir, timed_requests() as latencies:
+        os.chdir(tmp_dir)
+        try:
+            started = time.perf_counter()
+            collector.main(
+                source="commits",
+                repos=repos,
+                since=parse_timestamp(SYNTHETIC_SINCE),
+                until=parse_timestamp(SYNTHETIC_UNTIL),
+                max_concurrency=max_concurrency,
+                cache_path=None,
+                fan_out=fan_out,
+                raw_format=raw_format,
+            )
+            seconds = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+    return BenchmarkResult("main", repo_count, seconds, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Collector throughput against the local GitHub stand-in"
+    )
+    parser.add_argument("--repos", type=int, nargs="+", default=DEFAULT_REPO_COUNTS)
+    parser.add_argument("--rows-per-repo", type=int, default=250)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per response"
+    )
+    parser.add_argument("--latency-jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limited-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--fan-out", default=False, action="store_true")
+    parser.add_argument("--format", "-f", choices=list(RAW_FORMATS), default="json")
+    parser.add_argument(
+        "--only", choices=["collect_and_paginate", "main"], help="Run one benchmark"
+    )
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        rows_per_repo=args.rows_per_repo,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        rate_limited_rate=args.rate_limited_rate,
+        rate_limit=10_000_000,
+    )
+
+    results = []
+    with serve_in_thread(config) as server, api_baseurl(server.url):
+        for repo_count in args.repos:
+            if args.only in (None, "collect_and_paginate"):
+                results.append(
+                    bench_paginate(repo_count, args.max_concurrency, args.fan_out)
+                )
+            if args.only in (None, "main"):
+                results.append(
+                    bench_main(
+                        repo_count, args.max_concurrency, args.fan_out, args.format
+                    )
+                )
+        print(f"Stand-in: {server.stats}")
+
+    for result in results:
+        print(result)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    link: Optional[str]
+    content: bytes
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits} hits, {self.misses} misses ({self.hit_ratio:.1%} hit ratio), "
+            f"{self.stores} stores, {self.evictions} evictions"
+        )
+
+
+# Persistent ETag/Last-Modified cache of GitHub pages. A revalidated page
+# comes back as a 304, which GitHub does not count against the rate limit.
+class ResponseCache:
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                link TEXT,
+                content BLOB,
+                size INTEGER,
+                accessed_at REAL
+            )
+            """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses(accessed_at)"
+        )
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(url: str, params: Optional[dict] = None) -> str:
+        payload = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(self, url: str, params: Optional[dict] = None) -> Optional[CacheEntry]:
+        key = self.make_key(url, params)
+        row = self.conn.execute(
+            "SELECT url, etag, last_modified, link, content FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        url, etag, last_modified, link, content = row
+        return CacheEntry(
+            key=key,
+            url=url,
+            etag=etag,
+            last_modified=last_modified,
+            link=link,
+            content=zlib.decompress(content),
+        )
+
+    def hit(self, entry: CacheEntry):
+        self.stats.hits += 1
+        self.conn.execute(
+            "UPDATE responses SET accessed_at = ? WHERE key = ?",
+            (time.time(), entry.key),
+        )
+
+    def miss(self):
+        self.stats.misses += 1
+
+    def store(
+        self,
+        url: str,
+        params: Optional[dict],
+        etag: Optional[str],
+        last_modified: Optional[str],
+        link: Optional[str],
+        content: bytes,
+    ):
+        if not etag and not last_modified:
+            return
+
+        key = self.make_key(url, params)
+        compressed = zlib.compress(content, 1)
+        previous = self.conn.execute(
+            "SELECT size FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                url,
+                etag,
+                last_modified,
+                link,
+                compressed,
+                len(compressed),
+                time.time(),
+            ),
+        )
+        self.total_bytes += len(compressed) - (previous[0] if previous else 0)
+        self.stats.stores += 1
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Least recently used pages go first, down to 90% of the budget so
+        # that the next few stores do not trigger another eviction pass
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats.evictions += len(evicted)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from src.engineering.github.client import ApiResponse, parse_link_header
+
+CASSETTE_MODES = ["record", "replay"]
+# Headers kept with a recorded response, everything else is dropped
+RECORDED_HEADERS = [
+    "Content-Type",
+    "ETag",
+    "Last-Modified",
+    "Link",
+    "Retry-After",
+    "X-RateLimit-Limit",
+    "X-RateLimit-Remaining",
+    "X-RateLimit-Reset",
+]
+
+
+def interaction_key(
+    method: str, url: str, params: Optional[dict] = None, json_body: Any = None
+) -> str:
+    # Keyed on path and query only, so a cassette recorded against
+    # api.github.com replays against any base URL
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query)
+    query += [(k, str(v)) for k, v in (params or {}).items() if v is not None]
+    key = f"{method} {parts.path}?{urlencode(sorted(query))}"
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True).encode()
+        key += " " + hashlib.sha1(body).hexdigest()
+    return key
+
+
+# Recorded API responses stored as NDJSON, one interaction per line. In
+# record mode every response the client returns is kept, in replay mode
+# the client answers from the cassette without touching the network.
+class Cassette:
+    def __init__(self, path: Path, mode: str = "replay"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.interactions: Dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, "r") as in_file:
+                for line in in_file:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self.interactions[interaction["key"]] = interaction
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def find(self, key: str) -> Optional[dict]:
+        return self.interactions.get(key)
+
+    def lookup(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict] = None,
+        json_body: Any = None,
+    ) -> Optional[ApiResponse]:
+        interaction = self.find(interaction_key(method, url, params, json_body))
+        if interaction is None:
+            return None
+
+        return ApiResponse(
+            url=interaction["url"],
+            status_code=interaction["status"],
+            headers=interaction["headers"],
+            content=interaction["body"].encode(),
+            links=parse_link_header(interaction["headers"].get("Link")),
+        )
+
+    def record(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict],
+        json_body: Any,
+        resp: ApiResponse,
+    ):
+        key = interaction_key(method, url, params, json_body)
+        self.interactions[key] = {
+            "key": key,
+            "url": resp.url,
+            "status": resp.status_code,
+            "headers": {
+                name: resp.headers[name]
+                for name in RECORDED_HEADERS
+                if name in resp.headers
+            },
+            "body": resp.content.decode(),
+        }
+
+    def save(self):
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as out_file:
+            for interaction in self.interactions.values():
+                out_file.write(json.dumps(interaction) + "\n")
+        os.replace(tmp_path, self.path)
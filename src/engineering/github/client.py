@@ -0,0 +1,251 @@
+import asyncio
+import json
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional
+
+import aiohttp
+from loguru import logger
+
+from src.engineering.github.cache import CacheEntry, ResponseCache
+from src.engineering.github.scheduler import RateLimitScheduler
+
+if TYPE_CHECKING:
+    from src.engineering.github.cassette import Cassette
+
+API_VERSION = "2022-11-28"
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_TIMEOUT_SECONDS = 60
+KEEPALIVE_TIMEOUT_SECONDS = 60
+
+LINK_PATTERN = re.compile(r'<(?P<url>[^>]+)>\s*;\s*rel="(?P<rel>[^"]+)"')
+
+
+class GithubApiError(Exception):
+    pass
+
+
+@dataclass
+class ApiResponse:
+    url: str
+    status_code: int
+    headers: Mapping[str, str]
+    content: bytes
+    links: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise GithubApiError(
+                f"{self.url} returned {self.status_code}: {self.content[:200]!r}"
+            )
+
+
+def parse_link_header(value: Optional[str]) -> Dict[str, Dict[str, str]]:
+    links: Dict[str, Dict[str, str]] = {}
+    if not value:
+        return links
+
+    for match in LINK_PATTERN.finditer(value):
+        links[match.group("rel")] = {"url": match.group("url")}
+
+    return links
+
+
+# One keep-alive connection pool shared by every request of a run.
+# max_concurrency caps requests in flight across all repositories, and
+# the scheduler picks the token each request is sent with. With a cache,
+# pages seen before are revalidated with If-None-Match/If-Modified-Since.
+# A cassette records the responses of a run or replays them offline.
+class GithubClient:
+    def __init__(
+        self,
+        tokens: Optional[List[Optional[str]]] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        scheduler: Optional[RateLimitScheduler] = None,
+        cache: Optional[ResponseCache] = None,
+        cassette: Optional["Cassette"] = None,
+    ):
+        self.scheduler = scheduler or RateLimitScheduler(tokens)
+        self.cache = cache
+        self.cassette = cassette
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "GithubClient":
+        headers = {"X-GitHub-Api-Version": API_VERSION}
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency,
+            keepalive_timeout=KEEPALIVE_TIMEOUT_SECONDS,
+            ttl_dns_cache=300,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.cassette is not None and self.cassette.mode == "record":
+            self.cassette.save()
+        if self.session is not None:
+            await self.session.close()
+        self.session = None
+        self.semaphore = None
+
+    async def get(self, url: str, params: Optional[dict] = None) -> ApiResponse:
+        return await self.request("GET", url, params=params)
+
+    async def post(self, url: str, json_body: Any) -> ApiResponse:
+        return await self.request("POST", url, json_body=json_body)
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict] = None,
+        json_body: Any = None,
+    ) -> ApiResponse:
+        if self.session is None or self.semaphore is None:
+            raise RuntimeError("GithubClient must be used as an async context manager")
+
+        if self.cassette is None:
+            return await self._send(method, url, params, json_body)
+
+        if self.cassette.mode == "replay":
+            resp = self.cassette.lookup(method, url, params, json_body)
+            if resp is None:
+                raise GithubApiError(f"No recorded response for {method} {url}")
+            return resp
+
+        resp = await self._send(method, url, params, json_body)
+        self.cassette.record(method, url, params, json_body, resp)
+        return resp
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict],
+        json_body: Any,
+    ) -> ApiResponse:
+        assert self.semaphore is not None
+
+        # Only GET pages are revalidated, GraphQL POSTs always go out
+        entry = None
+        if self.cache is not None and method == "GET":
+            entry = self.cache.lookup(url, params)
+
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                budget = await self.scheduler.acquire()
+                try:
+                    resp = await self._request(
+                        method, url, params, json_body, budget.token, entry
+                    )
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.scheduler.release(budget)
+                    if attempt >= self.scheduler.max_retries:
+                        raise
+                    delay = self.scheduler.backoff(attempt)
+                    logger.warning(f"{url} failed ({e!r}), retrying in {delay:.1f}s")
+                else:
+                    self.scheduler.release(
+                        budget, resp.status_code, resp.headers, resp.content
+                    )
+                    if attempt >= self.scheduler.max_retries or not (
+                        self.scheduler.should_retry(
+                            resp.status_code, resp.headers, resp.content
+                        )
+                    ):
+                        if method != "GET":
+                            return resp
+                        return self._revalidate(url, params, entry, resp)
+                    # A rate limited token is parked by the scheduler, so the
+                    # retry only needs a short jitter before picking another one
+                    if self.scheduler.is_rate_limited(
+                        resp.status_code, resp.headers, resp.content
+                    ):
+                        delay = self.scheduler.backoff(0)
+                    else:
+                        delay = self.scheduler.backoff(attempt)
+                    logger.warning(
+                        f"{url} returned {resp.status_code}, retrying in {delay:.1f}s"
+                    )
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict],
+        json_body: Any,
+        token: Optional[str],
+        entry: Optional[CacheEntry] = None,
+    ) -> ApiResponse:
+        assert self.session is not None
+        headers = entry.conditional_headers() if entry is not None else {}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        async with self.session.request(
+            method, url, params=params, json=json_body, headers=headers
+        ) as resp:
+            content = await resp.read()
+
+        return ApiResponse(
+            url=str(resp.url),
+            status_code=resp.status,
+            headers=resp.headers,
+            content=content,
+            links=parse_link_header(resp.headers.get("Link")),
+        )
+
+    def _revalidate(
+        self,
+        url: str,
+        params: Optional[dict],
+        entry: Optional[CacheEntry],
+        resp: ApiResponse,
+    ) -> ApiResponse:
+        if self.cache is None:
+            return resp
+
+        if resp.status_code == 304 and entry is not None:
+            self.cache.hit(entry)
+            return ApiResponse(
+                url=resp.url,
+                status_code=200,
+                headers=resp.headers,
+                content=entry.content,
+                links=parse_link_header(entry.link),
+                from_cache=True,
+            )
+
+        self.cache.miss()
+        if resp.status_code == 200:
+            self.cache.store(
+                url,
+                params,
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+                link=resp.headers.get("Link"),
+                content=resp.content,
+            )
+        return resp
@@ -1,26 +1,49 @@
-import requests
+import asyncio
 from dotenv import load_dotenv
 from pathlib import Path
 import os
-import json
-from typing import Dict, Any, List, Union
+from typing import Dict, Any, AsyncIterator, List, Optional, Union
 from enum import Enum
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from src.paths import (
     GITHUB_COMMITS_RAW_DIR_PATH,
     GITHUB_REPOSITORIES_RAW_DIR_PATH,
     GITHUB_ISSUES_RAW_DIR_PATH,
+    GITHUB_DEDUP_INDEX_PATH,
+    GITHUB_RESPONSE_CACHE_PATH,
+    GITHUB_WATERMARKS_PATH,
+)
+from src.engineering.github.cache import ResponseCache, DEFAULT_MAX_BYTES
+from src.engineering.github.cassette import Cassette, CASSETTE_MODES
+from src.engineering.github.client import (
+    ApiResponse,
+    GithubClient,
+    DEFAULT_MAX_CONCURRENCY,
+)
+from src.engineering.github import graphql
+from src.engineering.github.dedup import DedupIndex
+from src.engineering.github.writer import PartitionWriter, get_nested_value
+from src.storage import RAW_FORMATS, RAW_FILENAMES
+from src.telemetry import observe_request, write_metrics
+from src.engineering.github.watermarks import (
+    WatermarkStore,
+    as_datetime,
+    parse_timestamp,
+    window_start,
 )
 import shutil
 import argparse
+import time
 from dataclasses import dataclass
-import concurrent.futures
-from copy import deepcopy
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from loguru import logger
 
 load_dotenv()
 
-API_BASEURL = "https://api.github.com"
+# Overridable to point the collector at a stand-in (see standin.py)
+API_BASEURL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+DEFAULT_CHECKPOINT_INTERVAL = 25
 
 
 class WriteMode(Enum):
@@ -38,12 +61,48 @@ def construct_api_url(endpoint: str, *args):
     return API_BASEURL + "/" + endpoint + "/" + "/".join(args)
 
 
-def get_api_data(url: str, params: dict = {}):
-    bearer_token = f'Bearer {os.environ["GITHUB_TOKEN"]}'
-    headers = {"Authorization": bearer_token, "X-GitHub-Api-Version": "2022-11-28"}
-    resp = requests.get(url, params=params, headers=headers)
+def format_params(params: Optional[dict]) -> Optional[dict]:
+    if not params:
+        return None
 
-    return resp
+    formatted = {}
+    for key, value in params.items():
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        formatted[key] = value
+    return formatted
+
+
+def endpoint_label(url: str) -> str:
+    # repos/{owner}/{repo}/commits -> commits, keeps the label cardinality
+    # independent of the repositories collected
+    segments = urlsplit(url).path.strip("/").split("/")
+    if segments[0] == "repos":
+        return segments[3] if len(segments) > 3 else "repos"
+    return segments[0]
+
+
+async def get_api_data(
+    client: GithubClient, url: str, params: Optional[dict] = None
+) -> ApiResponse:
+    started = time.perf_counter()
+    status = "error"
+    nbytes = 0
+    cached = False
+    try:
+        resp = await client.get(url, params=format_params(params))
+        status = str(resp.status_code)
+        nbytes = len(resp.content)
+        cached = resp.from_cache
+        return resp
+    finally:
+        observe_request(
+            time.perf_counter() - started,
+            nbytes,
+            endpoint=endpoint_label(url),
+            status=status,
+            cached=str(cached).lower(),
+        )
 
 
 def write_result_to_disk(
@@ -51,101 +110,66 @@ def write_result_to_disk(
     result: Union[Dict[str, Any], List],
     destination: Path,
     partition_column_path: str,
+    raw_format: str = "json",
 ):
-    os.makedirs(destination.parents[0], exist_ok=True)
-    if source == "repos":
-        _write_dict_data(result, destination)
-    else:
-        _write_list_data(
-            result, destination, partition_column_path=partition_column_path
-        )
+    with PartitionWriter(
+        destination,
+        partition_column_path=None if source == "repos" else partition_column_path,
+        raw_format=raw_format,
+    ) as writer:
+        writer.write(result)
 
 
-def _write_dict_data(result: Dict[str, Any], destination: Path):
-    with open(os.path.join(destination, "data.json"), "a") as out_file:
-        for row in result:
-            out_file.write(json.dumps(row))
-            out_file.write("\n")
-
-
-def _write_list_data(result: List, destination: Path, partition_column_path: str):
-    from itertools import groupby
-
-    groups = []
-    keys = []
-
-    for k, g in groupby(
-        result, lambda x: str(get_nested_value(x, partition_column_path))[:10]
-    ):
-        groups.append(list(g))  # Store group iterator as a list
-        keys.append(k)
-
-    for k, g in zip(keys, groups):
-        out_dirpath = os.path.join(destination, k.replace("-", "/"))
-        out_filepath = os.path.join(out_dirpath, "data.json")
-
-        os.makedirs(out_dirpath, exist_ok=True)
-        with open(out_filepath, "a") as out_file:
-            for row in g:
-                out_file.write(json.dumps(row))
-                out_file.write("\n")
-
-
-def get_nested_value(data, path):
-    keys = path.split(".")
-    value = data
-    try:
-        for key in keys:
-            value = value[key]
-        return value
-    except KeyError:
-        return None
-
-
-def collect_repositories(
+async def collect_repositories(
+    client: GithubClient,
     repository: Repository,
     since: datetime,
     until: datetime,
+    fan_out: bool = False,
 ):
-    params = {"since": since, "until": until}
     url = construct_api_url("repos", repository.owner, repository.name)
 
-    repos = collect_and_paginate(url=url, repo=repository)
-    return repos
+    async for repo in collect_and_paginate(client, url=url, repo=repository):
+        yield [repo]
 
 
-def collect_commits(
+async def collect_commits(
+    client: GithubClient,
     repository: Repository,
     since: datetime,
     until: datetime,
+    fan_out: bool = False,
 ):
     params = {"since": since, "until": until, "per_page": 100}
     url = construct_api_url("repos", repository.owner, repository.name, "commits")
 
-    commits = collect_and_paginate(url=url, repo=repository, params=params)
-
-    return commits
+    async for commits in collect_and_paginate(
+        client, url=url, repo=repository, params=params, fan_out=fan_out
+    ):
+        yield commits
 
 
-def collect_issues(
+async def collect_issues(
+    client: GithubClient,
     repository: Repository,
     since: datetime,
     until: datetime,
+    fan_out: bool = False,
 ):
     params = {"since": since, "until": until, "state": "all", "per_page": 100}
     url = construct_api_url("repos", repository.owner, repository.name, "issues")
 
-    issues = collect_and_paginate(repo=repository, url=url, params=params)
-    open_issues = []
-
-    for issue in issues:
-        issue = deepcopy(issue)
-        if issue["state"] == "closed":
-            open_issues.append(construct_open_issue_row(issue))
-
-    all_issues = issues + open_issues
+    async for issues in collect_and_paginate(
+        client, repo=repository, url=url, params=params, fan_out=fan_out
+    ):
+        # Only top level keys are rewritten, so a shallow copy is enough
+        open_issues = [
+            construct_open_issue_row(dict(issue))
+            for issue in issues
+            if issue["state"] == "closed"
+        ]
 
-    return all_issues
+        yield issues + open_issues
 
 
 def construct_open_issue_row(issue: dict):
@@ -154,28 +178,86 @@ def construct_open_issue_row(issue: dict):
     return issue
 
 
-def collect_and_paginate(repo: Repository, url: str, params: dict = {}):
-    data = []
+def page_url(url: str, page: int) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "page"]
+    query.append(("page", str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def last_page_number(resp: ApiResponse) -> Optional[int]:
+    last = resp.links.get("last")
+    if not last:
+        return None
+    page = dict(parse_qsl(urlsplit(last["url"]).query)).get("page")
+    return int(page) if page and page.isdigit() else None
+
+
+def _tag_rows(resp_data: Union[Dict[str, Any], List], repo: Repository):
+    if isinstance(resp_data, list):
+        for row in resp_data:
+            row["repo"] = repo.owner + "/" + repo.name
+    return resp_data
+
 
+async def collect_and_paginate(
+    client: GithubClient,
+    repo: Repository,
+    url: str,
+    params: Optional[dict] = None,
+    fan_out: bool = False,
+) -> AsyncIterator[Union[Dict[str, Any], List]]:
     is_last = False
-    resp = get_api_data(url)
     while not is_last:
-        resp = get_api_data(url, params)
-        resp_data = resp.json()
-        if isinstance(resp_data, list):
-            for row in resp_data:
-                row["repo"] = repo.owner + "/" + repo.name
-                data.append(row)
-        else:
-            data = resp_data
+        resp = await get_api_data(client, url, params)
+        resp.raise_for_status()
+
+        yield _tag_rows(resp.json(), repo)
 
         # Pagination
-        if resp.links.get("next", None):
+        # The next link already carries the query of the first request
+        if fan_out and last_page_number(resp):
+            async for page in _fan_out_pages(client, repo, resp):
+                yield page
+            is_last = True
+        elif resp.links.get("next", None):
             url = resp.links["next"]["url"]
+            params = None
         else:
             is_last = True
 
-    return data
+
+async def _fan_out_pages(
+    client: GithubClient, repo: Repository, first: ApiResponse
+) -> AsyncIterator[Union[Dict[str, Any], List]]:
+    # The last link tells how many pages there are, so pages 2..N are
+    # requested concurrently. A window of client.max_concurrency pages is
+    # kept in flight and pages are yielded in order as the window advances.
+    last_page = last_page_number(first)
+    assert last_page is not None
+    last_url = first.links["last"]["url"]
+    pages = iter(range(2, last_page + 1))
+    window: deque = deque()
+
+    def schedule():
+        page = next(pages, None)
+        if page is not None:
+            window.append(
+                asyncio.ensure_future(get_api_data(client, page_url(last_url, page)))
+            )
+
+    try:
+        for _ in range(client.max_concurrency):
+            schedule()
+
+        while window:
+            resp = await window.popleft()
+            schedule()
+            resp.raise_for_status()
+            yield _tag_rows(resp.json(), repo)
+    finally:
+        for task in window:
+            task.cancel()
 
 
 def read_repos_from_file(filepath: Path) -> List[Repository]:
@@ -189,16 +271,43 @@ def read_repos_from_file(filepath: Path) -> List[Repository]:
     return repos
 
 
-def main(source: str, repos: list, since: datetime, until: datetime):
-    print(repos)
+def main(
+    source: str,
+    repos: list,
+    since: datetime,
+    until: datetime,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    cache_path: Optional[Path] = GITHUB_RESPONSE_CACHE_PATH,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    watermarks_path: Path = GITHUB_WATERMARKS_PATH,
+    full_refresh: bool = False,
+    fan_out: bool = False,
+    backend: str = "rest",
+    raw_format: str = "json",
+    checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    dedup_index_path: Optional[Path] = GITHUB_DEDUP_INDEX_PATH,
+    cassette_path: Optional[Path] = None,
+    cassette_mode: str = "replay",
+):
+    logger.info(f"Collecting {source} for {len(repos)} repositories")
     repos = list(map(lambda repo: Repository(*repo.split("/")), repos))
 
     collector_map = {
-        "commits": collect_commits,
-        "repos": collect_repositories,
-        "issues": collect_issues,
+        "rest": {
+            "commits": collect_commits,
+            "repos": collect_repositories,
+            "issues": collect_issues,
+        },
+        # Batches many repositories into each aliased GraphQL query
+        "graphql": {
+            "commits": graphql.collect_commits,
+            "repos": graphql.collect_repositories,
+        },
     }
 
+    if source not in collector_map[backend]:
+        raise ValueError(f"The {backend} backend does not collect {source}")
+
     destination_map = {
         "commits": GITHUB_COMMITS_RAW_DIR_PATH,
         "repos": GITHUB_REPOSITORIES_RAW_DIR_PATH,
@@ -210,31 +319,128 @@ def main(source: str, repos: list, since: datetime, until: datetime):
     else:
         partition_column_path = "updated_at"
 
-    shutil.rmtree(destination_map[source], ignore_errors=True)
+    watermarks = WatermarkStore(watermarks_path)
+    if full_refresh:
+        shutil.rmtree(destination_map[source], ignore_errors=True)
+        watermarks.clear(source)
+        watermarks.save()
+    elif source == "repos":
+        # Repository metadata is a snapshot rather than a time series, so
+        # snapshots left behind in other formats are dropped
+        for filename in RAW_FILENAMES:
+            repos_file = os.path.join(destination_map[source], filename)
+            if filename != RAW_FORMATS[raw_format].filename and os.path.exists(
+                repos_file
+            ):
+                os.remove(repos_file)
     os.makedirs(destination_map[source], exist_ok=True)
 
-    collector_func = collector_map[source]
-
-    # Setting arguments here
-    def collect_for_repo(repo):
-        return collector_func(repo, since=since, until=until)
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(repos)) as executor:
-        futures = [executor.submit(collect_for_repo, repo) for repo in repos]
-
-        data = []
-        for future in concurrent.futures.as_completed(futures):
-            if source == "repos":
-                data.append(future.result())
-            else:
-                data.extend(future.result())
+    # Overlapping windows and retried repositories refetch rows that earlier
+    # runs already wrote; repository snapshots are replaced, not extended
+    dedup = (
+        DedupIndex(dedup_index_path) if dedup_index_path and source != "repos" else None
+    )
 
-    write_result_to_disk(
-        source,
-        data,
-        destination=destination_map[source],
-        partition_column_path=partition_column_path,
+    writer = PartitionWriter(
+        destination_map[source],
+        partition_column_path=None if source == "repos" else partition_column_path,
+        raw_format=raw_format,
+        overwrite=source == "repos",
+        dedup=dedup,
+        source=source,
     )
+    completed = 0
+
+    collector_func = collector_map[backend][source]
+
+    cache = ResponseCache(cache_path, cache_max_bytes) if cache_path else None
+    cassette = Cassette(cassette_path, cassette_mode) if cassette_path else None
+
+    # Every page is written as soon as it arrives, so only the pages in
+    # flight are held in memory and a failing repository keeps what it
+    # already fetched
+    async def collect_for_repo(client: GithubClient, repo: Repository):
+        full_name = f"{repo.owner}/{repo.name}"
+        repo_since = since
+        watermark = watermarks.get(source, full_name)
+        # The window only starts at the watermark's day when the watermark
+        # falls inside [since, until], so explicit backfills still fetch what
+        # they ask for
+        if watermark and as_datetime(since) < parse_timestamp(watermark):
+            if parse_timestamp(watermark) >= as_datetime(until):
+                return
+            if as_datetime(since) < as_datetime(window_start(watermark)):
+                repo_since = window_start(watermark)
+        else:
+            watermark = None
+
+        newest = None
+        async for page in collector_func(
+            client, repo, since=repo_since, until=until, fan_out=fan_out
+        ):
+            if source != "repos":
+                # The window starts before the watermark, and the rows up to
+                # it were written by the run that recorded it
+                if watermark:
+                    page = [
+                        row
+                        for row in page
+                        if not get_nested_value(row, partition_column_path)
+                        or get_nested_value(row, partition_column_path) > watermark
+                    ]
+                for row in page:
+                    value = get_nested_value(row, partition_column_path)
+                    if value and (newest is None or value > newest):
+                        newest = value
+
+            writer.write(page)
+
+        # Only a repository that finished is advanced, and watermarks are only
+        # persisted together with the partitions they describe, so a crashed
+        # run restarts every repository from its last checkpoint
+        if newest:
+            watermarks.advance(source, full_name, newest)
+
+        nonlocal completed
+        completed += 1
+        if source != "repos" and completed % checkpoint_interval == 0:
+            writer.commit()
+            watermarks.save()
+
+    async def collect_all():
+        async with GithubClient(
+            max_concurrency=max_concurrency, cache=cache, cassette=cassette
+        ) as client:
+            return await asyncio.gather(
+                *[collect_for_repo(client, repo) for repo in repos],
+                return_exceptions=True,
+            )
+
+    try:
+        with writer:
+            results = asyncio.run(collect_all())
+        watermarks.save()
+        writer.log_stats()
+    finally:
+        if cache is not None:
+            logger.info(f"Response cache: {cache.stats}")
+            cache.close()
+        if dedup is not None:
+            logger.info(f"Dedup index: {dedup.stats}")
+            dedup.close()
+
+    failed = []
+    for repo, result in zip(repos, results):
+        if isinstance(result, BaseException):
+            logger.error(
+                f"Collecting {source} for {repo.owner}/{repo.name} failed: {result!r}"
+            )
+            failed.append(f"{repo.owner}/{repo.name}")
+
+    if failed:
+        raise RuntimeError(
+            f"Collection failed for {len(failed)} repositories: {failed}"
+        )
 
 
 if __name__ == "__main__":
@@ -272,6 +478,104 @@ if __name__ == "__main__":
         default=datetime.now(),
     )
 
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="Maximum number of requests in flight across all repositories",
+    )
+
+    parser.add_argument(
+        "--cache-path",
+        type=Path,
+        default=GITHUB_RESPONSE_CACHE_PATH,
+        help="SQLite file holding ETag/Last-Modified revalidation data",
+    )
+
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Size limit of the response cache before LRU eviction",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        default=False,
+        action="store_true",
+        help="Always fetch full pages without conditional requests",
+    )
+
+    parser.add_argument(
+        "--full-refresh",
+        default=False,
+        action="store_true",
+        help="Drop the collected partitions and watermarks and refetch the whole window",
+    )
+
+    parser.add_argument(
+        "--fan-out",
+        default=False,
+        action="store_true",
+        help="Fetch pages 2..N concurrently once the first page reveals the last page",
+    )
+
+    parser.add_argument(
+        "--backend",
+        "-b",
+        choices=["rest", "graphql"],
+        default="rest",
+        help="graphql batches many repositories per request (commits and repos only)",
+    )
+
+    parser.add_argument(
+        "--format",
+        "-f",
+        choices=list(RAW_FORMATS),
+        default="json",
+        help="Raw partition format: NDJSON, zstd-compressed NDJSON or flattened Parquet",
+    )
+
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help="Commit partitions and watermarks every N finished repositories",
+    )
+
+    parser.add_argument(
+        "--dedup-index",
+        type=Path,
+        default=GITHUB_DEDUP_INDEX_PATH,
+        help="SQLite file holding the keys of rows already written",
+    )
+
+    parser.add_argument(
+        "--no-dedup",
+        default=False,
+        action="store_true",
+        help="Write every fetched row, even if a partition already holds it",
+    )
+
+    parser.add_argument(
+        "--cassette",
+        type=Path,
+        help="NDJSON file of recorded API responses (pass fixed --since/--until)",
+    )
+
+    parser.add_argument(
+        "--cassette-mode",
+        choices=CASSETTE_MODES,
+        default="replay",
+        help="record keeps every response of the run, replay serves them offline",
+    )
+
+    parser.add_argument(
+        "--metrics-dir",
+        help="Write request latency, status and bytes to collector_<source>.json "
+        "and .prom in this directory",
+    )
+
     args = parser.parse_args()
     if len(args.repos) == 1 and os.path.exists(args.repos[0]):
         with open(args.repos[0], "r") as repo_file:
@@ -287,5 +591,24 @@ if __name__ == "__main__":
         since = args.since
         until = args.until
 
-    print(f"Collecting for {repos} ({since}-{until})")
-    main(source=args.source, repos=repos, since=since, until=until)
+    logger.info(f"Collecting for {repos} ({since}-{until})")
+    try:
+        main(
+            source=args.source,
+            repos=repos,
+            since=since,
+            until=until,
+            max_concurrency=args.max_concurrency,
+            cache_path=None if args.no_cache else args.cache_path,
+            cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+            full_refresh=args.full_refresh,
+            fan_out=args.fan_out,
+            backend=args.backend,
+            raw_format=args.format,
+            checkpoint_interval=args.checkpoint_interval,
+            dedup_index_path=None if args.no_dedup else args.dedup_index,
+            cassette_path=args.cassette,
+            cassette_mode=args.cassette_mode,
+        )
+    finally:
+        write_metrics(args.metrics_dir, f"collector_{args.source}")
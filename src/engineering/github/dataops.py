@@ -4,16 +4,18 @@ from pathlib import Path
 import sys
 from loguru import logger
 from src.utils import Directory
+from src import storage
 from sklearn.model_selection import train_test_split
 import os
 import shutil
+from typing import Tuple, Union
 
 
 def build_split_from_directory(
     directory: Directory,
     target: str,
     train_portion: float,
-    suffix: str,
+    suffix: Union[str, Tuple[str, ...]],
     target_directory: Directory,
 ):
     test_portion = 1 - train_portion
@@ -22,9 +24,7 @@ def build_split_from_directory(
     )
 
     df: pd.DataFrame
-    df = pd.concat(
-        [pd.read_json(f, lines=True) for f in directory.collect(suffix=suffix)]
-    )
+    df = pd.concat([storage.read_frame(f) for f in directory.collect(suffix=suffix)])
     if df.empty:
         raise ValueError("The dataframe is empty")
 
@@ -59,7 +59,10 @@ if __name__ == "__main__":
         help="Decimal number of train portion",
     )
     train_test_parser.add_argument(
-        "--suffix", "-s", type=str, help="Suffix of the collected files", required=True
+        "--suffix",
+        "-s",
+        type=str,
+        help="Suffix of the collected files (default: every raw partition format)",
     )
     train_test_parser.add_argument(
         "--target-directory",
@@ -79,6 +82,6 @@ if __name__ == "__main__":
         Directory(args.directory),
         args.target,
         args.train_portion,
-        args.suffix,
+        args.suffix or storage.RAW_FILENAMES,
         Directory(args.target_directory),
     )
@@ -0,0 +1,283 @@
+import hashlib
+import math
+import os
+import sqlite3
+import sys
+import uuid
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+from src import storage
+from src.paths import (
+    GITHUB_COMMITS_RAW_DIR_PATH,
+    GITHUB_DEDUP_INDEX_PATH,
+    GITHUB_ISSUES_RAW_DIR_PATH,
+)
+from src.utils import Directory
+
+DEFAULT_EXPECTED_KEYS = 5_000_000
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+
+def row_key(source: str, row: Dict[str, Any]) -> Optional[str]:
+    # Issues are kept once per revision, matching the (id, updated_at) key
+    # of public.issues
+    if source == "commits":
+        return f"{row.get('repo')}:{row.get('sha')}"
+    if source == "issues":
+        return f"{row.get('repo')}:{row.get('id')}:{row.get('updated_at')}"
+    return None
+
+
+def digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.capacity = capacity
+        self.size = max(
+            8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key_digest: bytes):
+        h1 = int.from_bytes(key_digest[:8], "little")
+        h2 = int.from_bytes(key_digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key_digest: bytes):
+        for position in self._positions(key_digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key_digest: bytes) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key_digest)
+        )
+
+
+@dataclass
+class DedupStats:
+    checked: int = 0
+    duplicates: int = 0
+    seeded_partitions: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.checked} rows checked, {self.duplicates} duplicates skipped, "
+            f"{self.seeded_partitions} partitions indexed"
+        )
+
+
+# Keys of every row already written to a raw partition. A Bloom filter in
+# front answers most lookups of new rows without touching SQLite, which holds
+# the exact keys. Keys are recorded per partition file, and a partition whose
+# size or mtime no longer matches what was indexed is re-read, so the index
+# follows partitions that were replaced outside the collector (e.g. dvc pull).
+class DedupIndex:
+    def __init__(
+        self,
+        path: Path,
+        expected_keys: int = DEFAULT_EXPECTED_KEYS,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+    ):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        self.path = Path(path)
+        self.false_positive_rate = false_positive_rate
+        self.stats = DedupStats()
+        self.pending: Dict[bytes, Tuple[str, str]] = {}
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS keys (
+                source TEXT,
+                key BLOB,
+                partition TEXT,
+                PRIMARY KEY (source, key)
+            ) WITHOUT ROWID
+            """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS keys_partition ON keys(source, partition)"
+        )
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS partitions (
+                source TEXT,
+                partition TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                PRIMARY KEY (source, partition)
+            )
+            """)
+        self.conn.commit()
+
+        count = self.conn.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+        self._build_bloom(max(expected_keys, count * 2))
+
+    def _build_bloom(self, capacity: int):
+        self.bloom = BloomFilter(capacity, self.false_positive_rate)
+        for (key_digest,) in self.conn.execute("SELECT key FROM keys"):
+            self.bloom.add(key_digest)
+        self.bloom_keys = self.conn.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def _contains(self, source: str, key_digest: bytes) -> bool:
+        if key_digest in self.pending:
+            return True
+        if key_digest not in self.bloom:
+            return False
+        return (
+            self.conn.execute(
+                "SELECT 1 FROM keys WHERE source = ? AND key = ?", (source, key_digest)
+            ).fetchone()
+            is not None
+        )
+
+    def add(self, source: str, key: str, partition: str) -> bool:
+        key_digest = digest(key)
+        self.stats.checked += 1
+        if self._contains(source, key_digest):
+            self.stats.duplicates += 1
+            return False
+
+        self.pending[key_digest] = (source, partition)
+        self.bloom.add(key_digest)
+        return True
+
+    def ensure_partition(self, source: str, path: Path):
+        row = self.conn.execute(
+            "SELECT size, mtime_ns FROM partitions WHERE source = ? AND partition = ?",
+            (source, str(path)),
+        ).fetchone()
+        stat = os.stat(path) if path.exists() else None
+        if stat is None and row is None:
+            return
+        if stat is not None and row == (stat.st_size, stat.st_mtime_ns):
+            return
+
+        self.conn.execute(
+            "DELETE FROM keys WHERE source = ? AND partition = ?", (source, str(path))
+        )
+        if stat is not None:
+            keys = [
+                (source, digest(key), str(path))
+                for key in (row_key(source, r) for r in storage.iter_records(path))
+                if key is not None
+            ]
+            self.conn.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?, ?)", keys)
+            for _, key_digest, _ in keys:
+                self.bloom.add(key_digest)
+        self._record_partition(source, path)
+        self.conn.commit()
+        self.stats.seeded_partitions += 1
+
+    def _record_partition(self, source: str, path: Path):
+        if not path.exists():
+            self.conn.execute(
+                "DELETE FROM partitions WHERE source = ? AND partition = ?",
+                (source, str(path)),
+            )
+            return
+        stat = os.stat(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?)",
+            (source, str(path), stat.st_size, stat.st_mtime_ns),
+        )
+
+    def commit(self, source: str, partitions: Iterable[Path]):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO keys VALUES (?, ?, ?)",
+            [(s, k, p) for k, (s, p) in self.pending.items()],
+        )
+        for path in partitions:
+            self._record_partition(source, path)
+        self.conn.commit()
+        self.bloom_keys += len(self.pending)
+        self.pending = {}
+
+        if self.bloom_keys > self.bloom.capacity:
+            self._build_bloom(self.bloom_keys * 2)
+
+    def rollback(self):
+        # Bits of rolled back keys stay set, which only costs an exact lookup
+        self.pending = {}
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+def compact(source: str, directory: Directory, index: DedupIndex):
+    # Rewrites every partition without the rows an earlier partition (or an
+    # earlier line of the same partition) already holds, and re-indexes it
+    removed = 0
+    files = sorted(directory.collect())
+    for path in files:
+        raw_format = storage.format_for_path(path)
+        index.conn.execute(
+            "DELETE FROM keys WHERE source = ? AND partition = ?", (source, str(path))
+        )
+
+        tmp_path = path.parent / f".{path.name}.{uuid.uuid4().hex}.tmp"
+        sink = raw_format.open_sink(tmp_path)
+        kept = 0
+        total = 0
+        try:
+            for row in storage.iter_records(path):
+                total += 1
+                key = row_key(source, row)
+                if key is None or index.add(source, key, str(path)):
+                    sink.write(row)
+                    kept += 1
+        finally:
+            sink.close()
+
+        if kept < total:
+            os.replace(tmp_path, path)
+            removed += total - kept
+            logger.info(f"Removed {total - kept} duplicate rows from {path}")
+        elif tmp_path.exists():
+            os.remove(tmp_path)
+        index.commit(source, [path])
+
+    logger.info(f"Compacted {len(files)} partitions, removed {removed} duplicate rows")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers()
+
+    compact_parser = subparsers.add_parser("compact")
+    compact_parser.add_argument(
+        "--source", "-s", required=True, choices=["commits", "issues"]
+    )
+    compact_parser.add_argument(
+        "--directory",
+        "-d",
+        type=lambda x: Directory(x),
+        help="Raw directory of the source (default: data/raw/<source>)",
+    )
+    compact_parser.add_argument("--index", type=Path, default=GITHUB_DEDUP_INDEX_PATH)
+    compact_parser.set_defaults(func=compact)
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit()
+
+    args = parser.parse_args()
+
+    directory_map = {
+        "commits": GITHUB_COMMITS_RAW_DIR_PATH,
+        "issues": GITHUB_ISSUES_RAW_DIR_PATH,
+    }
+    directory = args.directory or Directory(str(directory_map[args.source]))
+    dedup_index = DedupIndex(args.index)
+    try:
+        args.func(args.source, directory, dedup_index)
+    finally:
+        dedup_index.close()
@@ -0,0 +1,183 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import psycopg
+from psycopg.sql import SQL, Identifier
+
+from src.engineering.github.watermarks import parse_timestamp
+
+
+@dataclass
+class StagingTable:
+    name: str
+    columns: List[Tuple[str, str]]
+
+    @property
+    def types(self) -> List[str]:
+        return [column_type for _, column_type in self.columns]
+
+    def create_sql(self) -> SQL:
+        return SQL("CREATE TEMP TABLE {} ({})").format(
+            Identifier(self.name),
+            SQL(", ").join(
+                SQL("{} {}").format(Identifier(column), SQL(column_type))
+                for column, column_type in self.columns
+            ),
+        )
+
+    def copy_sql(self) -> SQL:
+        return SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+            Identifier(self.name),
+            SQL(", ").join(Identifier(column) for column, _ in self.columns),
+        )
+
+
+COMMITS = StagingTable(
+    "staging_commits",
+    [
+        ("sha", "text"),
+        ("node_id", "text"),
+        ("author_id", "text"),
+        ("created_at", "timestamp"),
+        ("repo", "text"),
+        ("committer_id", "text"),
+    ],
+)
+
+USERS = StagingTable(
+    "staging_users",
+    [
+        ("login", "text"),
+        ("id", "text"),
+        ("node_id", "text"),
+        ("avatar_url", "text"),
+        ("url", "text"),
+        ("type", "text"),
+        ("user_view_type", "text"),
+        ("site_admin", "bool"),
+    ],
+)
+
+ISSUES = StagingTable(
+    "staging_issues",
+    [
+        ("url", "text"),
+        ("repository_url", "text"),
+        ("id", "text"),
+        ("node_id", "text"),
+        ("number", "int8"),
+        ("title", "text"),
+        ("labels", "text[]"),
+        ("state", "text"),
+        ("locked", "bool"),
+        ("comments", "int8"),
+        ("created_at", "timestamp"),
+        ("updated_at", "timestamp"),
+        ("closed_at", "timestamp"),
+        ("author_association", "text"),
+        ("repo", "text"),
+    ],
+)
+
+TYPED_SOURCES = {"commits": [COMMITS, USERS], "issues": [ISSUES]}
+
+
+def _text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    # Naive UTC, like the ::timestamp casts of the JSONB scripts
+    return parse_timestamp(value) if value else None
+
+
+def commit_tuple(row: Dict[str, Any]) -> tuple:
+    author = row.get("author") or {}
+    committer = row.get("committer") or {}
+    return (
+        row.get("sha"),
+        row.get("node_id"),
+        _text(author.get("id")),
+        _timestamp(((row.get("commit") or {}).get("author") or {}).get("date")),
+        row.get("repo"),
+        _text(committer.get("id")),
+    )
+
+
+def user_tuple(user: Dict[str, Any]) -> tuple:
+    return (
+        user.get("login"),
+        _text(user.get("id")),
+        user.get("node_id"),
+        user.get("avatar_url"),
+        user.get("url"),
+        user.get("type"),
+        user.get("user_view_type"),
+        user.get("site_admin"),
+    )
+
+
+def issue_tuple(row: Dict[str, Any]) -> tuple:
+    return (
+        row.get("url"),
+        row.get("repository_url"),
+        _text(row.get("id")),
+        row.get("node_id"),
+        row.get("number"),
+        row.get("title"),
+        [label.get("name") for label in row.get("labels") or []],
+        row.get("state"),
+        row.get("locked"),
+        row.get("comments"),
+        _timestamp(row.get("created_at")),
+        _timestamp(row.get("updated_at")),
+        _timestamp(row.get("closed_at")),
+        row.get("author_association"),
+        row.get("repo"),
+    )
+
+
+def parse_lines(chunks: Iterable[bytes]) -> Iterable[Dict[str, Any]]:
+    for chunk in chunks:
+        for line in chunk.splitlines():
+            if line:
+                yield json.loads(line)
+
+
+def _copy_rows(cur: psycopg.Cursor, table: StagingTable, rows: Iterable[tuple]) -> int:
+    count = 0
+    with cur.copy(table.copy_sql()) as copy:
+        copy.set_types(table.types)
+        for row in rows:
+            copy.write_row(row)
+            count += 1
+    return count
+
+
+# Parses every raw row once in Python and COPYs typed tuples in binary
+# format into the source's staging tables, so the insert scripts select
+# plain columns instead of extracting them from JSONB. Commit authors and
+# committers are deduplicated by id while the commits are streamed.
+def copy_typed(
+    cur: psycopg.Cursor, source: str, records: Iterable[Dict[str, Any]]
+) -> Dict[str, int]:
+    for table in TYPED_SOURCES[source]:
+        cur.execute(table.create_sql())
+
+    if source == "issues":
+        return {ISSUES.name: _copy_rows(cur, ISSUES, map(issue_tuple, records))}
+
+    users: Dict[str, tuple] = {}
+
+    def commits():
+        for row in records:
+            for user in (row.get("author"), row.get("committer")):
+                if user and user.get("id") is not None:
+                    users.setdefault(str(user["id"]), user_tuple(user))
+            yield commit_tuple(row)
+
+    counts = {COMMITS.name: _copy_rows(cur, COMMITS, commits())}
+    counts[USERS.name] = _copy_rows(cur, USERS, users.values())
+    return counts
@@ -0,0 +1,342 @@
+import asyncio
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+from weakref import WeakKeyDictionary
+
+from src.engineering.github.client import GithubApiError, GithubClient
+
+if TYPE_CHECKING:
+    from src.engineering.github.collector import Repository
+
+DEFAULT_BATCH_SIZE = 25
+# How long the first request of a batch waits for other repositories to join
+DEFAULT_LINGER_SECONDS = 0.05
+COMMITS_PER_PAGE = 100
+
+USER_FIELDS = """
+    __typename
+    login
+    databaseId
+    id
+    avatarUrl
+    isSiteAdmin
+"""
+
+COMMITS_SELECTION = f"""
+    defaultBranchRef {{
+      target {{
+        ... on Commit {{
+          history(first: {COMMITS_PER_PAGE}, since: $since{{i}}, until: $until{{i}}, after: $cursor{{i}}) {{
+            pageInfo {{ hasNextPage endCursor }}
+            nodes {{
+              oid
+              id
+              url
+              message
+              tree {{ oid }}
+              parents(first: 5) {{ nodes {{ oid url }} }}
+              author {{ name email date user {{ {USER_FIELDS} }} }}
+              committer {{ name email date user {{ {USER_FIELDS} }} }}
+            }}
+          }}
+        }}
+      }}
+    }}
+"""
+
+REPOSITORY_SELECTION = """
+    databaseId
+    id
+    name
+    nameWithOwner
+    isPrivate
+    isFork
+    isArchived
+    description
+    url
+    createdAt
+    updatedAt
+    pushedAt
+    stargazerCount
+    forkCount
+    primaryLanguage { name }
+    defaultBranchRef { name }
+    issues(states: OPEN) { totalCount }
+    owner { login id avatarUrl url __typename }
+"""
+
+
+def graphql_url() -> str:
+    # Read at call time so that the collector's base URL can be overridden
+    from src.engineering.github import collector
+
+    return collector.API_BASEURL + "/graphql"
+
+
+def format_timestamp(value: Union[str, date, datetime, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    if value.tzinfo is None:
+        return value.isoformat() + "Z"
+    return value.isoformat()
+
+
+@dataclass
+class BatchRequest:
+    kind: str
+    repository: "Repository"
+    variables: Dict[str, Any]
+    future: asyncio.Future = field(repr=False)
+
+
+def build_query(batch: List[BatchRequest]):
+    declarations = []
+    selections = []
+    variables: Dict[str, Any] = {}
+
+    for i, request in enumerate(batch):
+        declarations += [f"$owner{i}: String!", f"$name{i}: String!"]
+        variables[f"owner{i}"] = request.repository.owner
+        variables[f"name{i}"] = request.repository.name
+
+        if request.kind == "commits":
+            declarations += [
+                f"$since{i}: GitTimestamp",
+                f"$until{i}: GitTimestamp",
+                f"$cursor{i}: String",
+            ]
+            variables[f"since{i}"] = request.variables.get("since")
+            variables[f"until{i}"] = request.variables.get("until")
+            variables[f"cursor{i}"] = request.variables.get("cursor")
+            selection = COMMITS_SELECTION.replace("{i}", str(i))
+        else:
+            selection = REPOSITORY_SELECTION
+
+        selections.append(
+            f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{{selection}}}"
+        )
+
+    query = (
+        f"query({', '.join(declarations)}) {{\n"
+        + "\n".join(selections)
+        + "\nrateLimit { cost remaining resetAt }\n}"
+    )
+    return query, variables
+
+
+# Collects the requests of concurrently running per-repository generators
+# and sends them as one aliased GraphQL query of up to batch_size repositories
+class GraphQLBatcher:
+    def __init__(
+        self,
+        client: GithubClient,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        linger: float = DEFAULT_LINGER_SECONDS,
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.linger = linger
+        self.pending: List[BatchRequest] = []
+        self.tasks: set = set()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    async def fetch(
+        self, kind: str, repository: "Repository", variables: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append(BatchRequest(kind, repository, variables, future))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.linger, self.flush)
+
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        while self.pending:
+            batch = self.pending[: self.batch_size]
+            self.pending = self.pending[self.batch_size :]
+            task = asyncio.ensure_future(self.run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self, batch: List[BatchRequest]):
+        query, variables = build_query(batch)
+        try:
+            resp = await self.client.post(
+                graphql_url(), {"query": query, "variables": variables}
+            )
+            resp.raise_for_status()
+            payload = resp.json()
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        data = payload.get("data") or {}
+        errors: Dict[str, List[str]] = {}
+        for error in payload.get("errors", []):
+            alias = (error.get("path") or ["query"])[0]
+            errors.setdefault(alias, []).append(error.get("message", ""))
+
+        for i, request in enumerate(batch):
+            if request.future.done():
+                continue
+            alias = f"r{i}"
+            node = data.get(alias)
+            if node is None or alias in errors:
+                messages = errors.get(alias) or errors.get("query") or ["no data"]
+                request.future.set_exception(
+                    GithubApiError(
+                        f"GraphQL {request.kind} for {request.repository.owner}/"
+                        f"{request.repository.name} failed: {'; '.join(messages)}"
+                    )
+                )
+            else:
+                request.future.set_result(node)
+
+
+_batchers: "WeakKeyDictionary[GithubClient, GraphQLBatcher]" = WeakKeyDictionary()
+
+
+def get_batcher(client: GithubClient) -> GraphQLBatcher:
+    if client not in _batchers:
+        _batchers[client] = GraphQLBatcher(client)
+    return _batchers[client]
+
+
+def _user_to_rest(user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not user:
+        return None
+
+    from src.engineering.github.collector import construct_api_url
+
+    return {
+        "login": user["login"],
+        "id": user["databaseId"],
+        "node_id": user["id"],
+        "avatar_url": user["avatarUrl"],
+        "url": construct_api_url("users", user["login"]),
+        "html_url": "https://github.com/" + user["login"],
+        "type": user["__typename"],
+        "user_view_type": None,
+        "site_admin": user["isSiteAdmin"],
+    }
+
+
+def _utc_timestamp(value: str) -> str:
+    # GitTimestamps keep the committer's offset, REST dates are UTC with a Z
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _git_actor(actor: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": actor["name"],
+        "email": actor["email"],
+        "date": _utc_timestamp(actor["date"]),
+    }
+
+
+def commit_to_rest(node: Dict[str, Any], repository: "Repository") -> Dict[str, Any]:
+    return {
+        "sha": node["oid"],
+        "node_id": node["id"],
+        "commit": {
+            "author": _git_actor(node["author"]),
+            "committer": _git_actor(node["committer"]),
+            "message": node["message"],
+            "tree": {"sha": node["tree"]["oid"]},
+        },
+        "html_url": node["url"],
+        "author": _user_to_rest(node["author"].get("user")),
+        "committer": _user_to_rest(node["committer"].get("user")),
+        "parents": [
+            {"sha": parent["oid"], "html_url": parent["url"]}
+            for parent in node["parents"]["nodes"]
+        ],
+        "repo": repository.owner + "/" + repository.name,
+    }
+
+
+def repository_to_rest(node: Dict[str, Any]) -> Dict[str, Any]:
+    owner = node["owner"]
+    return {
+        "id": node["databaseId"],
+        "node_id": node["id"],
+        "name": node["name"],
+        "full_name": node["nameWithOwner"],
+        "private": node["isPrivate"],
+        "fork": node["isFork"],
+        "archived": node["isArchived"],
+        "description": node["description"],
+        "html_url": node["url"],
+        "created_at": node["createdAt"],
+        "updated_at": node["updatedAt"],
+        "pushed_at": node["pushedAt"],
+        "stargazers_count": node["stargazerCount"],
+        "watchers_count": node["stargazerCount"],
+        "forks_count": node["forkCount"],
+        "open_issues_count": node["issues"]["totalCount"],
+        "language": (node["primaryLanguage"] or {}).get("name"),
+        "default_branch": (node["defaultBranchRef"] or {}).get("name"),
+        "owner": {
+            "login": owner["login"],
+            "node_id": owner["id"],
+            "avatar_url": owner["avatarUrl"],
+            "html_url": owner["url"],
+            "type": owner["__typename"],
+        },
+    }
+
+
+async def collect_repositories(
+    client: GithubClient,
+    repository: "Repository",
+    since: datetime,
+    until: datetime,
+    fan_out: bool = False,
+):
+    node = await get_batcher(client).fetch("repos", repository, {})
+    yield [repository_to_rest(node)]
+
+
+async def collect_commits(
+    client: GithubClient,
+    repository: "Repository",
+    since: datetime,
+    until: datetime,
+    fan_out: bool = False,
+):
+    batcher = get_batcher(client)
+    cursor = None
+    while True:
+        node = await batcher.fetch(
+            "commits",
+            repository,
+            {
+                "since": format_timestamp(since),
+                "until": format_timestamp(until),
+                "cursor": cursor,
+            },
+        )
+        # Empty repositories have no default branch
+        if not node.get("defaultBranchRef"):
+            return
+
+        history = node["defaultBranchRef"]["target"]["history"]
+        yield [commit_to_rest(commit, repository) for commit in history["nodes"]]
+
+        if not history["pageInfo"]["hasNextPage"]:
+            return
+        cursor = history["pageInfo"]["endCursor"]
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Mapping, Optional
+
+# GitHub's documented primary limit for an authenticated token, used until
+# the first response tells us the real numbers
+DEFAULT_RATE_LIMIT = 5000
+# Requests kept in hand per token so concurrent pages do not overshoot to 0
+DEFAULT_RESERVE = 10
+# GitHub asks to wait at least a minute after a secondary rate limit
+SECONDARY_LIMIT_WAIT_SECONDS = 60
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+
+
+@dataclass
+class TokenBudget:
+    token: Optional[str]
+    limit: int = DEFAULT_RATE_LIMIT
+    remaining: int = DEFAULT_RATE_LIMIT
+    reset_at: float = 0.0
+    blocked_until: float = 0.0
+    in_flight: int = 0
+
+    def available(self, now: float, reserve: int) -> int:
+        if self.blocked_until > now:
+            return 0
+        if self.reset_at and self.reset_at <= now:
+            self.remaining = self.limit
+            self.reset_at = 0.0
+        return self.remaining - self.in_flight - reserve
+
+    def ready_at(self, now: float, reserve: int) -> float:
+        ready = max(self.blocked_until, now)
+        if self.remaining - self.in_flight - reserve <= 0 and self.reset_at:
+            ready = max(ready, self.reset_at)
+        return ready
+
+
+def read_tokens_from_env() -> List[Optional[str]]:
+    tokens = [t.strip() for t in os.environ.get("GITHUB_TOKENS", "").split(",")]
+    tokens = [t for t in tokens if t]
+    if not tokens and os.environ.get("GITHUB_TOKEN"):
+        tokens = [os.environ["GITHUB_TOKEN"]]
+
+    # Unauthenticated requests still work against public repositories
+    return tokens or [None]
+
+
+def _graphql_rate_limited(content: bytes) -> bool:
+    # GraphQL reports an exhausted budget as a 200 with a RATE_LIMITED error;
+    # the cheap substring check keeps REST pages from being parsed twice
+    if b"RATE_LIMITED" not in content:
+        return False
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        return False
+    return isinstance(payload, dict) and any(
+        isinstance(error, dict) and error.get("type") == "RATE_LIMITED"
+        for error in payload.get("errors") or []
+    )
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+class RateLimitScheduler:
+    def __init__(
+        self,
+        tokens: Optional[List[Optional[str]]] = None,
+        reserve: int = DEFAULT_RESERVE,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.budgets = [
+            TokenBudget(token=t) for t in (tokens or read_tokens_from_env())
+        ]
+        self.reserve = reserve
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    async def acquire(self) -> TokenBudget:
+        while True:
+            now = time.time()
+            budget = max(self.budgets, key=lambda b: b.available(now, self.reserve))
+            if budget.available(now, self.reserve) > 0:
+                budget.in_flight += 1
+                return budget
+
+            ready_at = min(b.ready_at(now, self.reserve) for b in self.budgets)
+            await asyncio.sleep(max(ready_at - now, 0.05))
+
+    def release(
+        self,
+        budget: TokenBudget,
+        status_code: Optional[int] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        content: bytes = b"",
+    ):
+        budget.in_flight -= 1
+        if headers is None:
+            return
+
+        now = time.time()
+        limit = _header_int(headers, "X-RateLimit-Limit")
+        remaining = _header_int(headers, "X-RateLimit-Remaining")
+        reset_at = _header_int(headers, "X-RateLimit-Reset")
+        if limit is not None:
+            budget.limit = limit
+        if remaining is not None:
+            budget.remaining = remaining
+        if reset_at is not None:
+            budget.reset_at = float(reset_at)
+
+        if not self.is_rate_limited(status_code, headers, content):
+            return
+
+        retry_after = _header_int(headers, "Retry-After")
+        if retry_after is not None:
+            budget.blocked_until = now + retry_after
+        elif remaining == 0 and reset_at is not None:
+            budget.blocked_until = float(reset_at)
+        else:
+            budget.blocked_until = now + SECONDARY_LIMIT_WAIT_SECONDS
+
+    @staticmethod
+    def is_rate_limited(
+        status_code: Optional[int], headers: Mapping[str, str], content: bytes = b""
+    ) -> bool:
+        if status_code == 200:
+            return _graphql_rate_limited(content)
+        if status_code not in (403, 429):
+            return False
+        if status_code == 429 or "Retry-After" in headers:
+            return True
+        if headers.get("X-RateLimit-Remaining") == "0":
+            return True
+        return b"rate limit" in content.lower()
+
+    def should_retry(
+        self, status_code: int, headers: Mapping[str, str], content: bytes = b""
+    ) -> bool:
+        return status_code in RETRYABLE_STATUS_CODES or self.is_rate_limited(
+            status_code, headers, content
+        )
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries of many concurrent pages from lining up
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
@@ -0,0 +1,417 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlencode
+
+from aiohttp import web
+from loguru import logger
+
+from src.engineering.github.cassette import Cassette, interaction_key
+from src.engineering.github.watermarks import parse_timestamp
+
+DEFAULT_ROWS_PER_REPO = 250
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+# Recorded bodies point at GitHub, served pages point back at the stand-in
+RECORDED_BASEURL = "https://api.github.com"
+SYNTHETIC_SINCE = "2024-01-01T00:00:00Z"
+SYNTHETIC_UNTIL = "2024-01-31T00:00:00Z"
+
+# Anything with async start() and stop(), like StandinServer
+Server = TypeVar("Server")
+
+
+@dataclass
+class StandinConfig:
+    rows_per_repo: int = DEFAULT_ROWS_PER_REPO
+    # Seconds added to every response, uniformly spread over +-latency_jitter
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # Share of requests answered with a 502 or a secondary rate limit
+    error_rate: float = 0.0
+    rate_limited_rate: float = 0.0
+    retry_after: int = 1
+    # Primary rate limit per token (Authorization header)
+    rate_limit: int = 5000
+    rate_limit_window: int = 3600
+    cassette_path: Optional[Path] = None
+    seed: int = 0
+
+
+@dataclass
+class StandinStats:
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    not_modified: int = 0
+    replayed: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} requests, {self.replayed} replayed, "
+            f"{self.not_modified} not modified, {self.errors} errors and "
+            f"{self.rate_limited} rate limits injected"
+        )
+
+
+@dataclass
+class _Budget:
+    remaining: int
+    reset_at: int
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _user(login: str) -> Dict[str, Any]:
+    user_id = int(hashlib.sha1(login.encode()).hexdigest()[:8], 16)
+    return {
+        "login": login,
+        "id": user_id,
+        "node_id": f"U_{user_id}",
+        "type": "User",
+        "site_admin": False,
+    }
+
+
+def synthetic_commit(full_name: str, i: int, date: str) -> Dict[str, Any]:
+    sha = hashlib.sha1(f"{full_name}:{i}".encode()).hexdigest()
+    login = f"user{i % 7}"
+    actor = {"name": login, "email": f"{login}@example.com", "date": date}
+    return {
+        "sha": sha,
+        "node_id": f"C_{sha[:16]}",
+        "commit": {
+            "author": actor,
+            "committer": actor,
+            "message": f"Commit {i} of {full_name}",
+            "tree": {"sha": hashlib.sha1(sha.encode()).hexdigest()},
+        },
+        "html_url": f"https://github.com/{full_name}/commit/{sha}",
+        "author": _user(login),
+        "committer": _user(login),
+        "parents": [],
+    }
+
+
+def synthetic_issue(full_name: str, i: int, date: str) -> Dict[str, Any]:
+    issue_id = int(hashlib.sha1(f"{full_name}#{i}".encode()).hexdigest()[:8], 16)
+    closed = i % 3 != 0
+    return {
+        "id": issue_id,
+        "node_id": f"I_{issue_id}",
+        "number": i + 1,
+        "title": f"Issue {i + 1} of {full_name}",
+        "state": "closed" if closed else "open",
+        "user": _user(f"user{i % 5}"),
+        "labels": [{"name": "bug"}] if i % 4 == 0 else [],
+        "created_at": date,
+        "updated_at": date,
+        "closed_at": date if closed else None,
+    }
+
+
+def synthetic_repository(owner: str, name: str) -> Dict[str, Any]:
+    full_name = f"{owner}/{name}"
+    repo_id = int(hashlib.sha1(full_name.encode()).hexdigest()[:8], 16)
+    return {
+        "id": repo_id,
+        "node_id": f"R_{repo_id}",
+        "name": name,
+        "full_name": full_name,
+        "private": False,
+        "owner": _user(owner),
+        "created_at": SYNTHETIC_SINCE,
+        "updated_at": SYNTHETIC_UNTIL,
+        "stargazers_count": repo_id % 1000,
+        "open_issues_count": repo_id % 50,
+    }
+
+
+# A local stand-in for the parts of api.github.com the collector uses. It
+# answers from a recorded cassette when it holds the request and otherwise
+# generates rows_per_repo deterministic commits or issues per repository,
+# spread newest first over the requested since/until window. Pages carry
+# GitHub's Link, ETag and rate limit headers, and latency, 5xx errors and
+# secondary rate limits can be injected.
+class StandinServer:
+    def __init__(
+        self,
+        config: Optional[StandinConfig] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.config = config or StandinConfig()
+        self.host = host
+        self.port = port
+        self.stats = StandinStats()
+        self.random = random.Random(self.config.seed)
+        self.budgets: Dict[str, _Budget] = {}
+        self.cassette = (
+            Cassette(self.config.cassette_path, mode="replay")
+            if self.config.cassette_path
+            else None
+        )
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/repos/{owner}/{name}", self.handle_repository)
+        app.router.add_get(
+            "/repos/{owner}/{name}/{kind:commits|issues}", self.handle_list
+        )
+        return app
+
+    async def start(self) -> str:
+        self.runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        await web.SockSite(self.runner, sock).start()
+        self.port = sock.getsockname()[1]
+        self.url = f"http://{self.host}:{self.port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+        self.runner = None
+
+    async def __aenter__(self) -> "StandinServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _take_budget(self, request: web.Request) -> Tuple[Dict[str, str], bool]:
+        token = request.headers.get("Authorization", "anonymous")
+        now = int(time.time())
+        budget = self.budgets.get(token)
+        if budget is None or budget.reset_at <= now:
+            budget = _Budget(
+                self.config.rate_limit, now + self.config.rate_limit_window
+            )
+            self.budgets[token] = budget
+
+        exhausted = budget.remaining <= 0
+        if not exhausted:
+            budget.remaining -= 1
+        headers = {
+            "X-RateLimit-Limit": str(self.config.rate_limit),
+            "X-RateLimit-Remaining": str(budget.remaining),
+            "X-RateLimit-Reset": str(budget.reset_at),
+        }
+        return headers, exhausted
+
+    async def _inject(
+        self, request: web.Request
+    ) -> Tuple[Optional[web.Response], Dict[str, str]]:
+        self.stats.requests += 1
+        config = self.config
+        if config.latency or config.latency_jitter:
+            delay = config.latency + self.random.uniform(
+                -config.latency_jitter, config.latency_jitter
+            )
+            await asyncio.sleep(max(delay, 0))
+
+        headers, exhausted = self._take_budget(request)
+        if exhausted:
+            self.stats.rate_limited += 1
+            return (
+                web.json_response(
+                    {"message": "API rate limit exceeded"}, status=403, headers=headers
+                ),
+                headers,
+            )
+
+        roll = self.random.random()
+        if roll < config.error_rate:
+            self.stats.errors += 1
+            return web.json_response({"message": "Server Error"}, status=502), headers
+        if roll < config.error_rate + config.rate_limited_rate:
+            self.stats.rate_limited += 1
+            headers["Retry-After"] = str(config.retry_after)
+            return (
+                web.json_response(
+                    {"message": "You have exceeded a secondary rate limit"},
+                    status=403,
+                    headers=headers,
+                ),
+                headers,
+            )
+
+        return None, headers
+
+    def _respond(
+        self,
+        request: web.Request,
+        body: bytes,
+        headers: Dict[str, str],
+        rate_limit_headers: Dict[str, str],
+    ) -> web.Response:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        headers = {**rate_limit_headers, **headers, "ETag": etag}
+        if request.headers.get("If-None-Match") == etag:
+            self.stats.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, headers=headers, content_type="application/json")
+
+    def _replay(
+        self, request: web.Request, rate_limit_headers: Dict[str, str]
+    ) -> Optional[web.Response]:
+        if self.cassette is None:
+            return None
+        interaction = self.cassette.find(interaction_key("GET", str(request.rel_url)))
+        if interaction is None:
+            return None
+
+        self.stats.replayed += 1
+        base_url = f"{request.scheme}://{request.host}"
+        headers = {
+            name: value.replace(RECORDED_BASEURL, base_url)
+            for name, value in interaction["headers"].items()
+            if name in ("Link", "Last-Modified")
+        }
+        body = interaction["body"].encode()
+        if interaction["status"] != 200:
+            return web.Response(
+                status=interaction["status"],
+                body=body,
+                content_type="application/json",
+            )
+        return self._respond(request, body, headers, rate_limit_headers)
+
+    async def handle_repository(self, request: web.Request) -> web.Response:
+        injected, rate_limit_headers = await self._inject(request)
+        if injected is not None:
+            return injected
+        replayed = self._replay(request, rate_limit_headers)
+        if replayed is not None:
+            return replayed
+
+        owner, name = request.match_info["owner"], request.match_info["name"]
+        body = json.dumps(synthetic_repository(owner, name)).encode()
+        return self._respond(request, body, {}, rate_limit_headers)
+
+    async def handle_list(self, request: web.Request) -> web.Response:
+        injected, rate_limit_headers = await self._inject(request)
+        if injected is not None:
+            return injected
+        replayed = self._replay(request, rate_limit_headers)
+        if replayed is not None:
+            return replayed
+
+        owner, name = request.match_info["owner"], request.match_info["name"]
+        kind = request.match_info["kind"]
+        query = request.query
+        per_page = min(int(query.get("per_page", DEFAULT_PER_PAGE)), MAX_PER_PAGE)
+        page = max(int(query.get("page", 1)), 1)
+        total = self.config.rows_per_repo
+        last_page = max((total + per_page - 1) // per_page, 1)
+
+        since = parse_timestamp(query.get("since") or SYNTHETIC_SINCE)
+        until = parse_timestamp(query.get("until") or SYNTHETIC_UNTIL)
+        step = (until - since) / max(total, 1)
+        make_row = synthetic_commit if kind == "commits" else synthetic_issue
+        rows = [
+            make_row(f"{owner}/{name}", i, _timestamp(until - step * (i + 1)))
+            for i in range((page - 1) * per_page, min(page * per_page, total))
+        ]
+
+        headers = {}
+        links = self._links(request, page, last_page)
+        if links:
+            headers["Link"] = links
+        body = json.dumps(rows).encode()
+        return self._respond(request, body, headers, rate_limit_headers)
+
+    def _links(self, request: web.Request, page: int, last_page: int) -> str:
+        base_url = f"{request.scheme}://{request.host}{request.path}"
+
+        def link(page_number: int, rel: str) -> str:
+            query = {**request.query, "page": str(page_number)}
+            return f'<{base_url}?{urlencode(query)}>; rel="{rel}"'
+
+        links: List[str] = []
+        if page < last_page:
+            links += [link(page + 1, "next"), link(last_page, "last")]
+        if page > 1:
+            links += [link(1, "first"), link(page - 1, "prev")]
+        return ", ".join(links)
+
+
+@contextmanager
+def run_in_thread(server: Server) -> Iterator[Server]:
+    # Runs a server with async start and stop on its own event loop, so
+    # code that calls asyncio.run itself (like collector.main) can talk to it
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+@contextmanager
+def serve_in_thread(config: Optional[StandinConfig] = None) -> Iterator[StandinServer]:
+    with run_in_thread(StandinServer(config)) as server:
+        yield server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--rows-per-repo", type=int, default=DEFAULT_ROWS_PER_REPO)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limited-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=5000)
+    parser.add_argument(
+        "--cassette",
+        type=Path,
+        help="Recorded responses served before falling back to synthetic ones",
+    )
+    args = parser.parse_args()
+
+    standin = StandinServer(
+        StandinConfig(
+            rows_per_repo=args.rows_per_repo,
+            latency=args.latency,
+            latency_jitter=args.latency_jitter,
+            error_rate=args.error_rate,
+            rate_limited_rate=args.rate_limited_rate,
+            rate_limit=args.rate_limit,
+            cassette_path=args.cassette,
+        ),
+        port=args.port,
+    )
+    logger.info(f"Serving on http://127.0.0.1:{args.port}, point GITHUB_API_URL at it")
+    web.run_app(standin.make_app(), host="127.0.0.1", port=args.port, print=None)
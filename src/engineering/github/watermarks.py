@@ -0,0 +1,53 @@
+import json
+import os
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+
+def parse_timestamp(value: str) -> datetime:
+    # GitHub timestamps are UTC with a trailing Z, which fromisoformat only
+    # accepts from Python 3.11 onwards
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def as_datetime(value: Union[date, datetime]) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.combine(value, time.min)
+
+
+def window_start(watermark: str) -> date:
+    # Incremental windows start at the day of the watermark rather than at the
+    # watermark itself, so reruns within a day ask GitHub for the same pages
+    # and the response cache can revalidate them
+    return parse_timestamp(watermark).date()
+
+
+# Newest partition timestamp seen per (source, repository), persisted as
+# JSON so the next run only asks GitHub for what happened after it.
+class WatermarkStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.watermarks: Dict[str, Dict[str, str]] = {}
+        if self.path.exists():
+            with open(self.path, "r") as in_file:
+                self.watermarks = json.load(in_file)
+
+    def get(self, source: str, repo: str) -> Optional[str]:
+        return self.watermarks.get(source, {}).get(repo)
+
+    def advance(self, source: str, repo: str, value: str):
+        current = self.get(source, repo)
+        if current is None or parse_timestamp(value) > parse_timestamp(current):
+            self.watermarks.setdefault(source, {})[repo] = value
+
+    def clear(self, source: str):
+        self.watermarks.pop(source, None)
+
+    def save(self):
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as out_file:
+            json.dump(self.watermarks, out_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,199 @@
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from loguru import logger
+
+from src.engineering.github.dedup import DedupIndex, row_key
+from src.storage import DEFAULT_BUFFER_SIZE, RAW_FORMATS
+
+DEFAULT_MAX_OPEN_HANDLES = 64
+
+
+def get_nested_value(data, path):
+    keys = path.split(".")
+    value = data
+    try:
+        for key in keys:
+            value = value[key]
+        return value
+    except (KeyError, TypeError):
+        return None
+
+
+@dataclass
+class WriterStats:
+    rows: int = 0
+    bytes: int = 0
+    partitions: int = 0
+    duplicates: int = 0
+    started_at: float = field(default_factory=time.time)
+
+    def __str__(self) -> str:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return (
+            f"{self.rows} rows, {self.bytes / 1024 / 1024:.2f} MB, "
+            f"{self.partitions} partitions in {elapsed:.2f} seconds "
+            f"({self.rows / elapsed:.0f} rows/s, "
+            f"{self.bytes / 1024 / 1024 / elapsed:.2f} MB/s, "
+            f"{self.partitions / elapsed:.1f} partitions/s), "
+            f"{self.duplicates} duplicate rows skipped"
+        )
+
+
+@dataclass
+class _Partition:
+    final_path: Path
+    tmp_path: Path
+    initial_size: int = 0
+    seeded: bool = False
+
+
+# Writes rows into YYYY/MM/DD partitions under destination. Every partition
+# is written to a hidden temp file (seeded with the existing data when its
+# first row arrives) through a bounded LRU of open, buffered handles, and
+# commit() renames the temp files into place, so readers never see a
+# half-written partition. Partitions that got no rows, for example because
+# dedup skipped all of them, are left untouched. With overwrite
+# the committed partitions replace the existing ones instead of extending them.
+# With a dedup index, rows already held by a partition are skipped, and the
+# index records the new rows only when their partitions are committed.
+class PartitionWriter:
+    def __init__(
+        self,
+        destination: Path,
+        partition_column_path: Optional[str],
+        raw_format: str = "json",
+        max_open_handles: int = DEFAULT_MAX_OPEN_HANDLES,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        overwrite: bool = False,
+        dedup: Optional[DedupIndex] = None,
+        source: Optional[str] = None,
+    ):
+        self.overwrite = overwrite
+        self.dedup = dedup
+        self.source = source
+        self.destination = Path(destination)
+        self.partition_column_path = partition_column_path
+        self.storage_format = RAW_FORMATS[raw_format]
+        self.max_open_handles = max_open_handles
+        self.buffer_size = buffer_size
+        self.partitions: Dict[str, _Partition] = {}
+        self.handles: "OrderedDict[str, Any]" = OrderedDict()
+        self.stats = WriterStats()
+
+    def __enter__(self) -> "PartitionWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def partition_key(self, row: Dict[str, Any]) -> str:
+        if self.partition_column_path is None:
+            return ""
+        value = get_nested_value(row, self.partition_column_path)
+        return str(value)[:10].replace("-", "/")
+
+    def write(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            key = self.partition_key(row)
+            if self.dedup is not None and not self._is_new(key, row):
+                self.stats.duplicates += 1
+                continue
+            self._handle(key).write(row)
+            self.stats.rows += 1
+
+    def _is_new(self, key: str, row: Dict[str, Any]) -> bool:
+        row_id = row_key(self.source, row)
+        if row_id is None:
+            return True
+        partition = self.partitions.get(key) or self._start_partition(key)
+        return self.dedup.add(self.source, row_id, str(partition.final_path))
+
+    def _handle(self, key: str):
+        handle = self.handles.get(key)
+        if handle is not None:
+            self.handles.move_to_end(key)
+            return handle
+
+        partition = self.partitions.get(key)
+        if partition is None:
+            partition = self._start_partition(key)
+        if not partition.seeded:
+            self._seed(partition)
+
+        if len(self.handles) >= self.max_open_handles:
+            _, evicted = self.handles.popitem(last=False)
+            evicted.close()
+
+        handle = self.storage_format.open_sink(partition.tmp_path, self.buffer_size)
+        self.handles[key] = handle
+        return handle
+
+    def _start_partition(self, key: str) -> _Partition:
+        out_dirpath = self.destination / key if key else self.destination
+        os.makedirs(out_dirpath, exist_ok=True)
+        final_path = out_dirpath / self.storage_format.filename
+        tmp_path = (
+            out_dirpath / f".{self.storage_format.filename}.{uuid.uuid4().hex}.tmp"
+        )
+
+        if self.dedup is not None:
+            self.dedup.ensure_partition(self.source, final_path)
+
+        partition = _Partition(final_path, tmp_path)
+        self.partitions[key] = partition
+        return partition
+
+    def _seed(self, partition: _Partition):
+        if partition.final_path.exists() and not self.overwrite:
+            shutil.copyfile(partition.final_path, partition.tmp_path)
+            partition.initial_size = os.path.getsize(partition.tmp_path)
+        partition.seeded = True
+        self.stats.partitions += 1
+
+    def _close_handles(self):
+        while self.handles:
+            _, handle = self.handles.popitem(last=False)
+            handle.close()
+
+    def commit(self):
+        try:
+            self._close_handles()
+            for partition in self.partitions.values():
+                if partition.seeded and partition.tmp_path.exists():
+                    self.stats.bytes += (
+                        os.path.getsize(partition.tmp_path) - partition.initial_size
+                    )
+                    os.replace(partition.tmp_path, partition.final_path)
+        except BaseException:
+            # Don't leave the temp files of the partitions not yet renamed
+            self.abort()
+            raise
+        if self.dedup is not None:
+            self.dedup.commit(
+                self.source, [p.final_path for p in self.partitions.values()]
+            )
+        self.partitions = {}
+
+    def abort(self):
+        try:
+            self._close_handles()
+        finally:
+            for partition in self.partitions.values():
+                if partition.tmp_path.exists():
+                    os.remove(partition.tmp_path)
+            self.partitions = {}
+            if self.dedup is not None:
+                self.dedup.rollback()
+
+    def log_stats(self):
+        logger.info(f"Wrote {self.stats}")
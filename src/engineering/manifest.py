@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from datetime import date
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import psycopg
+
+from src import storage
+
+MANIFEST_DDL_PATH = Path("sql/github/ddl/load_manifest_t.sql")
+PARTITION_DATE_PATTERN = re.compile(r"(\d{4})/(\d{2})/(\d{2})")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class FileState:
+    path: Path
+    size: int
+    mtime_ns: int
+    content_hash: Optional[str] = None
+
+
+def content_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as in_file:
+        for block in iter(lambda: in_file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def partition_date(path: Path) -> Optional[date]:
+    match = PARTITION_DATE_PATTERN.search(Path(path).as_posix())
+    if match is None:
+        return None
+    return date(*map(int, match.groups()))
+
+
+# Raw files already loaded into a target (the tables a set of load scripts
+# writes), with the size, mtime and content hash they had at the time. Only
+# new or changed files are staged again; the mtime lets unchanged files skip
+# hashing, and a file whose mtime moved but whose content did not (dvc
+# checkout) is recognised by its hash.
+class LoadManifest:
+    def __init__(self, target: str):
+        self.target = target
+        self.entries: Dict[str, Tuple[int, int, str]] = {}
+        self.refreshed: List[FileState] = []
+
+    def read(self, cur: psycopg.Cursor):
+        cur.execute("SELECT to_regclass('public.load_manifest')")
+        if cur.fetchone()[0] is None:  # type: ignore
+            with open(MANIFEST_DDL_PATH, "r") as f:
+                cur.execute(f.read())  # type: ignore
+
+        cur.execute(
+            "SELECT path, size, mtime_ns, content_hash FROM public.load_manifest "
+            "WHERE target = %s",
+            (self.target,),
+        )
+        self.entries = {
+            path: (size, mtime_ns, hash) for path, size, mtime_ns, hash in cur
+        }
+
+    def changed(
+        self, files: List[Path], since: Optional[date] = None, force: bool = False
+    ) -> List[FileState]:
+        pending = []
+        self.refreshed = []
+        for file in files:
+            stat = os.stat(file)
+            state = FileState(file, stat.st_size, stat.st_mtime_ns)
+            entry = self.entries.get(str(file))
+            file_date = partition_date(file)
+            reload = force or (
+                since is not None and file_date is not None and file_date >= since
+            )
+
+            if not reload and entry is not None and entry[0] == state.size:
+                if entry[1] == state.mtime_ns:
+                    continue
+                state.content_hash = content_hash(file)
+                if entry[2] == state.content_hash:
+                    self.refreshed.append(state)
+                    continue
+
+            if state.content_hash is None:
+                state.content_hash = content_hash(file)
+            pending.append(state)
+        return pending
+
+    def record(
+        self,
+        cur: psycopg.Cursor,
+        states: List[FileState],
+        rowcounts: Dict[Path, int],
+    ):
+        cur.executemany(
+            """
+            INSERT INTO public.load_manifest
+                (path, target, size, mtime_ns, content_hash, loaded_at, rowcount)
+            VALUES (%s, %s, %s, %s, %s, now() AT TIME ZONE 'utc', %s)
+            ON CONFLICT (path, target) DO UPDATE SET
+                size = EXCLUDED.size,
+                mtime_ns = EXCLUDED.mtime_ns,
+                content_hash = EXCLUDED.content_hash,
+                loaded_at = EXCLUDED.loaded_at,
+                rowcount = EXCLUDED.rowcount
+            """,
+            [
+                (
+                    str(state.path),
+                    self.target,
+                    state.size,
+                    state.mtime_ns,
+                    state.content_hash,
+                    rowcounts.get(state.path, 0),
+                )
+                for state in states
+            ],
+        )
+
+    def refresh(self, cur: psycopg.Cursor):
+        cur.executemany(
+            "UPDATE public.load_manifest SET mtime_ns = %s "
+            "WHERE path = %s AND target = %s",
+            [(s.mtime_ns, str(s.path), self.target) for s in self.refreshed],
+        )
+        for state in self.refreshed:
+            size, _, file_hash = self.entries[str(state.path)]
+            self.entries[str(state.path)] = (size, state.mtime_ns, file_hash)
+
+
+def plan_batches(
+    pending: List[FileState],
+    batch_partitions: Optional[int] = None,
+    batch_rows: Optional[int] = None,
+) -> Iterator[List[FileState]]:
+    # Files in partition order, cut before a batch would span more than
+    # batch_partitions partitions or hold more than batch_rows rows. A
+    # partition is never split, so it is the smallest batch.
+    def partition_key(state: FileState):
+        return partition_date(state.path) or date.min
+
+    batch: List[FileState] = []
+    partitions = 0
+    rows = 0
+    ordered = sorted(pending, key=lambda state: (partition_key(state), state.path))
+    for _, group in groupby(ordered, key=partition_key):
+        states = list(group)
+        group_rows = (
+            sum(storage.count_rows(state.path) for state in states) if batch_rows else 0
+        )
+        if batch and (
+            (batch_partitions and partitions >= batch_partitions)
+            or (batch_rows and rows + group_rows > batch_rows)
+        ):
+            yield batch
+            batch, partitions, rows = [], 0, 0
+        batch.extend(states)
+        partitions += 1
+        rows += group_rows
+    if batch:
+        yield batch
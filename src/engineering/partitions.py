@@ -0,0 +1,137 @@
+import re
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import psycopg
+from loguru import logger
+from psycopg.sql import SQL, Identifier, Literal
+
+# Monthly range partitioned tables and their partition column
+PARTITIONED_TABLES: Dict[str, str] = {
+    "commits": "created_at",
+    "issues": "updated_at",
+    "daily_issues": "date",
+}
+# Months created in advance, so current rows never land in the default
+PARTITIONS_AHEAD = 3
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    month = value.year * 12 + value.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def create_partition(cur: psycopg.Cursor, table: str, month: date) -> bool:
+    name = partition_name(table, month)
+    cur.execute("SELECT to_regclass(%s)", (f"public.{name}",))
+    if cur.fetchone()[0] is not None:  # type: ignore
+        return False
+
+    column = PARTITIONED_TABLES[table]
+    upper = add_months(month, 1)
+    parent = Identifier("public", table)
+    partition = Identifier("public", name)
+    cur.execute(
+        SQL(
+            "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        ).format(partition, parent)
+    )
+    # Rows of the month that landed in the default partition move into the
+    # new one, otherwise attaching it would violate the default's bounds
+    cur.execute(
+        SQL(
+            "WITH moved AS (DELETE FROM {} WHERE {} >= %s AND {} < %s RETURNING *) "
+            "INSERT INTO {} SELECT * FROM moved"
+        ).format(
+            Identifier("public", f"{table}_default"),
+            Identifier(column),
+            Identifier(column),
+            partition,
+        ),
+        (month, upper),
+    )
+    if cur.rowcount:
+        logger.info(f"Moved {cur.rowcount} rows from {table}_default to {name}")
+    cur.execute(
+        SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+            parent, partition, Literal(month), Literal(upper)
+        )
+    )
+    logger.info(f"Created partition {name}")
+    return True
+
+
+def ensure_partitions(
+    cur: psycopg.Cursor,
+    tables: Optional[Iterable[str]] = None,
+    today: Optional[date] = None,
+):
+    # Creates the partitions of the coming months and of every month that
+    # has rows waiting in the default partition (backfilled history)
+    this_month = month_start(today or date.today())
+    for table in tables or PARTITIONED_TABLES:
+        column = PARTITIONED_TABLES[table]
+        cur.execute(
+            SQL(
+                "SELECT DISTINCT date_trunc('month', {})::date FROM {} "
+                "WHERE {} IS NOT NULL"
+            ).format(
+                Identifier(column),
+                Identifier("public", f"{table}_default"),
+                Identifier(column),
+            )
+        )
+        months = {month for (month,) in cur.fetchall()}
+        months.update(add_months(this_month, i) for i in range(PARTITIONS_AHEAD + 1))
+        for month in sorted(months):
+            create_partition(cur, table, month)
+
+
+def list_partitions(cur: psycopg.Cursor, table: str) -> Dict[date, str]:
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass",
+        (f"public.{table}",),
+    )
+    pattern = re.compile(rf"^{re.escape(table)}_(\d{{4}})_(\d{{2}})$")
+    partitions = {}
+    for (name,) in cur.fetchall():
+        match = pattern.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def apply_retention(
+    cur: psycopg.Cursor,
+    table: str,
+    keep_months: int,
+    drop: bool = False,
+    today: Optional[date] = None,
+) -> List[str]:
+    # Detaching is a catalog change, so old months leave the table without
+    # a DELETE and the vacuum that would follow it
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    detached = []
+    for month, name in sorted(list_partitions(cur, table).items()):
+        if month >= cutoff:
+            continue
+        cur.execute(
+            SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                Identifier("public", table), Identifier("public", name)
+            )
+        )
+        if drop:
+            cur.execute(SQL("DROP TABLE {}").format(Identifier("public", name)))
+        logger.info(f"{'Dropped' if drop else 'Detached'} partition {name}")
+        detached.append(name)
+    return detached
@@ -3,6 +3,7 @@ import os
 
 
 DATA_ROOT = Path("data")
+CACHE_ROOT = Path(".cache")
 
 # RAW
 GITHUB_RAW_DATA_DIR = Path(os.path.join(DATA_ROOT, "raw"))
@@ -12,6 +13,17 @@ GITHUB_REPOSITORIES_RAW_DIR_PATH = Path(
 )
 GITHUB_ISSUES_RAW_DIR_PATH = Path(os.path.join(GITHUB_RAW_DATA_DIR, "issues"))
 
+# STATE
+GITHUB_STATE_DIR = Path(os.path.join(DATA_ROOT, "state"))
+GITHUB_WATERMARKS_PATH = Path(os.path.join(GITHUB_STATE_DIR, "github-watermarks.json"))
+
 # ML
 GITHUB_ML_DATA_DIR = Path(os.path.join(DATA_ROOT, "ml"))
 GITHUB_COMMITS_ML_DIR_PATH = Path(os.path.join(GITHUB_ML_DATA_DIR, "commits"))
+
+# CACHE
+GITHUB_RESPONSE_CACHE_PATH = Path(
+    os.path.join(CACHE_ROOT, "github", "responses.sqlite")
+)
+GITHUB_DEDUP_INDEX_PATH = Path(os.path.join(CACHE_ROOT, "github", "dedup.sqlite"))
+FEATURE_CACHE_PATH = Path(os.path.join(CACHE_ROOT, "features"))
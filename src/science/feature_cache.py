@@ -0,0 +1,246 @@
+import hashlib
+import os
+import sqlite3
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+from loguru import logger
+
+from src.engineering.github.cache import CacheStats
+from src.engineering.manifest import content_hash
+from src.paths import FEATURE_CACHE_PATH
+from src.utils import count_files_by_day, day_counts_frame, format_day_counts
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+INDEX_FILENAME = "index.sqlite"
+
+
+# Daily counts of every raw partition file, stored as small Parquet files
+# named after the partition's content hash. A partition whose size and mtime
+# are unchanged is not even hashed; one that changed is recounted only if its
+# hash differs. Training then reads the counts of the whole history from the
+# cache and only counts the partitions collected since the last run.
+class FeatureCache:
+    def __init__(
+        self, path: Path = FEATURE_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        os.makedirs(path, exist_ok=True)
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self.conn = sqlite3.connect(self.path / INDEX_FILENAME, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS partitions (
+                key TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                content_hash TEXT,
+                bytes INTEGER,
+                accessed_at REAL
+            )
+            """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS partitions_accessed_at "
+            "ON partitions(accessed_at)"
+        )
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(bytes), 0) FROM partitions"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(file: Path, date_path: str, group_path: Optional[str]) -> str:
+        # The same partition counted by another projection is another entry
+        return f"{os.path.abspath(file)}|{date_path}|{group_path or ''}"
+
+    def _counts_path(self, key_hash: str) -> Path:
+        return self.path / key_hash[:2] / f"{key_hash}.parquet"
+
+    def lookup(self, key: str, file: Path) -> Optional[pd.DataFrame]:
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, content_hash FROM partitions WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        size, mtime_ns, cached_hash = row
+        stat = os.stat(file)
+        if stat.st_size != size:
+            return None
+        if stat.st_mtime_ns != mtime_ns:
+            if content_hash(file) != cached_hash:
+                return None
+            self.conn.execute(
+                "UPDATE partitions SET mtime_ns = ? WHERE key = ?",
+                (stat.st_mtime_ns, key),
+            )
+
+        counts_path = self._counts_path(self._key_hash(key, cached_hash))
+        if not counts_path.exists():
+            return None
+        self.conn.execute(
+            "UPDATE partitions SET accessed_at = ? WHERE key = ?", (time.time(), key)
+        )
+        return pd.read_parquet(counts_path)
+
+    @staticmethod
+    def _key_hash(key: str, file_hash: str) -> str:
+        return hashlib.blake2b(
+            f"{key}|{file_hash}".encode(), digest_size=16
+        ).hexdigest()
+
+    def store(self, key: str, file: Path, counts: pd.DataFrame):
+        stat = os.stat(file)
+        file_hash = content_hash(file)
+        previous = self.conn.execute(
+            "SELECT content_hash, bytes FROM partitions WHERE key = ?", (key,)
+        ).fetchone()
+        if previous is not None:
+            self._remove_counts(key, previous[0])
+            self.total_bytes -= previous[1]
+
+        counts_path = self._counts_path(self._key_hash(key, file_hash))
+        os.makedirs(counts_path.parent, exist_ok=True)
+        counts.to_parquet(counts_path, index=False)
+        size = os.path.getsize(counts_path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                str(file),
+                stat.st_size,
+                stat.st_mtime_ns,
+                file_hash,
+                size,
+                time.time(),
+            ),
+        )
+        self.total_bytes += size
+        self.stats.stores += 1
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def _remove_counts(self, key: str, file_hash: str):
+        counts_path = self._counts_path(self._key_hash(key, file_hash))
+        if counts_path.exists():
+            os.remove(counts_path)
+
+    def evict(self):
+        # Least recently used partitions go first, down to 90% of the budget
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute(
+            "SELECT key, content_hash, bytes FROM partitions ORDER BY accessed_at"
+        ).fetchall()
+        evicted = []
+        for key, file_hash, size in rows:
+            if self.total_bytes <= target:
+                break
+            self._remove_counts(key, file_hash)
+            evicted.append((key,))
+            self.total_bytes -= size
+
+        self.conn.executemany("DELETE FROM partitions WHERE key = ?", evicted)
+        self.stats.evictions += len(evicted)
+
+    def invalidate(self, files: Optional[List[Path]] = None) -> int:
+        # Drops the given partitions (any projection), or everything
+        if files is None:
+            rows = self.conn.execute(
+                "SELECT key, content_hash FROM partitions"
+            ).fetchall()
+        else:
+            paths = [str(file) for file in files]
+            absolute = [os.path.abspath(file) for file in files]
+            rows = [
+                (key, file_hash)
+                for key, path, file_hash in self.conn.execute(
+                    "SELECT key, path, content_hash FROM partitions"
+                )
+                if path in paths or key.split("|")[0] in absolute
+            ]
+
+        for key, file_hash in rows:
+            self._remove_counts(key, file_hash)
+        self.conn.executemany(
+            "DELETE FROM partitions WHERE key = ?", [(key,) for key, _ in rows]
+        )
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(bytes), 0) FROM partitions"
+        ).fetchone()[0]
+        return len(rows)
+
+    def count_by_day(
+        self,
+        files: List[Path],
+        date_path: str = "commit.committer.date",
+        group_path: Optional[str] = "repo",
+        workers: Optional[int] = None,
+    ) -> pd.DataFrame:
+        # Same result as src.utils.count_by_day
+        start_time = time.time()
+        frames = []
+        missing = []
+        for file in files:
+            key = self.make_key(file, date_path, group_path)
+            counts = self.lookup(key, file)
+            if counts is None:
+                self.stats.misses += 1
+                missing.append((key, file))
+            else:
+                self.stats.hits += 1
+                frames.append(counts)
+
+        missing_files = [file for _, file in missing]
+        for (key, file), file_counts in zip(
+            missing,
+            count_files_by_day(missing_files, date_path, group_path, workers),
+        ):
+            counts = day_counts_frame(file_counts)
+            self.store(key, file, counts)
+            frames.append(counts)
+
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+            df = df.groupby(["group", "date"], dropna=False)["count"].sum()
+            df = df.reset_index()
+        else:
+            df = day_counts_frame(Counter())
+        df = format_day_counts(df, group_path)
+        logger.info(
+            f"Counted {len(missing)} of {len(files)} partitions, read the rest from "
+            f"the feature cache in {time.time() - start_time:.2f} seconds "
+            f"({self.stats})"
+        )
+        return df
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--path", type=Path, default=FEATURE_CACHE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    invalidate_parser = subparsers.add_parser("invalidate")
+    invalidate_parser.add_argument(
+        "files",
+        nargs="*",
+        type=Path,
+        help="Raw partition files to recount (default: the whole cache)",
+    )
+
+    args = parser.parse_args()
+
+    cache = FeatureCache(args.path)
+    if args.command == "invalidate":
+        removed = cache.invalidate(args.files or None)
+        logger.info(f"Invalidated {removed} cached partitions")
+    cache.close()
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from src.engineering.github.standin import run_in_thread
+from src.science.serve import (
+    DEFAULT_MAX_BATCH,
+    DEFAULT_MAX_WAIT_MS,
+    ModelStore,
+    PredictionService,
+)
+from src.science.train import MODEL_FILENAME, features, prepare, save_model
+from src.telemetry import percentile
+
+DEFAULT_REPOS = 100
+DEFAULT_DAYS = 365
+DEFAULT_CONCURRENCY = 64
+DEFAULT_REQUESTS = 20_000
+
+
+@dataclass
+class LoadTestResult:
+    name: str
+    concurrency: int
+    seconds: float
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, q: float) -> float:
+        return percentile(self.latencies, q)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<20} {self.concurrency:>4} clients {self.requests:>7} requests "
+            f"{self.seconds:8.2f}s {self.requests / max(self.seconds, 1e-9):9.1f} req/s "
+            f"p50 {self.percentile(0.5) * 1000:7.2f}ms "
+            f"p99 {self.percentile(0.99) * 1000:7.2f}ms "
+            f"errors {self.errors}"
+        )
+
+
+def synthetic_counts(repo_count: int, days: int, seed: int = 0) -> pd.DataFrame:
+    # Weekly seasonality and some noise, enough for the model to have trees
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end="2024-06-30", periods=days)
+    repos = [f"owner{i % 10}/repo{i}" for i in range(repo_count)]
+    weekly = np.array([5, 6, 6, 5, 4, 1, 1])
+    counts = rng.poisson(
+        weekly[dates.dayofweek.to_numpy()] * rng.uniform(0.2, 2, (repo_count, 1))
+    )
+    return pd.DataFrame(
+        {
+            "repo": np.repeat(repos, days),
+            "date": np.tile(dates.to_numpy(), repo_count),
+            "count": counts.ravel(),
+        }
+    )
+
+
+def fit_synthetic_model(counts: pd.DataFrame, model_dir: Path, max_iter: int = 100):
+    df = prepare(counts)
+    model = HistGradientBoostingRegressor(
+        max_iter=max_iter, categorical_features="from_dtype"
+    )
+    categories = df["repo"].cat.categories.astype(str).tolist()
+    model.fit(features(df, categories), df["commit_count"])
+    save_model(model, categories, os.path.join(model_dir, MODEL_FILENAME))
+
+
+async def run_clients(
+    url: str,
+    keys: List[Tuple[str, str]],
+    concurrency: int,
+    requests: int,
+    seed: int = 0,
+) -> LoadTestResult:
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    errors = 0
+
+    async def client(session: aiohttp.ClientSession, count: int):
+        nonlocal errors
+        for _ in range(count):
+            repo, day = rng.choice(keys)
+            started = time.perf_counter()
+            async with session.get(
+                f"{url}/predict", params={"repo": repo, "date": day}
+            ) as response:
+                body = await response.json()
+            latencies.append(time.perf_counter() - started)
+            if response.status != 200 or "prediction" not in body["predictions"][0]:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        per_client, rest = divmod(requests, concurrency)
+        await asyncio.gather(
+            *[client(session, per_client + (i < rest)) for i in range(concurrency)]
+        )
+        seconds = time.perf_counter() - started
+    return LoadTestResult("GET /predict", concurrency, seconds, latencies, errors)
+
+
+def load_test(
+    url: str, keys: List[Tuple[str, str]], concurrency: int, requests: int
+) -> LoadTestResult:
+    return asyncio.run(run_clients(url, keys, concurrency, requests))
+
+
+def main(args: argparse.Namespace):
+    if args.url:
+        if not args.repos_file:
+            raise ValueError("--url needs --repos-file with repo,date lines")
+        keys = [
+            tuple(line.strip().split(","))
+            for line in open(args.repos_file)
+            if line.strip()
+        ]
+        print(load_test(args.url, keys, args.concurrency, args.requests))  # type: ignore
+        return
+
+    counts = synthetic_counts(args.repos, args.days)
+    # The day after the data, the one the service builds features for
+    next_day = (counts["date"].max() + timedelta(days=1)).date().isoformat()
+    # A mix of forecasts and recent history, so the cache sees repeats
+    recent = counts[
+        counts["date"] > counts["date"].max() - timedelta(args.history_days)
+    ]
+    keys = [(repo, next_day) for repo in counts["repo"].unique()] + [
+        (repo, day.date().isoformat())
+        for repo, day in recent[["repo", "date"]].itertuples(index=False)
+    ]
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        fit_synthetic_model(counts, Path(model_dir))
+        for cache_size in args.cache_sizes:
+            service = PredictionService(
+                ModelStore(Path(model_dir), lambda: counts),
+                max_batch=args.max_batch,
+                max_wait_ms=args.max_wait_ms,
+                cache_size=cache_size,
+            )
+            with run_in_thread(service):
+                result = load_test(service.url, keys, args.concurrency, args.requests)
+            result.name = f"cache {cache_size}"
+            print(
+                f"{result} mean batch {service.stats.mean_batch:5.1f} "
+                f"cache hits {service.stats.cache_hits}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test of the prediction service: p99 latency and "
+        "throughput of concurrent clients. Without --url it trains a small "
+        "model on synthetic counts and serves it in process.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--url", help="Load test an already running service")
+    parser.add_argument("--repos-file", help="repo,date lines to request (with --url)")
+    parser.add_argument("--repos", type=int, default=DEFAULT_REPOS)
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument(
+        "--history-days",
+        type=int,
+        default=30,
+        help="Past days requested besides the next day",
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument(
+        "--cache-sizes",
+        type=int,
+        nargs="+",
+        default=[0, 10_000],
+        help="Prediction cache sizes to compare",
+    )
+    main(parser.parse_args())
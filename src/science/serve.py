@@ -0,0 +1,407 @@
+import argparse
+import asyncio
+import os
+import socket
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+from aiohttp import web
+from loguru import logger
+
+from src.paths import FEATURE_CACHE_PATH
+from src.science.feature_cache import FeatureCache
+from src.science.train import (
+    MODEL_FILENAME,
+    features,
+    model_fn,
+    prepare,
+    repo_categories,
+)
+from src.utils import Directory, count_by_day
+
+DEFAULT_MAX_BATCH = 64
+# How long the first request of a batch waits for others to join it
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_RELOAD_INTERVAL = 5.0
+
+Key = Tuple[str, pd.Timestamp]
+
+
+@dataclass
+class ServeStats:
+    requests: int = 0
+    predictions: int = 0
+    batches: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    reloads: int = 0
+
+    @property
+    def mean_batch(self) -> float:
+        return self.predictions / self.batches if self.batches else 0.0
+
+
+class LruCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Feature rows of every repository and day the latest daily counts cover,
+# plus the day after, which is the one a forecast is usually asked for
+class FeatureTable:
+    def __init__(self, counts: pd.DataFrame, categories: Optional[List[str]] = None):
+        next_day = counts["date"].max() + timedelta(days=1)
+        last_rows = counts.drop_duplicates("repo").assign(date=next_day, count=0)
+        df = prepare(pd.concat([counts, last_rows], ignore_index=True))
+        self.X = features(df, categories)
+        # Row positions by key, a dict lookup is cheaper than MultiIndex.loc
+        self.positions: Dict[Key, int] = {
+            key: i
+            for i, key in enumerate(zip(df["repo"].astype(str), df["commit_date"]))
+        }
+        self.last_day = next_day
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self.positions
+
+    def rows(self, keys: List[Key]) -> pd.DataFrame:
+        return self.X.iloc[[self.positions[key] for key in keys]]
+
+
+# A model together with the features it was loaded with. Requests and
+# batches hold on to the snapshot they started with, a reload swaps in a
+# new one without changing what is already in flight.
+@dataclass(frozen=True)
+class Snapshot:
+    model: Any
+    table: FeatureTable
+    version: int
+
+    def predict(self, keys: List[Key]) -> List[Optional[float]]:
+        # Keys without features get None instead of failing the whole batch
+        known = [key for key in keys if key in self.table]
+        predictions = (
+            dict(zip(known, self.model.predict(self.table.rows(known))))
+            if known
+            else {}
+        )
+        return [float(predictions[key]) if key in predictions else None for key in keys]
+
+
+# The model artifact and the features it is served with. A newer artifact
+# (the trainer replacing daily-commits.joblib) is picked up together with
+# freshly counted features, so both always describe the same data.
+class ModelStore:
+    def __init__(self, model_dir: Path, counts_fn: Callable[[], pd.DataFrame]):
+        self.model_dir = Path(model_dir)
+        self.counts_fn = counts_fn
+        self.current: Optional[Snapshot] = None
+
+    @property
+    def artifact(self) -> Path:
+        return self.model_dir / MODEL_FILENAME
+
+    def changed(self) -> bool:
+        try:
+            version = os.stat(self.artifact).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        return self.current is None or version != self.current.version
+
+    def load(self):
+        version = os.stat(self.artifact).st_mtime_ns
+        model = model_fn(self.model_dir)
+        table = FeatureTable(self.counts_fn(), repo_categories(model))
+        self.current = Snapshot(model, table, version)
+        logger.info(
+            f"Loaded {self.artifact} (version {version}) with features up to "
+            f"{table.last_day.date()}"
+        )
+
+
+# Concurrent requests are queued and predicted together: the first one
+# waits at most max_wait for others, then a single predict call (off the
+# event loop) serves up to max_batch of them.
+class MicroBatcher:
+    def __init__(
+        self,
+        stats: ServeStats,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    ):
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue: "asyncio.Queue[Tuple[Snapshot, Key, asyncio.Future]]" = (
+            asyncio.Queue()
+        )
+
+    async def predict(self, snapshot: Snapshot, key: Key) -> Optional[float]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((snapshot, key, future))
+        return await future
+
+    @staticmethod
+    def _predict(
+        batch: List[Tuple[Snapshot, Key, asyncio.Future]],
+    ) -> List[Optional[float]]:
+        # One predict call per snapshot, a batch only spans two of them
+        # while a reload is in flight
+        by_version: Dict[int, Tuple[Snapshot, List[int]]] = {}
+        for i, (snapshot, _, _) in enumerate(batch):
+            by_version.setdefault(snapshot.version, (snapshot, []))[1].append(i)
+        predictions: List[Optional[float]] = [None] * len(batch)
+        for snapshot, positions in by_version.values():
+            keys = [batch[i][1] for i in positions]
+            for i, prediction in zip(positions, snapshot.predict(keys)):
+                predictions[i] = prediction
+        return predictions
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.stats.batches += 1
+            self.stats.predictions += len(batch)
+            try:
+                predictions = await loop.run_in_executor(None, self._predict, batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+
+class PredictionService:
+    def __init__(
+        self,
+        store: ModelStore,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        reload_interval: float = DEFAULT_RELOAD_INTERVAL,
+    ):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.reload_interval = reload_interval
+        self.stats = ServeStats()
+        self.cache = LruCache(cache_size)
+        self.batcher: Optional[MicroBatcher] = None
+        self.tasks: List[asyncio.Task] = []
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/predict", self.handle_predict)
+        app.router.add_get("/predict", self.handle_predict)
+        app.router.add_get("/health", self.handle_health)
+        app.on_startup.append(self._start_tasks)
+        app.on_cleanup.append(self._stop_tasks)
+        return app
+
+    async def _start_tasks(self, app: web.Application):
+        if self.store.current is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.load)
+        self.batcher = MicroBatcher(self.stats, self.max_batch, self.max_wait_ms)
+        self.tasks = [
+            asyncio.create_task(self.batcher.run()),
+            asyncio.create_task(self._watch_artifact()),
+        ]
+
+    async def _stop_tasks(self, app: web.Application):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def start(self) -> str:
+        self.runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        await web.SockSite(self.runner, sock).start()
+        self.port = sock.getsockname()[1]
+        self.url = f"http://{self.host}:{self.port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+        self.runner = None
+
+    async def __aenter__(self) -> "PredictionService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def reload_if_changed(self) -> bool:
+        if not self.store.changed():
+            return False
+        await asyncio.get_running_loop().run_in_executor(None, self.store.load)
+        self.cache.clear()
+        self.stats.reloads += 1
+        return True
+
+    async def _watch_artifact(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                # A half written artifact is retried on the next check
+                logger.warning(f"Reloading {self.store.artifact} failed: {e!r}")
+
+    async def predict(self, snapshot: Snapshot, key: Key) -> Dict[str, Any]:
+        repo, day = key
+        result: Dict[str, Any] = {"repo": repo, "date": day.date().isoformat()}
+        cache_key = (key, snapshot.version)
+        prediction = self.cache.get(cache_key)
+        if prediction is None and key in snapshot.table:
+            self.stats.cache_misses += 1
+            prediction = await self.batcher.predict(snapshot, key)  # type: ignore
+            if prediction is not None:
+                self.cache.put(cache_key, prediction)
+        elif prediction is not None:
+            self.stats.cache_hits += 1
+
+        if prediction is None:
+            result["error"] = "No features for this repository and date"
+        else:
+            result["prediction"] = prediction
+        return result
+
+    async def handle_predict(self, request: web.Request) -> web.Response:
+        # POST {"instances": [{"repo": "owner/name", "date": "YYYY-MM-DD"}]}
+        # or GET ?repo=owner/name&date=YYYY-MM-DD
+        try:
+            if request.method == "POST":
+                instances = (await request.json())["instances"]
+            else:
+                instances = [dict(request.query)]
+            keys = [(str(i["repo"]), pd.Timestamp(str(i["date"]))) for i in instances]
+        except (KeyError, TypeError, ValueError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid instances: {e!r}")
+
+        # Every instance of the request is answered by the same model
+        snapshot = self.store.current
+        if snapshot is None:
+            raise web.HTTPServiceUnavailable(text="No model loaded")
+        self.stats.requests += 1
+        predictions = await asyncio.gather(
+            *[self.predict(snapshot, key) for key in keys]
+        )
+        return web.json_response(
+            {"model_version": snapshot.version, "predictions": predictions}
+        )
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        snapshot = self.store.current
+        return web.json_response(
+            {
+                "model_version": snapshot.version if snapshot else None,
+                "last_day": (
+                    snapshot.table.last_day.date().isoformat() if snapshot else None
+                ),
+                "mean_batch": self.stats.mean_batch,
+                **asdict(self.stats),
+            }
+        )
+
+
+def counts_from_directory(
+    data_dir: Path, cache_path: Optional[Path]
+) -> Callable[[], pd.DataFrame]:
+    def counts() -> pd.DataFrame:
+        files = Directory(str(data_dir)).collect()
+        if cache_path is None:
+            return count_by_day(files)
+        cache = FeatureCache(cache_path)
+        try:
+            return cache.count_by_day(files)
+        finally:
+            cache.close()
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--model-dir", type=Path, default=Path("models"))
+    parser.add_argument("--data-dir", "-d", type=Path, required=True)
+    parser.add_argument("--feature-cache", type=Path, default=FEATURE_CACHE_PATH)
+    parser.add_argument("--no-feature-cache", default=False, action="store_true")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=DEFAULT_RELOAD_INTERVAL,
+        help="Seconds between checks for a new model artifact",
+    )
+    args = parser.parse_args()
+
+    store = ModelStore(
+        args.model_dir,
+        counts_from_directory(
+            args.data_dir, None if args.no_feature_cache else args.feature_cache
+        ),
+    )
+    service = PredictionService(
+        store,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        cache_size=args.cache_size,
+        reload_interval=args.reload_interval,
+    )
+    logger.info(f"Serving predictions on http://{args.host}:{args.port}")
+    web.run_app(service.make_app(), host=args.host, port=args.port, print=None)
@@ -1,44 +1,280 @@
 import argparse
 import joblib
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.model_selection import ParameterGrid
+from threadpoolctl import threadpool_limits
 
 from dotenv import load_dotenv
 
-from src.utils import Directory, file_list_to_df
-from sqlalchemy import create_engine
+from src.db_utils import copy_frame, cursor
+from src.paths import FEATURE_CACHE_PATH
+from src.science.feature_cache import DEFAULT_MAX_BYTES, FeatureCache
+from src.utils import Directory, count_by_day
 from loguru import logger
 
 load_dotenv()
 
+MODEL_FILENAME = "daily-commits.joblib"
+
 
 def model_fn(model_dir):
-    clf = joblib.load(os.path.join(model_dir, "model.joblib"))
+    clf = joblib.load(os.path.join(model_dir, MODEL_FILENAME))
     return clf
 
 
-def prepare(df: pd.DataFrame) -> pd.DataFrame:
-    df["commit_date"] = df["commit.committer.date"].apply(
-        lambda x: pd.to_datetime(x[:10])
+# Lagged counts and trailing means of the days before, per repository
+LAGS = (1, 2, 7, 30)
+WINDOWS = (7, 30)
+FEATURES = (
+    ["commit_epoch", "dow", "repo"]
+    + [f"commit_count_lag{lag}" for lag in LAGS]
+    + [f"commit_count_mean{window}" for window in WINDOWS]
+)
+# HistGradientBoostingRegressor handles at most 255 categories
+MAX_CATEGORIES = 255
+
+
+def daily_calendar(counts: pd.DataFrame) -> pd.DataFrame:
+    # Every repository gets every day from its first commit to the last day
+    # of the data, built with repeats instead of a date_range per repository
+    first_days = counts.groupby("repo")["date"].min()
+    last_day = counts["date"].max()
+    lengths = ((last_day - first_days).dt.days + 1).to_numpy()
+    starts = np.cumsum(lengths) - lengths
+    offsets = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    return pd.DataFrame(
+        {
+            "repo": np.repeat(first_days.index.to_numpy(), lengths),
+            "commit_date": np.repeat(first_days.to_numpy(), lengths)
+            + offsets.astype("timedelta64[D]"),
+        }
+    )
+
+
+def prepare(counts: pd.DataFrame) -> pd.DataFrame:
+    # Daily commit counts per repository (see count_by_day) on a dense
+    # calendar, so a lag of 7 is seven days ago rather than seven rows
+    df = daily_calendar(counts).merge(
+        counts.rename(columns={"date": "commit_date", "count": "commit_count"}),
+        on=["repo", "commit_date"],
+        how="left",
     )
-    df = df.groupby("commit_date").size().reset_index(name="commit_count")
+    df["commit_count"] = df["commit_count"].fillna(0).astype("int64")
+    df = df.sort_values(["repo", "commit_date"], ignore_index=True)
 
-    df["dow"] = df["commit_date"].apply(lambda x: x.weekday())
-    df["commit_count_lag1"] = df["commit_count"].shift(1)
-    df["commit_count_lag2"] = df["commit_count"].shift(2)
-    df["commit_count_lag7"] = df["commit_count"].shift(7)
-    df["commit_count_lag30"] = df["commit_count"].shift(30)
+    by_repo = df.groupby("repo", sort=False)["commit_count"]
+    for lag in LAGS:
+        df[f"commit_count_lag{lag}"] = by_repo.shift(lag)
+    previous = df["commit_count_lag1"].groupby(df["repo"], sort=False)
+    for window in WINDOWS:
+        df[f"commit_count_mean{window}"] = (
+            previous.rolling(window, min_periods=1)
+            .mean()
+            .reset_index(level=0, drop=True)
+        )
 
-    df["commit_epoch"] = df["commit_date"].apply(lambda x: x.timestamp())
-    df = df.sort_values("commit_date")
+    df["dow"] = df["commit_date"].dt.dayofweek
+    df["commit_epoch"] = (df["commit_date"] - pd.Timestamp(0)).dt.total_seconds()
+    df["repo"] = df["repo"].astype("category")
 
     return df
 
 
+def time_split(df: pd.DataFrame, test_size: float):
+    # The last test_size of the days is held out for every repository at
+    # once, so no repository is tested on days before ones it trained on
+    days = np.sort(df["commit_date"].unique())
+    cutoff = days[int(len(days) * (1 - test_size))]
+    train = df["commit_date"] < cutoff
+    return df[train], df[~train]
+
+
+def features(df: pd.DataFrame, categories: Optional[List[str]] = None) -> pd.DataFrame:
+    # Above MAX_CATEGORIES the repository goes in as its category code, so
+    # frames are encoded against the repositories the model was trained on
+    # (repo_categories); another set of repositories would shift the codes
+    X = df[FEATURES].copy()
+    if categories is not None:
+        X["repo"] = pd.Categorical(X["repo"].astype(str), categories=categories)
+    if len(X["repo"].cat.categories) > MAX_CATEGORIES:
+        X["repo"] = X["repo"].cat.codes
+    return X
+
+
+def save_model(model: Any, categories: List[str], path: str):
+    # The training repositories travel with the model in one artifact
+    model.repo_categories_ = list(categories)
+    joblib.dump(model, path)
+
+
+def repo_categories(model: Any) -> Optional[List[str]]:
+    return getattr(model, "repo_categories_", None)
+
+
+# Candidates of the per-repository search; every fit stops early once the
+# validation loss stops improving, so max_iter is an upper bound
+PARAM_GRID = {
+    "learning_rate": [0.05, 0.125, 0.3],
+    "max_iter": [200, 1000, 5000],
+    "max_leaf_nodes": [15, 31, 63],
+}
+DEFAULT_BUDGET_SECONDS = 120.0
+# Iterations added per warm start between two checks of the budget
+ITERATION_STEP = 100
+# Repositories with fewer days are not worth a model of their own
+MIN_DAYS = 60
+REPO_FEATURES = [feature for feature in FEATURES if feature != "repo"]
+
+
+@dataclass
+class RepoResult:
+    repo: str
+    days: int
+    candidates: int = 0
+    learning_rate: Optional[float] = None
+    max_iter: Optional[int] = None
+    max_leaf_nodes: Optional[int] = None
+    n_iter: Optional[int] = None
+    validation_mae: Optional[float] = None
+    test_mae: Optional[float] = None
+    fit_seconds: float = 0.0
+    out_of_budget: bool = False
+
+
+def fit_within_budget(
+    X: pd.DataFrame, y: pd.Series, params: Dict[str, Any], deadline: float
+) -> Tuple[HistGradientBoostingRegressor, bool]:
+    # Grows the ensemble ITERATION_STEP iterations at a time with warm_start
+    # until early stopping, max_iter or the deadline ends it
+    model = HistGradientBoostingRegressor(
+        **{**params, "max_iter": 0},
+        early_stopping=True,
+        n_iter_no_change=20,
+        warm_start=True,
+        random_state=42,
+    )
+    while model.max_iter < params["max_iter"]:
+        model.max_iter = min(model.max_iter + ITERATION_STEP, params["max_iter"])
+        model.fit(X, y)
+        if model.n_iter_ < model.max_iter:
+            return model, False
+        if time.monotonic() > deadline:
+            return model, model.max_iter < params["max_iter"]
+    return model, False
+
+
+def search_repo(
+    repo: str,
+    df: pd.DataFrame,
+    param_grid: Dict[str, List[Any]],
+    budget_seconds: float,
+    test_size: float,
+) -> Tuple[RepoResult, Optional[HistGradientBoostingRegressor], pd.DataFrame]:
+    # Candidates are ranked on the last days before the test days, and the
+    # search stops taking new candidates once the budget is spent
+    started = time.monotonic()
+    deadline = started + budget_seconds
+    result = RepoResult(repo=repo, days=len(df))
+
+    with threadpool_limits(1):
+        train, test = time_split(df, test_size)
+        fit, validation = time_split(train, test_size)
+        best = None
+        for params in ParameterGrid(param_grid):
+            if time.monotonic() > deadline:
+                result.out_of_budget = True
+                break
+            model, out_of_budget = fit_within_budget(
+                fit[REPO_FEATURES], fit["commit_count"], params, deadline
+            )
+            result.out_of_budget |= out_of_budget
+            result.candidates += 1
+            mae = float(
+                np.mean(
+                    np.abs(
+                        model.predict(validation[REPO_FEATURES])
+                        - validation["commit_count"]
+                    )
+                )
+            )
+            if best is None or mae < result.validation_mae:
+                best = model
+                result.validation_mae = mae
+                result.n_iter = model.n_iter_
+                result.learning_rate = params["learning_rate"]
+                result.max_iter = params["max_iter"]
+                result.max_leaf_nodes = params["max_leaf_nodes"]
+
+        predictions = test[REPO_FEATURES].copy()
+        if best is not None:
+            preds = best.predict(test[REPO_FEATURES])
+            result.test_mae = float(np.mean(np.abs(preds - test["commit_count"])))
+            predictions = build_result_df(preds, predictions, test["commit_count"])
+            predictions["repo"] = repo
+
+    result.fit_seconds = time.monotonic() - started
+    return result, best, predictions
+
+
+# One model per repository, searched in a process pool with a wall clock
+# budget each. Every process limits the OpenMP threads of its fits to one,
+# so workers processes use workers cores instead of oversubscribing them.
+def train_per_repo(
+    df: pd.DataFrame,
+    workers: Optional[int] = None,
+    param_grid: Dict[str, List[Any]] = PARAM_GRID,
+    budget_seconds: float = DEFAULT_BUDGET_SECONDS,
+    test_size: float = 0.1,
+) -> Tuple[pd.DataFrame, Dict[str, HistGradientBoostingRegressor], pd.DataFrame]:
+    repos = {
+        str(repo): frame
+        for repo, frame in df.groupby("repo", observed=True)
+        if len(frame) >= MIN_DAYS
+    }
+    skipped = df["repo"].nunique() - len(repos)
+    if skipped:
+        logger.info(f"Skipping {skipped} repositories with fewer than {MIN_DAYS} days")
+
+    results, models, predictions = [], {}, []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        # Largest repositories first, so they do not start last
+        futures = [
+            executor.submit(
+                search_repo, repo, frame, param_grid, budget_seconds, test_size
+            )
+            for repo, frame in sorted(repos.items(), key=lambda item: -len(item[1]))
+        ]
+        for future in as_completed(futures):
+            result, model, repo_predictions = future.result()
+            logger.info(
+                f"{result.repo}: test MAE {result.test_mae}, {result.candidates} "
+                f"candidates in {result.fit_seconds:.1f}s"
+            )
+            results.append(result)
+            if model is not None:
+                models[result.repo] = model
+                predictions.append(repo_predictions)
+
+    summary = pd.DataFrame([asdict(result) for result in results])
+    if not summary.empty:
+        summary = summary.sort_values("repo", ignore_index=True)
+    return (
+        summary,
+        models,
+        pd.concat(predictions, ignore_index=True) if predictions else pd.DataFrame(),
+    )
+
+
 def build_result_df(predictions: pd.Series, test_x: pd.DataFrame, test_y: pd.Series):
     test_x["value"] = test_y
     test_x["prediction"] = predictions
@@ -51,8 +287,8 @@ def load_result_to_db(df, name: str):
     df["date"] = pd.to_datetime(df["commit_epoch"], unit="s")
     df = df.drop("commit_epoch", axis=1)
 
-    engine = create_engine(os.environ["DATABASE_CONNECTION_STRING"])
-    df.to_sql(name, con=engine, if_exists="replace", index=False)
+    with cursor(os.environ["DATABASE_CONNECTION_STRING"], commit=True) as cur:
+        copy_frame(cur, df, name)
 
 
 if __name__ == "__main__":
@@ -63,22 +299,81 @@ if __name__ == "__main__":
     # Data, model, and output directories
     parser.add_argument("--model-dir", type=str, default="models")
     parser.add_argument("--data-dir", "-d", type=lambda x: Directory(x))
+    parser.add_argument(
+        "--feature-cache",
+        type=Path,
+        default=FEATURE_CACHE_PATH,
+        help="Directory of cached per-partition daily counts",
+    )
+    parser.add_argument(
+        "--feature-cache-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Size limit of the feature cache before LRU eviction",
+    )
+    parser.add_argument(
+        "--no-feature-cache",
+        default=False,
+        action="store_true",
+        help="Count every partition again",
+    )
+
+    parser.add_argument(
+        "--per-repo",
+        default=False,
+        action="store_true",
+        help="Search and fit one model per repository in a process pool",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Processes of the per-repository search",
+    )
+    parser.add_argument(
+        "--budget-seconds",
+        type=float,
+        default=DEFAULT_BUDGET_SECONDS,
+        help="Wall clock budget of the search of one repository",
+    )
 
     args = parser.parse_args()
 
-    df = file_list_to_df(args.data_dir.collect(suffix="json"))
+    if args.no_feature_cache:
+        df = count_by_day(args.data_dir.collect())
+    else:
+        cache = FeatureCache(args.feature_cache, args.feature_cache_mb * 1024 * 1024)
+        df = cache.count_by_day(args.data_dir.collect())
+        cache.close()
     if df.empty:
         raise ValueError("No dataframe or dataframe is empty")
 
     df = prepare(df)
-    X = df[["commit_epoch", "commit_count_lag1", "commit_count_lag2", "dow"]]
-    y = df["commit_count"]
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.1, random_state=42, shuffle=False
-    )
+    if args.per_repo:
+        summary, models, predictions = train_per_repo(
+            df, workers=args.workers, budget_seconds=args.budget_seconds
+        )
+        os.makedirs(args.model_dir, exist_ok=True)
+        summary_path = os.path.join(args.model_dir, "per-repo-summary.csv")
+        summary.to_csv(summary_path, index=False)
+        logger.info(f"Summary of {len(summary)} repositories at {summary_path}")
+        if not predictions.empty:
+            load_result_to_db(predictions, "prediction_per_repo")
+
+        path = os.path.join(args.model_dir, "daily-commits-per-repo.joblib")
+        joblib.dump(models, path)
+        logger.info("models persisted at " + path)
+        sys.exit()
+
+    train, test = time_split(df, test_size=0.1)
+    categories = df["repo"].cat.categories.astype(str).tolist()
+    X_train, y_train = features(train, categories), train["commit_count"]
+    X_test, y_test = features(test, categories), test["commit_count"]
 
-    model = HistGradientBoostingRegressor(max_iter=5000, learning_rate=0.125)
+    model = HistGradientBoostingRegressor(
+        max_iter=5000, learning_rate=0.125, categorical_features="from_dtype"
+    )
     model.fit(X_train, y_train)
 
     preds = model.predict(X_test)
@@ -93,6 +388,6 @@ if __name__ == "__main__":
     load_result_to_db(test_result_df, "prediction")
 
     # persist model
-    path = os.path.join(args.model_dir, "daily-commits.joblib")
-    joblib.dump(model, path)
+    path = os.path.join(args.model_dir, MODEL_FILENAME)
+    save_model(model, categories, path)
     logger.info("model persisted at " + path)
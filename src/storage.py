@@ -0,0 +1,391 @@
+import io
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    AbstractSet,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+ZSTD_LEVEL = 3
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+TIMESTAMP_SUFFIXES = ("date", "_at")
+# Parquet column listing the objects of a row that were empty or held only
+# nulls, which flatten to the same columns as a null object
+EMPTY_OBJECTS_COLUMN = "_empty_objects"
+
+
+def flatten(row: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat: Dict[str, Any] = {}
+    for key, value in row.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def empty_objects(row: Dict[str, Any], prefix: str = "") -> List[str]:
+    paths = []
+    for key, value in row.items():
+        if isinstance(value, dict):
+            if _collapse_empty(value) is None or not value:
+                paths.append(prefix + key)
+            paths += empty_objects(value, prefix + key + ".")
+    return paths
+
+
+def unflatten(flat: Dict[str, Any]) -> Dict[str, Any]:
+    # Files written before EMPTY_OBJECTS_COLUMN collapse all null objects
+    keep = set(flat.pop(EMPTY_OBJECTS_COLUMN, None) or [])
+    row: Dict[str, Any] = {}
+    for name, value in flat.items():
+        if isinstance(value, datetime):
+            value = value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        node = row
+        *parents, leaf = name.split(".")
+        for parent in parents:
+            if not isinstance(node.get(parent), dict):
+                node[parent] = {}
+            node = node[parent]
+        if not (leaf in node and isinstance(node[leaf], dict) and value is None):
+            node[leaf] = value
+    for path in keep:
+        node = row
+        for key in path.split("."):
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+    return _collapse_empty(row, keep)
+
+
+def _collapse_empty(
+    value: Any, keep: AbstractSet[str] = frozenset(), path: str = ""
+) -> Any:
+    # Flattening a null object (e.g. a commit without a GitHub author) leaves
+    # nothing behind, so an object whose leaves are all null reads back as
+    # null unless the row recorded it in EMPTY_OBJECTS_COLUMN
+    if not isinstance(value, dict):
+        return value
+    collapsed = {k: _collapse_empty(v, keep, path + k + ".") for k, v in value.items()}
+    if path.rstrip(".") in keep:
+        return collapsed
+    if collapsed and all(v is None for v in collapsed.values()):
+        return None
+    return collapsed
+
+
+def _is_timestamp_column(name: str) -> bool:
+    return name.split(".")[-1].endswith(TIMESTAMP_SUFFIXES)
+
+
+class NdjsonSink:
+    def __init__(self, handle):
+        self.handle = handle
+
+    def write(self, row: Dict[str, Any]):
+        self.handle.write(json.dumps(row).encode())
+        self.handle.write(b"\n")
+
+    def close(self):
+        self.handle.close()
+
+
+class NdjsonFormat:
+    name = "json"
+    filename = "data.json"
+
+    def open_append(self, path: Path, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        return open(path, "ab", buffering=buffer_size)
+
+    def open_sink(self, path: Path, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        return NdjsonSink(self.open_append(path, buffer_size))
+
+    def write(self, path: Path, rows: Iterable[Dict[str, Any]]):
+        sink = self.open_sink(path)
+        try:
+            for row in rows:
+                sink.write(row)
+        finally:
+            sink.close()
+
+    def open_lines(self, path: Path) -> io.BufferedIOBase:
+        return open(path, "rb")
+
+    def iter_lines(self, path: Path) -> Iterator[bytes]:
+        with self.open_lines(path) as in_file:
+            for line in in_file:
+                if line.strip():
+                    yield line if line.endswith(b"\n") else line + b"\n"
+
+    def iter_chunks(
+        self, path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        # Fixed-size blocks extended to the end of their last line, so every
+        # block holds whole, newline-terminated lines
+        with self.open_lines(path) as in_file:
+            while True:
+                chunk = in_file.read(chunk_size)
+                if not chunk:
+                    return
+                if not chunk.endswith(b"\n"):
+                    chunk += in_file.readline()
+                if not chunk.endswith(b"\n"):
+                    chunk += b"\n"
+                if chunk.startswith(b"\n") or b"\n\n" in chunk:
+                    chunk = b"".join(
+                        line + b"\n" for line in chunk.split(b"\n") if line.strip()
+                    )
+                yield chunk
+
+    def iter_records(self, path: Path) -> Iterator[Dict[str, Any]]:
+        for line in self.iter_lines(path):
+            yield json.loads(line)
+
+    def count_rows(self, path: Path) -> int:
+        return sum(chunk.count(b"\n") for chunk in self.iter_chunks(path))
+
+    def read_frame(self, path: Path, normalize: bool = False) -> "pd.DataFrame":
+        import pandas as pd
+
+        records = list(self.iter_records(path))
+        if normalize:
+            return pd.json_normalize(records)
+        return pd.DataFrame(records)
+
+
+class ZstdNdjsonFormat(NdjsonFormat):
+    name = "json.zst"
+    filename = "data.json.zst"
+
+    def open_append(self, path: Path, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        import zstandard
+
+        # Every append adds an independent zstd frame
+        compressor = zstandard.ZstdCompressor(ZSTD_LEVEL)
+        return io.BufferedWriter(
+            compressor.stream_writer(open(path, "ab"), closefd=True),
+            buffer_size=buffer_size,
+        )
+
+    def open_lines(self, path: Path) -> io.BufferedIOBase:
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True, closefd=True
+        )
+        return io.BufferedReader(reader)  # type: ignore
+
+
+# Parquet files cannot be appended to, so rows are held until the sink is
+# closed and then merged into the file in one rewrite
+class ParquetSink:
+    def __init__(self, parquet_format: "ParquetFormat", path: Path):
+        self.parquet_format = parquet_format
+        self.path = path
+        self.rows: List[Dict[str, Any]] = []
+
+    def write(self, row: Dict[str, Any]):
+        self.rows.append(row)
+
+    def close(self):
+        if self.rows:
+            self.parquet_format.write(self.path, self.rows)
+        self.rows = []
+
+
+def _text_array(column: "pa.ChunkedArray") -> "pa.Array":
+    import pyarrow as pa
+
+    values = []
+    for value in column.to_pylist():
+        if isinstance(value, datetime):
+            value = value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        elif value is not None and not isinstance(value, str):
+            value = json.dumps(value)
+        values.append(value)
+    return pa.array(values, type=pa.string())
+
+
+def _unify_types(
+    existing: "pa.Table", table: "pa.Table"
+) -> Tuple["pa.Table", "pa.Table"]:
+    # A column can change type between appends (an int that later holds a
+    # string, a date that no longer parses). Types that widen, like int to
+    # double or null to anything, are left to concat_tables; the others are
+    # stored as text on both sides, as to_table does for mixed columns
+    import pyarrow as pa
+
+    for field in table.schema:
+        index = existing.schema.get_field_index(field.name)
+        if index < 0 or existing.schema.field(index).type == field.type:
+            continue
+        try:
+            pa.unify_schemas(
+                [pa.schema([existing.schema.field(index)]), pa.schema([field])],
+                promote_options="permissive",
+            )
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            text = pa.field(field.name, pa.string())
+            existing = existing.set_column(
+                index, text, _text_array(existing.column(index))
+            )
+            table = table.set_column(
+                table.schema.get_field_index(field.name),
+                text,
+                _text_array(table.column(field.name)),
+            )
+    return existing, table
+
+
+# Nested objects are flattened into dotted columns (commit.committer.date),
+# and timestamp columns are stored as typed UTC timestamps
+class ParquetFormat:
+    name = "parquet"
+    filename = "data.parquet"
+
+    def open_sink(self, path: Path, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        return ParquetSink(self, path)
+
+    def to_table(self, rows: List[Dict[str, Any]]):
+        import pandas as pd
+        import pyarrow as pa
+
+        flat_rows = [flatten(row) for row in rows]
+        columns: Dict[str, None] = {}
+        for flat in flat_rows:
+            columns.update(dict.fromkeys(flat))
+
+        arrays = {}
+        for column in columns:
+            values = [flat.get(column) for flat in flat_rows]
+            if _is_timestamp_column(column) and all(
+                v is None or isinstance(v, str) for v in values
+            ):
+                try:
+                    timestamps = pd.to_datetime(
+                        pd.Series(values, dtype=object), utc=True
+                    )
+                    arrays[column] = pa.array(
+                        timestamps, type=pa.timestamp("us", tz="UTC")
+                    )
+                    continue
+                except (ValueError, TypeError):
+                    pass
+            try:
+                arrays[column] = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Columns mixing types are kept as their JSON text
+                arrays[column] = pa.array(
+                    [None if v is None else json.dumps(v) for v in values]
+                )
+        arrays[EMPTY_OBJECTS_COLUMN] = pa.array(
+            [empty_objects(row) for row in rows], type=pa.list_(pa.string())
+        )
+        return pa.table(arrays)
+
+    def write(self, path: Path, rows: Iterable[Dict[str, Any]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = self.to_table(list(rows))
+        if os.path.exists(path):
+            existing, table = _unify_types(pq.read_table(path), table)
+            table = pa.concat_tables([existing, table], promote_options="permissive")
+
+        tmp_path = str(path) + ".tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+    def iter_records(self, path: Path) -> Iterator[Dict[str, Any]]:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches():
+            for flat in batch.to_pylist():
+                yield unflatten(flat)
+
+    def iter_lines(self, path: Path) -> Iterator[bytes]:
+        for record in self.iter_records(path):
+            yield json.dumps(record).encode() + b"\n"
+
+    def count_rows(self, path: Path) -> int:
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+
+    def iter_chunks(
+        self, path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        lines: List[bytes] = []
+        size = 0
+        for line in self.iter_lines(path):
+            lines.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield b"".join(lines)
+                lines, size = [], 0
+        if lines:
+            yield b"".join(lines)
+
+    def read_frame(self, path: Path, normalize: bool = False) -> "pd.DataFrame":
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        if normalize:
+            df = pq.read_table(path).to_pandas()
+            return df.drop(columns=[EMPTY_OBJECTS_COLUMN], errors="ignore")
+        return pd.DataFrame(list(self.iter_records(path)))
+
+
+RAW_FORMATS: Dict[str, Union[NdjsonFormat, ParquetFormat]] = {
+    f.name: f for f in [NdjsonFormat(), ZstdNdjsonFormat(), ParquetFormat()]
+}
+RAW_FILENAMES = tuple(f.filename for f in RAW_FORMATS.values())
+
+
+def format_for_path(path: Union[str, Path]) -> Union[NdjsonFormat, ParquetFormat]:
+    for raw_format in RAW_FORMATS.values():
+        if str(path).endswith(raw_format.filename):
+            return raw_format
+    if str(path).endswith(".zst"):
+        return RAW_FORMATS["json.zst"]
+    if str(path).endswith(".parquet"):
+        return RAW_FORMATS["parquet"]
+    return RAW_FORMATS["json"]
+
+
+def iter_records(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    return format_for_path(path).iter_records(Path(path))
+
+
+def iter_lines(path: Union[str, Path]) -> Iterator[bytes]:
+    return format_for_path(path).iter_lines(Path(path))
+
+
+def iter_chunks(
+    path: Union[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    return format_for_path(path).iter_chunks(Path(path), chunk_size)
+
+
+def count_rows(path: Union[str, Path]) -> int:
+    return format_for_path(path).count_rows(Path(path))
+
+
+def read_frame(path: Union[str, Path], normalize: bool = False) -> "pd.DataFrame":
+    return format_for_path(path).read_frame(Path(path), normalize=normalize)
@@ -0,0 +1,210 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Upper bounds of the request latency histogram, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "etl"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class PhaseStats:
+    runs: int = 0
+    seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class RequestStats:
+    count: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    buckets: List[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+
+
+# What the caller of Telemetry.phase fills in while the phase runs
+@dataclass
+class Phase:
+    rows: int = 0
+    bytes: int = 0
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def percentile(values: List[float], q: float) -> float:
+    # Nearest rank, enough for the p50/p99 of latency benchmarks
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+# Phase timings and request observations of one run, aggregated by name and
+# labels so repeated phases (batches, shards, scripts) add up instead of
+# growing a list. Thread safe, the parallel loader records from its workers.
+class Telemetry:
+    def __init__(self):
+        self.started = time.time()
+        self.phases: Dict[Tuple[str, Labels], PhaseStats] = {}
+        self.requests: Dict[Labels, RequestStats] = {}
+        self._lock = Lock()
+
+    def record(
+        self, name: str, seconds: float, rows: int = 0, nbytes: int = 0, **labels
+    ):
+        with self._lock:
+            stats = self.phases.setdefault((name, _labels(labels)), PhaseStats())
+            stats.runs += 1
+            stats.seconds += seconds
+            stats.rows += rows
+            stats.bytes += nbytes
+
+    @contextmanager
+    def phase(self, name: str, **labels) -> Iterator[Phase]:
+        phase = Phase()
+        started = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            self.record(
+                name,
+                time.perf_counter() - started,
+                phase.rows,
+                phase.bytes,
+                **labels,
+            )
+
+    def observe_request(
+        self, seconds: float, nbytes: int = 0, **labels: Union[str, int]
+    ):
+        with self._lock:
+            stats = self.requests.setdefault(_labels(labels), RequestStats())
+            stats.count += 1
+            stats.seconds += seconds
+            stats.bytes += nbytes
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "duration_seconds": time.time() - self.started,
+                "phases": [
+                    {"phase": name, **dict(labels), **asdict(stats)}
+                    for (name, labels), stats in self.phases.items()
+                ],
+                "requests": [
+                    {
+                        **dict(labels),
+                        "count": stats.count,
+                        "seconds": stats.seconds,
+                        "bytes": stats.bytes,
+                    }
+                    for labels, stats in self.requests.items()
+                ],
+            }
+
+    def to_prometheus(self, job: str) -> str:
+        prefix = METRIC_PREFIX
+        lines = []
+        with self._lock:
+            phase_metrics = [
+                ("phase_runs_total", "counter", "runs"),
+                ("phase_seconds_total", "counter", "seconds"),
+                ("phase_rows_total", "counter", "rows"),
+                ("phase_bytes_total", "counter", "bytes"),
+            ]
+            for metric, metric_type, attribute in phase_metrics:
+                lines.append(f"# TYPE {prefix}_{metric} {metric_type}")
+                for (name, labels), stats in self.phases.items():
+                    series = _format_labels((("job", job), ("phase", name)) + labels)
+                    lines.append(
+                        f"{prefix}_{metric}{series} {getattr(stats, attribute)}"
+                    )
+
+            if self.requests:
+                metric = f"{prefix}_request_duration_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, stats in self.requests.items():
+                    labels = (("job", job),) + labels
+                    for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                        series = _format_labels(labels + (("le", str(bound)),))
+                        lines.append(f"{metric}_bucket{series} {count}")
+                    series = _format_labels(labels + (("le", "+Inf"),))
+                    lines.append(f"{metric}_bucket{series} {stats.count}")
+                    lines.append(
+                        f"{metric}_sum{_format_labels(labels)} {stats.seconds}"
+                    )
+                    lines.append(
+                        f"{metric}_count{_format_labels(labels)} {stats.count}"
+                    )
+
+                lines.append(f"# TYPE {prefix}_request_bytes_total counter")
+                for labels, stats in self.requests.items():
+                    series = _format_labels((("job", job),) + labels)
+                    lines.append(f"{prefix}_request_bytes_total{series} {stats.bytes}")
+
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(
+            f'{prefix}_last_run_timestamp_seconds{{job="{job}"}} {self.started}'
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: Union[str, Path], job: str):
+        # Written through a temporary file and renamed, so the node exporter's
+        # textfile collector never reads a partial file
+        os.makedirs(directory, exist_ok=True)
+        metrics = json.dumps({"job": job, **self.to_dict()}, indent=2)
+        outputs = [
+            (Path(directory) / f"{job}.json", metrics),
+            (Path(directory) / f"{job}.prom", self.to_prometheus(job)),
+        ]
+        for path, content in outputs:
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+
+# The process wide instance the loader and the collector record into
+TELEMETRY = Telemetry()
+
+
+def phase(name: str, **labels):
+    return TELEMETRY.phase(name, **labels)
+
+
+def record(name: str, seconds: float, rows: int = 0, nbytes: int = 0, **labels):
+    TELEMETRY.record(name, seconds, rows, nbytes, **labels)
+
+
+def observe_request(seconds: float, nbytes: int = 0, **labels: Union[str, int]):
+    TELEMETRY.observe_request(seconds, nbytes, **labels)
+
+
+def write_metrics(directory: Optional[Union[str, Path]], job: str):
+    if directory:
+        TELEMETRY.write(directory, job)
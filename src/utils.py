@@ -1,10 +1,14 @@
 from pathlib import Path
 import os
-from typing import List
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 import pandas as pd
-import json
 from loguru import logger
 from time import time
+import orjson
+from src import storage
 
 
 class Directory:
@@ -12,7 +16,7 @@ class Directory:
         self.path: Path = Path(path)
         self.files: List[Path] = []
 
-    def collect(self, suffix: str):
+    def collect(self, suffix: Union[str, Tuple[str, ...]] = storage.RAW_FILENAMES):
         for root, _, files in os.walk(self.path):
             for file in files:
                 if file.endswith(suffix):
@@ -22,13 +26,12 @@ class Directory:
 
 def file_list_to_df(files: List[Path]) -> pd.DataFrame:
     df: pd.DataFrame
-    if str(files[0]).endswith("json"):
+    if str(files[0]).endswith(storage.RAW_FILENAMES):
         start_time = time()
-        data = []
-        for file in files:
-            with open(file, "r") as in_file:
-                [data.append(json.loads(row)) for row in in_file.readlines()]
-        df = pd.json_normalize(data)
+        df = pd.concat(
+            [storage.read_frame(file, normalize=True) for file in files],
+            ignore_index=True,
+        )
         end_time = time()
         logger.info(
             f"Constructed dataframe from {len(files)} files ({df.size} rows) in {end_time - start_time:.2f} seconds"
@@ -37,3 +40,107 @@ def file_list_to_df(files: List[Path]) -> pd.DataFrame:
         return df
 
     return pd.DataFrame()
+
+
+def get_path(row: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    value: Any = row
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _day(value: Any) -> Optional[str]:
+    # NDJSON holds ISO strings, Parquet typed timestamps
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    return str(value)[:10]
+
+
+def count_file_by_day(
+    file: Path, date_path: str, group_path: Optional[str] = None
+) -> Counter:
+    counts: Counter = Counter()
+    if str(file).endswith(".parquet"):
+        # Parquet partitions are flattened, so only the two columns are read
+        import pyarrow.parquet as pq
+
+        columns = [date_path] + ([group_path] if group_path else [])
+        table = pq.read_table(file, columns=columns).to_pydict()
+        groups = table[group_path] if group_path else [None] * len(table[date_path])
+        for group, value in zip(groups, table[date_path]):
+            day = _day(value)
+            if day:
+                counts[(group, day)] += 1
+        return counts
+
+    date_keys = tuple(date_path.split("."))
+    group_keys = tuple(group_path.split(".")) if group_path else ()
+    for chunk in storage.iter_chunks(file):
+        for line in chunk.splitlines():
+            if not line:
+                continue
+            row = orjson.loads(line)
+            day = _day(get_path(row, date_keys))
+            if day:
+                group = get_path(row, group_keys) if group_keys else None
+                counts[(group, day)] += 1
+    return counts
+
+
+def count_files_by_day(
+    files: List[Path],
+    date_path: str,
+    group_path: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> Iterator[Counter]:
+    # The counters of the files in order, counted in parallel processes
+    count_file = partial(count_file_by_day, date_path=date_path, group_path=group_path)
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(count_file, files, chunksize=8)
+    else:
+        yield from map(count_file, files)
+
+
+def day_counts_frame(counts: Counter) -> pd.DataFrame:
+    return pd.DataFrame(
+        [(group, day, count) for (group, day), count in counts.items()],
+        columns=["group", "date", "count"],
+    )
+
+
+def format_day_counts(df: pd.DataFrame, group_path: Optional[str]) -> pd.DataFrame:
+    df = df.assign(date=pd.to_datetime(df["date"]))
+    if group_path:
+        df = df.rename(columns={"group": group_path.split(".")[-1]})
+    else:
+        df = df.drop("group", axis=1)
+    return df.sort_values(list(df.columns[:-1]), ignore_index=True)
+
+
+# Counts rows per day (and per group, e.g. repo) while the files are read,
+# parsing one line at a time and keeping only the counters, so memory grows
+# with the distinct days rather than with the rows. Files are counted in
+# parallel processes.
+def count_by_day(
+    files: List[Path],
+    date_path: str = "commit.committer.date",
+    group_path: Optional[str] = "repo",
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    start_time = time()
+    counts: Counter = Counter()
+    for file_counts in count_files_by_day(files, date_path, group_path, workers):
+        counts.update(file_counts)
+
+    df = format_day_counts(day_counts_frame(counts), group_path)
+    logger.info(
+        f"Counted {df['count'].sum()} rows into {len(df)} daily counts from "
+        f"{len(files)} files in {time() - start_time:.2f} seconds"
+    )
+    return df
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from src.engineering.github.cache import ResponseCache
+from src.engineering.github.client import GithubClient
+from src.engineering.github.standin import StandinConfig, StandinServer
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_stores_only_revalidatable_pages(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResponseCache(Path(tmp_dir) / "responses.sqlite")
+            params = {"page": 2}
+            cache.store("https://x/a", params, '"e"', None, "<next>", b"[1]")
+            cache.store("https://x/b", None, None, None, None, b"[2]")
+
+            entry = cache.lookup("https://x/a", params)
+            assert entry is not None
+            assert entry.content == b"[1]"
+            assert entry.link == "<next>"
+            assert entry.conditional_headers() == {"If-None-Match": '"e"'}
+            assert cache.lookup("https://x/a", {"page": 3}) is None
+            assert cache.lookup("https://x/b") is None
+            assert cache.stats.stores == 1
+            cache.close()
+
+    def test_not_modified_pages_are_served_from_the_cache(self):
+        async def fetch_twice(cache: ResponseCache):
+            async with StandinServer(StandinConfig(rows_per_repo=10)) as server:
+                url = f"{server.url}/repos/apache/kafka/commits"
+                async with GithubClient(tokens=[None], cache=cache) as client:
+                    first = await client.get(url, {"per_page": 100})
+                    second = await client.get(url, {"per_page": 100})
+                    return first, second
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResponseCache(Path(tmp_dir) / "responses.sqlite")
+            first, second = asyncio.run(fetch_twice(cache))
+
+            assert not first.from_cache
+            assert second.from_cache
+            assert second.status_code == 200
+            assert second.content == first.content
+            assert (cache.stats.misses, cache.stats.hits) == (1, 1)
+            cache.close()
+
+    def test_least_recently_used_pages_are_evicted(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Random bytes do not compress, so every page takes ~1 KB
+            cache = ResponseCache(Path(tmp_dir) / "responses.sqlite", max_bytes=3500)
+            for name in ["a", "b", "c"]:
+                cache.store(
+                    f"https://x/{name}", None, '"e"', None, None, os.urandom(1000)
+                )
+            cache.hit(cache.lookup("https://x/a"))  # type: ignore
+            cache.store("https://x/d", None, '"e"', None, None, os.urandom(1000))
+
+            assert cache.lookup("https://x/b") is None
+            for name in ["a", "c", "d"]:
+                assert cache.lookup(f"https://x/{name}") is not None
+            assert cache.stats.evictions == 1
+            assert cache.total_bytes <= cache.max_bytes
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
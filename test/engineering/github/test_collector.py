@@ -1,7 +1,19 @@
+import asyncio
+import tempfile
 import unittest
+from pathlib import Path
 from unittest.mock import patch
 import requests
-from src.engineering.github.collector import get_api_data, construct_api_url
+from src.engineering.github.cassette import Cassette
+from src.engineering.github.client import GithubClient
+from src.engineering.github.collector import (
+    Repository,
+    collect_and_paginate,
+    get_api_data,
+    construct_api_url,
+)
+from src.engineering.github.scheduler import RateLimitScheduler
+from src.engineering.github.standin import StandinConfig, StandinServer
 
 
 class TestGithubApi(unittest.TestCase):
@@ -15,7 +27,11 @@ class TestGithubApi(unittest.TestCase):
 
         params = {"per_page": 1}
 
-        resp = get_api_data(url, params)
+        async def fetch():
+            async with GithubClient() as client:
+                return await get_api_data(client, url, params)
+
+        resp = asyncio.run(fetch())
 
         resp_keys = resp.json()[0].keys()
 
@@ -27,5 +43,59 @@ class TestGithubApi(unittest.TestCase):
         assert "parents" in resp_keys
 
 
+class TestCollectorOffline(unittest.TestCase):
+    repo = Repository("apache", "kafka")
+
+    async def collect(self, config: StandinConfig, fan_out=False, **client_kwargs):
+        async with StandinServer(config) as server:
+            url = f"{server.url}/repos/apache/kafka/commits"
+            async with GithubClient(tokens=[None], **client_kwargs) as client:
+                return [
+                    row["sha"]
+                    async for page in collect_and_paginate(
+                        client, self.repo, url, {"per_page": 100}, fan_out
+                    )
+                    for row in page
+                ]
+
+    def test_paginates_standin_pages(self):
+        config = StandinConfig(rows_per_repo=250)
+        shas = asyncio.run(self.collect(config))
+        assert len(shas) == len(set(shas)) == 250
+        assert asyncio.run(self.collect(config, fan_out=True)) == shas
+
+    def test_retries_injected_errors(self):
+        config = StandinConfig(
+            rows_per_repo=250, error_rate=0.3, rate_limited_rate=0.2, retry_after=0
+        )
+        scheduler = RateLimitScheduler([None], max_retries=20, backoff_base=0.001)
+        shas = asyncio.run(self.collect(config, scheduler=scheduler))
+        assert len(set(shas)) == 250
+
+    def test_cassette_replays_without_network(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "cassette.ndjson"
+            config = StandinConfig(rows_per_repo=150)
+            recorded = asyncio.run(
+                self.collect(config, cassette=Cassette(path, "record"))
+            )
+
+            async def replay():
+                url = "http://127.0.0.1:1/repos/apache/kafka/commits"
+                async with GithubClient(
+                    tokens=[None], cassette=Cassette(path, "replay")
+                ) as client:
+                    return [
+                        row["sha"]
+                        async for page in collect_and_paginate(
+                            client, self.repo, url, {"per_page": 100}
+                        )
+                        for row in page
+                    ]
+
+            assert len(recorded) == 150
+            assert asyncio.run(replay()) == recorded
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from src import storage
+from src.engineering.github.dedup import DedupIndex, compact
+from src.engineering.github.writer import PartitionWriter
+from src.utils import Directory
+
+
+def commit_row(sha: str, date: str):
+    return {"sha": sha, "repo": "o/r", "commit": {"committer": {"date": date}}}
+
+
+class TestDedupIndex(unittest.TestCase):
+    def write(self, tmp_dir: str, index: DedupIndex, rows, abort: bool = False):
+        writer = PartitionWriter(
+            Path(tmp_dir) / "raw",
+            "commit.committer.date",
+            dedup=index,
+            source="commits",
+        )
+        writer.write(rows)
+        if abort:
+            writer.abort()
+        else:
+            writer.commit()
+        return writer
+
+    def test_reruns_skip_written_rows(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = DedupIndex(Path(tmp_dir) / "dedup.sqlite")
+            day = Path(tmp_dir) / "raw" / "2024" / "01" / "01" / "data.json"
+
+            self.write(tmp_dir, index, [commit_row("a", "2024-01-01T10:00:00Z")])
+            self.write(
+                tmp_dir, index, [commit_row("b", "2024-01-01T11:00:00Z")], abort=True
+            )
+            writer = self.write(
+                tmp_dir,
+                index,
+                [
+                    commit_row("a", "2024-01-01T10:00:00Z"),
+                    commit_row("b", "2024-01-01T11:00:00Z"),
+                    commit_row("b", "2024-01-01T11:00:00Z"),
+                ],
+            )
+
+            assert [r["sha"] for r in storage.iter_records(day)] == ["a", "b"]
+            assert writer.stats.duplicates == 2
+
+            # A partition removed behind the index's back is re-read
+            os.remove(day)
+            self.write(tmp_dir, index, [commit_row("a", "2024-01-01T10:00:00Z")])
+            assert [r["sha"] for r in storage.iter_records(day)] == ["a"]
+            index.close()
+
+    def test_partitions_without_new_rows_are_not_rewritten(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = DedupIndex(Path(tmp_dir) / "dedup.sqlite")
+            day = Path(tmp_dir) / "raw" / "2024" / "01" / "01" / "data.json"
+            rows = [commit_row("a", "2024-01-01T10:00:00Z")]
+
+            self.write(tmp_dir, index, rows)
+            os.utime(day, ns=(0, 0))
+            writer = self.write(tmp_dir, index, rows)
+
+            assert os.stat(day).st_mtime_ns == 0
+            assert os.listdir(day.parent) == ["data.json"]
+            assert writer.stats.partitions == 0
+            index.close()
+
+    def test_compact_removes_duplicates(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            day = Path(tmp_dir) / "raw" / "2024" / "01" / "01" / "data.json"
+            os.makedirs(day.parent)
+            storage.RAW_FORMATS["json"].write(
+                day,
+                [
+                    commit_row("a", "2024-01-01T10:00:00Z"),
+                    commit_row("b", "2024-01-01T11:00:00Z"),
+                    commit_row("a", "2024-01-01T10:00:00Z"),
+                ],
+            )
+
+            index = DedupIndex(Path(tmp_dir) / "dedup.sqlite")
+            compact("commits", Directory(str(Path(tmp_dir) / "raw")), index)
+
+            assert [r["sha"] for r in storage.iter_records(day)] == ["a", "b"]
+            assert os.listdir(day.parent) == ["data.json"]
+            assert not index.add("commits", "o/r:b", str(day))
+            index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from datetime import datetime
+from src.engineering.github.extract import COMMITS, commit_tuple, issue_tuple
+
+
+class TestTypedExtract(unittest.TestCase):
+    def test_commit_tuple_matches_staging_columns(self):
+        row = {
+            "sha": "a",
+            "node_id": "C_a",
+            "commit": {"author": {"date": "2024-01-01T10:00:00Z"}},
+            "author": {"id": 1, "login": "octocat"},
+            "committer": None,
+            "repo": "apache/kafka",
+        }
+
+        values = commit_tuple(row)
+
+        assert len(values) == len(COMMITS.columns)
+        assert values == (
+            "a",
+            "C_a",
+            "1",
+            datetime(2024, 1, 1, 10),
+            "apache/kafka",
+            None,
+        )
+
+    def test_issue_tuple_collects_label_names(self):
+        row = {
+            "id": 7,
+            "number": 3,
+            "labels": [{"name": "bug"}, {"name": "ui"}],
+            "created_at": "2024-01-01T10:00:00Z",
+            "updated_at": "2024-01-02T10:00:00Z",
+            "closed_at": None,
+        }
+
+        values = issue_tuple(row)
+
+        assert values[2] == "7"
+        assert values[6] == ["bug", "ui"]
+        assert values[11] == datetime(2024, 1, 2, 10)
+        assert values[12] is None
+
+
+if __name__ == "__main__":
+    unittest.main()
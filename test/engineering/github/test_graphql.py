@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from aiohttp import web
+from src.engineering.github import collector
+from src.engineering.github.client import GithubClient
+from src.engineering.github.collector import Repository
+from src.engineering.github.graphql import commit_to_rest
+from src.engineering.github.scheduler import RateLimitScheduler
+
+
+def user_node(login: str, typename: str = "User") -> dict:
+    return {
+        "__typename": typename,
+        "login": login,
+        "databaseId": 1,
+        "id": "U_1",
+        "avatarUrl": "https://avatars.githubusercontent.com/u/1",
+        "isSiteAdmin": False,
+    }
+
+
+def rest_user(login: str, typename: str = "User") -> dict:
+    return {
+        "login": login,
+        "id": 1,
+        "node_id": "U_1",
+        "avatar_url": "https://avatars.githubusercontent.com/u/1",
+        "url": collector.API_BASEURL + "/users/" + login,
+        "html_url": "https://github.com/" + login,
+        "type": typename,
+        "user_view_type": None,
+        "site_admin": False,
+    }
+
+
+class TestCommitToRest(unittest.TestCase):
+    def test_graphql_node_matches_rest_row(self):
+        node = {
+            "oid": "abc",
+            "id": "C_abc",
+            "url": "https://github.com/apache/kafka/commit/abc",
+            "message": "Fix",
+            "tree": {"oid": "t"},
+            "parents": {"nodes": [{"oid": "p", "url": "https://github.com/p"}]},
+            "author": {
+                "name": "Octo",
+                "email": "octo@example.com",
+                "date": "2024-03-01T12:00:00Z",
+                "user": user_node("octocat"),
+            },
+            "committer": {
+                "name": "Bot",
+                "email": "bot@example.com",
+                # Local time of the committer, the next day in UTC
+                "date": "2024-03-01T23:30:00-02:00",
+                "user": user_node("dependabot[bot]", "Bot"),
+            },
+        }
+        rest = {
+            "sha": "abc",
+            "node_id": "C_abc",
+            "commit": {
+                "author": {
+                    "name": "Octo",
+                    "email": "octo@example.com",
+                    "date": "2024-03-01T12:00:00Z",
+                },
+                "committer": {
+                    "name": "Bot",
+                    "email": "bot@example.com",
+                    "date": "2024-03-02T01:30:00Z",
+                },
+                "message": "Fix",
+                "tree": {"sha": "t"},
+            },
+            "html_url": "https://github.com/apache/kafka/commit/abc",
+            "author": rest_user("octocat"),
+            "committer": rest_user("dependabot[bot]", "Bot"),
+            "parents": [{"sha": "p", "html_url": "https://github.com/p"}],
+            "repo": "apache/kafka",
+        }
+
+        assert commit_to_rest(node, Repository("apache", "kafka")) == rest
+
+
+class TestRateLimitedQueries(unittest.TestCase):
+    def test_rate_limited_query_is_retried_with_another_token(self):
+        tokens = []
+
+        async def handle(request: web.Request) -> web.Response:
+            tokens.append(request.headers["Authorization"])
+            if len(tokens) == 1:
+                # GitHub answers an exhausted GraphQL budget with a 200
+                return web.json_response(
+                    {"errors": [{"type": "RATE_LIMITED", "message": "rate limit"}]}
+                )
+            return web.json_response({"data": {"r0": {"name": "kafka"}}})
+
+        async def query():
+            app = web.Application()
+            app.router.add_post("/graphql", handle)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]  # type: ignore
+            scheduler = RateLimitScheduler(tokens=["a", "b"], backoff_base=0.01)
+            try:
+                async with GithubClient(scheduler=scheduler) as client:
+                    return await client.post(
+                        f"http://127.0.0.1:{port}/graphql", {"query": "{}"}
+                    )
+            finally:
+                await runner.cleanup()
+
+        resp = asyncio.run(query())
+
+        assert resp.json() == {"data": {"r0": {"name": "kafka"}}}
+        assert tokens == ["Bearer a", "Bearer b"]
+
+
+if __name__ == "__main__":
+    unittest.main()
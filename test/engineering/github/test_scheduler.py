@@ -0,0 +1,63 @@
+import asyncio
+import time
+import unittest
+from src.engineering.github.scheduler import RateLimitScheduler
+
+
+class TestRateLimitScheduler(unittest.TestCase):
+    def test_spreads_requests_to_token_with_most_budget(self):
+        scheduler = RateLimitScheduler(tokens=["a", "b"], reserve=0)
+        budget = asyncio.run(scheduler.acquire())
+        scheduler.release(
+            budget,
+            200,
+            {"X-RateLimit-Remaining": "1", "X-RateLimit-Reset": str(time.time() + 60)},
+        )
+
+        assert asyncio.run(scheduler.acquire()).token != budget.token
+
+    def test_exhausted_token_is_parked_until_reset(self):
+        scheduler = RateLimitScheduler(tokens=["a", "b"], reserve=0)
+        budget = asyncio.run(scheduler.acquire())
+        reset_at = time.time() + 600
+        headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset_at)}
+        scheduler.release(budget, 403, headers)
+
+        assert budget.blocked_until == int(reset_at)
+        assert scheduler.should_retry(403, headers)
+        for _ in range(3):
+            other = asyncio.run(scheduler.acquire())
+            assert other.token != budget.token
+            scheduler.release(other)
+
+    def test_secondary_limit_honours_retry_after(self):
+        scheduler = RateLimitScheduler(tokens=["a"], reserve=0)
+        budget = asyncio.run(scheduler.acquire())
+        scheduler.release(budget, 403, {"Retry-After": "30"})
+
+        assert budget.blocked_until > time.time() + 25
+
+    def test_forbidden_without_rate_limit_is_not_retried(self):
+        scheduler = RateLimitScheduler(tokens=["a"])
+
+        assert not scheduler.should_retry(
+            403, {"X-RateLimit-Remaining": "4000"}, b'{"message": "Forbidden"}'
+        )
+        assert scheduler.should_retry(502, {})
+
+    def test_graphql_rate_limited_errors_are_retried(self):
+        scheduler = RateLimitScheduler(tokens=["a", "b"], reserve=0)
+        budget = asyncio.run(scheduler.acquire())
+        content = b'{"errors": [{"type": "RATE_LIMITED", "message": "API rate limit"}]}'
+        scheduler.release(budget, 200, {}, content)
+
+        assert scheduler.should_retry(200, {}, content)
+        assert budget.blocked_until > time.time()
+        assert not scheduler.should_retry(200, {}, b'[{"message": "RATE_LIMITED"}]')
+        assert not scheduler.should_retry(
+            200, {}, b'{"errors": [{"type": "NOT_FOUND"}]}'
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+from src import storage
+from src.engineering.github import collector
+from src.engineering.github.standin import (
+    SYNTHETIC_SINCE,
+    SYNTHETIC_UNTIL,
+    StandinConfig,
+    serve_in_thread,
+)
+from src.engineering.github.watermarks import (
+    WatermarkStore,
+    parse_timestamp,
+    window_start,
+)
+from src.engineering.github.writer import PartitionWriter
+from src.utils import Directory
+
+
+class TestWatermarks(unittest.TestCase):
+    def test_watermarks_only_move_forward(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "watermarks.json"
+            store = WatermarkStore(path)
+            store.advance("commits", "o/r", "2024-01-02T00:00:00Z")
+            store.advance("commits", "o/r", "2024-01-01T00:00:00Z")
+            store.save()
+
+            assert WatermarkStore(path).get("commits", "o/r") == "2024-01-02T00:00:00Z"
+
+    def test_reruns_within_a_day_share_their_window(self):
+        # Same since parameter, so the cached pages are revalidated
+        assert (
+            window_start("2024-01-02T08:00:00Z")
+            == window_start("2024-01-02T23:59:59Z")
+            == date(2024, 1, 2)
+        )
+
+    def test_watermarks_advance_only_with_committed_partitions(self):
+        def collect(tmp_dir: str):
+            collector.main(
+                source="commits",
+                repos=["apache/kafka", "apache/spark"],
+                since=parse_timestamp(SYNTHETIC_SINCE),
+                until=parse_timestamp(SYNTHETIC_UNTIL),
+                cache_path=None,
+                watermarks_path=Path(tmp_dir) / "watermarks.json",
+                dedup_index_path=None,
+            )
+
+        cwd = os.getcwd()
+        config = StandinConfig(rows_per_repo=50)
+        with tempfile.TemporaryDirectory() as tmp_dir, serve_in_thread(
+            config
+        ) as server, patch.object(collector, "API_BASEURL", server.url):
+            # main writes to the relative data/ paths
+            os.chdir(tmp_dir)
+            try:
+                with patch.object(
+                    PartitionWriter, "commit", side_effect=OSError("disk full")
+                ):
+                    with self.assertRaises(OSError):
+                        collect(tmp_dir)
+                assert not (Path(tmp_dir) / "watermarks.json").exists()
+
+                collect(tmp_dir)
+                files = Directory(str(collector.GITHUB_COMMITS_RAW_DIR_PATH)).collect()
+                newest = max(
+                    row["commit"]["committer"]["date"]
+                    for file in files
+                    for row in storage.iter_records(file)
+                    if row["repo"] == "apache/kafka"
+                )
+            finally:
+                os.chdir(cwd)
+
+            watermarks = WatermarkStore(Path(tmp_dir) / "watermarks.json")
+            assert watermarks.get("commits", "apache/kafka") == newest
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from src import storage
+from src.engineering.github.writer import PartitionWriter
+
+
+def commit_row(sha: str, date: str):
+    return {"sha": sha, "commit": {"committer": {"date": date}}}
+
+
+class TestPartitionWriter(unittest.TestCase):
+    def test_partitions_appear_only_on_commit(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = PartitionWriter(
+                Path(tmp_dir), "commit.committer.date", max_open_handles=1
+            )
+            writer.write(
+                [
+                    commit_row("a", "2024-01-01T10:00:00Z"),
+                    commit_row("b", "2024-01-02T10:00:00Z"),
+                    commit_row("c", "2024-01-01T11:00:00Z"),
+                ]
+            )
+            day = Path(tmp_dir) / "2024" / "01" / "01" / "data.json"
+            assert not day.exists()
+
+            writer.commit()
+
+            assert [r["sha"] for r in storage.iter_records(day)] == ["a", "c"]
+            assert writer.stats.rows == 3
+
+    def test_commit_extends_and_abort_discards(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            day_dir = Path(tmp_dir) / "2024" / "01" / "01"
+            with PartitionWriter(Path(tmp_dir), "commit.committer.date") as writer:
+                writer.write([commit_row("a", "2024-01-01T10:00:00Z")])
+            with PartitionWriter(Path(tmp_dir), "commit.committer.date") as writer:
+                writer.write([commit_row("b", "2024-01-01T11:00:00Z")])
+
+            writer = PartitionWriter(Path(tmp_dir), "commit.committer.date")
+            writer.write([commit_row("c", "2024-01-01T12:00:00Z")])
+            writer.abort()
+
+            rows = storage.iter_records(day_dir / "data.json")
+            assert [r["sha"] for r in rows] == ["a", "b"]
+            assert os.listdir(day_dir) == ["data.json"]
+
+    def test_failed_commit_removes_temp_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = PartitionWriter(Path(tmp_dir), "commit.committer.date")
+            writer.write(
+                [
+                    commit_row("a", "2024-01-01T10:00:00Z"),
+                    commit_row("b", "2024-01-02T10:00:00Z"),
+                ]
+            )
+
+            with patch("os.replace", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    writer.commit()
+
+            for day in ["01", "02"]:
+                assert os.listdir(Path(tmp_dir) / "2024" / "01" / day) == []
+            assert writer.partitions == {}
+
+
+if __name__ == "__main__":
+    unittest.main()
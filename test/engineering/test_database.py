@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+# The module reads its connection string on import; these tests never connect
+os.environ.setdefault("DATABASE_CONNECTION_STRING", "postgresql://localhost/test")
+from src.engineering.database import shard_files, staging_tables  # noqa: E402
+
+
+class TestParallelLoad(unittest.TestCase):
+    def test_shards_cover_every_file_once_and_balance_bytes(self):
+        sizes = [900, 500, 400, 300, 300, 200, 100, 50]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for i, size in enumerate(sizes):
+                path = Path(tmp_dir) / f"{i}.json"
+                path.write_bytes(b"x" * size)
+                files.append(path)
+
+            shards = shard_files(files, 3)
+            shard_bytes = [sum(os.path.getsize(f) for f in shard) for shard in shards]
+
+            assert sorted(f for shard in shards for f in shard) == sorted(files)
+            assert len(shards) == 3
+            assert max(shard_bytes) - min(shard_bytes) <= max(sizes)
+            assert len(shard_files(files[:2], 3)) == 2
+
+    def test_staging_tables_are_unique_per_run_and_shard(self):
+        first, second = staging_tables(4), staging_tables(4)
+
+        assert len(set(first)) == len(set(second)) == 4
+        assert not set(first) & set(second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+from src.engineering import manifest as manifest_module
+from src.engineering.manifest import FileState, LoadManifest, content_hash, plan_batches
+
+
+class TestLoadManifest(unittest.TestCase):
+    def test_only_new_or_changed_files_are_pending(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            old = Path(tmp_dir) / "2024" / "01" / "01" / "data.json"
+            touched = Path(tmp_dir) / "2024" / "01" / "02" / "data.json"
+            new = Path(tmp_dir) / "2024" / "01" / "03" / "data.json"
+            for path in [old, touched, new]:
+                os.makedirs(path.parent)
+                path.write_text(f'{{"path": "{path}"}}\n')
+
+            manifest = LoadManifest("commits")
+            for path in [old, touched]:
+                stat = os.stat(path)
+                manifest.entries[str(path)] = (
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    content_hash(path),
+                )
+            os.utime(touched, ns=(0, 0))
+
+            assert [s.path for s in manifest.changed([old, touched, new])] == [new]
+            assert [s.path for s in manifest.refreshed] == [touched]
+
+            since = manifest.changed([old, touched, new], since=date(2024, 1, 2))
+            assert [s.path for s in since] == [touched, new]
+            assert len(manifest.changed([old, touched, new], force=True)) == 3
+
+    def test_touched_files_are_refreshed_and_not_hashed_again(self):
+        class RecordingCursor:
+            def __init__(self):
+                self.rows = []
+
+            def executemany(self, query, rows):
+                self.rows += rows
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            touched = Path(tmp_dir) / "2024" / "01" / "02" / "data.json"
+            os.makedirs(touched.parent)
+            touched.write_text('{"a": 1}\n')
+            stat = os.stat(touched)
+
+            manifest = LoadManifest("commits")
+            manifest.entries[str(touched)] = (
+                stat.st_size,
+                stat.st_mtime_ns,
+                content_hash(touched),
+            )
+            os.utime(touched, ns=(0, 0))
+
+            assert manifest.changed([touched]) == []
+            cur = RecordingCursor()
+            manifest.refresh(cur)  # type: ignore
+            assert cur.rows == [(0, str(touched), "commits")]
+
+            # The next run reads the refreshed entry and trusts the mtime
+            next_run = LoadManifest("commits")
+            next_run.entries = dict(manifest.entries)
+            with patch.object(manifest_module, "content_hash") as hashed:
+                assert next_run.changed([touched]) == []
+            hashed.assert_not_called()
+            assert next_run.refreshed == []
+
+    def test_batches_hold_whole_partitions(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            states = []
+            for day, rows in [(3, 1), (1, 2), (2, 2), (1, 1)]:
+                path = (
+                    Path(tmp_dir) / "2024" / "01" / f"{day:02}" / f"{len(states)}.json"
+                )
+                os.makedirs(path.parent, exist_ok=True)
+                path.write_text('{"a": 1}\n' * rows)
+                states.append(FileState(path, 0, 0))
+
+            def days(batches):
+                return [[s.path.parent.name for s in batch] for batch in batches]
+
+            assert days(plan_batches(states, batch_partitions=2)) == [
+                ["01", "01", "02"],
+                ["03"],
+            ]
+            assert days(plan_batches(states, batch_rows=2)) == [
+                ["01", "01"],
+                ["02"],
+                ["03"],
+            ]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+from datetime import date
+from src.engineering.partitions import add_months, month_start, partition_name
+
+
+class TestPartitions(unittest.TestCase):
+    def test_months_roll_over_years(self):
+        assert month_start(date(2024, 12, 31)) == date(2024, 12, 1)
+        assert add_months(date(2024, 12, 1), 1) == date(2025, 1, 1)
+        assert add_months(date(2024, 1, 1), -13) == date(2022, 12, 1)
+
+    def test_partition_name_sorts_by_month(self):
+        assert partition_name("commits", date(2024, 3, 1)) == "commits_2024_03"
+
+
+if __name__ == "__main__":
+    unittest.main()
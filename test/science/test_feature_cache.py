@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from src.science.feature_cache import FeatureCache
+from src.utils import count_by_day
+
+
+def write_partition(root: Path, day: int, repos):
+    path = root / "2024" / "01" / f"{day:02}" / "data.json"
+    os.makedirs(path.parent, exist_ok=True)
+    path.write_text(
+        "".join(
+            f'{{"commit": {{"committer": {{"date": "2024-01-{day:02}T10:00:00Z"}}}}, '
+            f'"repo": "{repo}"}}\n'
+            for repo in repos
+        )
+    )
+    return path
+
+
+class TestFeatureCache(unittest.TestCase):
+    def test_only_changed_partitions_are_recounted(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir) / "commits"
+            files = [
+                write_partition(root, 1, ["a/x", "a/x"]),
+                write_partition(root, 2, ["b/y"]),
+            ]
+            cache = FeatureCache(Path(tmp_dir) / "cache")
+
+            first = cache.count_by_day(files, workers=1)
+            assert cache.stats.misses == 2
+
+            write_partition(root, 2, ["b/y", "a/x"])
+            os.utime(files[0], ns=(0, 0))
+            second = cache.count_by_day(files, workers=1)
+
+            assert cache.stats.hits == 1 and cache.stats.misses == 3
+            assert second.equals(count_by_day(files, workers=1))
+            assert len(second) == len(first) + 1
+
+            assert cache.invalidate([files[0]]) == 1
+            cache.count_by_day(files, workers=1)
+            assert cache.stats.misses == 4
+            cache.close()
+
+    def test_evicts_least_recently_used_partitions(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir) / "commits"
+            files = [write_partition(root, day, ["a/x"]) for day in range(1, 6)]
+            cache = FeatureCache(Path(tmp_dir) / "cache", max_bytes=1)
+
+            cache.count_by_day(files, workers=1)
+
+            assert cache.stats.evictions > 0
+            assert cache.total_bytes <= 1
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
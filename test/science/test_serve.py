@@ -0,0 +1,115 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import aiohttp
+import pandas as pd
+
+from src.science.loadtest import fit_synthetic_model, synthetic_counts
+from src.science.serve import FeatureTable, ModelStore, PredictionService
+from src.science.train import MODEL_FILENAME, model_fn
+
+
+def touch(path: Path):
+    # Bumps the mtime even on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+
+class TestPredictionService(unittest.TestCase):
+    def test_predictions_are_batched_cached_and_reloaded(self):
+        counts = synthetic_counts(repo_count=5, days=60)
+        next_day = "2024-07-01"
+        instances = [{"repo": r, "date": next_day} for r in counts["repo"].unique()]
+        keys = [(i["repo"], pd.Timestamp(i["date"])) for i in instances]
+        results = {}
+
+        async def run(model_dir: Path):
+            store = ModelStore(model_dir, lambda: counts)
+            async with PredictionService(store, reload_interval=3600) as service:
+                async with aiohttp.ClientSession() as session:
+
+                    async def predict(instances):
+                        async with session.post(
+                            f"{service.url}/predict", json={"instances": instances}
+                        ) as response:
+                            body = await response.json()
+                        return [p.get("prediction") for p in body["predictions"]]
+
+                    single = await asyncio.gather(*[predict([i]) for i in instances])
+                    results["concurrent"] = [p for [p] in single]
+                    results["repeated"] = await predict(instances)
+                    results["unknown"] = await predict(
+                        [{"repo": "a/b", "date": next_day}]
+                    )
+                    results["hits"] = service.stats.cache_hits
+
+                    version = store.current.version
+                    fit_synthetic_model(counts, model_dir, max_iter=5)
+                    touch(model_dir / MODEL_FILENAME)
+                    assert await service.reload_if_changed()
+                    assert store.current.version != version
+                    results["reloaded"] = await predict(instances)
+                    results["stats"] = service.stats
+
+        with tempfile.TemporaryDirectory() as model_dir:
+            fit_synthetic_model(counts, Path(model_dir))
+            X = FeatureTable(counts).rows(keys)
+            expected = model_fn(model_dir).predict(X).tolist()
+
+            asyncio.run(run(Path(model_dir)))
+            reloaded_expected = model_fn(model_dir).predict(X).tolist()
+
+        assert results["concurrent"] == expected
+        assert results["repeated"] == expected
+        assert results["hits"] == len(instances)
+        assert results["unknown"] == [None]
+        assert results["reloaded"] == reloaded_expected
+        assert results["reloaded"] != expected
+
+        stats = results["stats"]
+        assert stats.reloads == 1
+        assert stats.batches < stats.predictions
+
+    def test_reload_between_check_and_prediction(self):
+        counts = synthetic_counts(repo_count=3, days=60)
+        dropped = counts["repo"].iloc[0]
+        key = (dropped, pd.Timestamp("2024-07-01"))
+        latest = {"counts": counts}
+
+        async def run(model_dir: Path):
+            store = ModelStore(model_dir, lambda: latest["counts"])
+            # A long linger keeps the request queued while the reload happens
+            service = PredictionService(store, max_wait_ms=1000, reload_interval=3600)
+            async with service:
+                before = store.current
+                pending = asyncio.create_task(service.predict(before, key))
+                await asyncio.sleep(0.05)
+
+                latest["counts"] = counts[counts["repo"] != dropped]
+                fit_synthetic_model(latest["counts"], model_dir, max_iter=5)
+                touch(model_dir / MODEL_FILENAME)
+                assert await service.reload_if_changed()
+                assert key not in store.current.table
+
+                predicted = await pending
+                missing = await service.predict(store.current, key)
+                unknown = (dropped, pd.Timestamp("2030-01-01"))
+                unknown_prediction = await service.batcher.predict(before, unknown)
+                return before, predicted, missing, unknown_prediction
+
+        with tempfile.TemporaryDirectory() as model_dir:
+            fit_synthetic_model(counts, Path(model_dir))
+            before, predicted, missing, unknown_prediction = asyncio.run(
+                run(Path(model_dir))
+            )
+
+        assert predicted["prediction"] == before.predict([key])[0]
+        assert "error" in missing
+        assert unknown_prediction is None
+
+
+if __name__ == "__main__":
+    unittest.main()
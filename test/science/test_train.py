@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.science.train import (
+    MAX_CATEGORIES,
+    features,
+    prepare,
+    time_split,
+    train_per_repo,
+)
+
+
+class TestPrepare(unittest.TestCase):
+    def test_lags_are_days_within_each_repo(self):
+        counts = pd.DataFrame(
+            {
+                "repo": ["a/x", "a/x", "b/y"],
+                "date": pd.to_datetime(["2024-01-01", "2024-01-03", "2024-01-02"]),
+                "count": [2, 5, 1],
+            }
+        )
+
+        df = prepare(counts)
+
+        a = df[df["repo"] == "a/x"]
+        assert a["commit_count"].tolist() == [2, 0, 5]
+        assert a["commit_count_lag2"].tolist()[2] == 2
+        assert df[df["repo"] == "b/y"]["commit_count_lag1"].isna().tolist() == [
+            True,
+            False,
+        ]
+        assert df["dow"].tolist() == [0, 1, 2, 1, 2]
+
+        train, test = time_split(df, test_size=0.34)
+        assert train["commit_date"].max() < test["commit_date"].min()
+
+    def test_repo_codes_follow_the_training_categories(self):
+        repos = [f"owner/repo{i:03}" for i in range(MAX_CATEGORIES + 10)]
+        counts = pd.DataFrame(
+            {"repo": repos, "date": pd.Timestamp("2024-01-01"), "count": 1}
+        )
+        categories = prepare(counts)["repo"].cat.categories.tolist()
+
+        # A serving frame without the first repositories
+        subset = prepare(counts[counts["repo"] >= "owner/repo100"])
+        X = features(subset, categories)
+
+        assert X["repo"].tolist() == [categories.index(r) for r in subset["repo"]]
+
+    def test_per_repo_search_fits_one_model_per_repo(self):
+        days = pd.date_range("2024-01-01", periods=120)
+        counts = pd.DataFrame(
+            {
+                "repo": ["a/x"] * 120 + ["b/y"] * 120 + ["c/z"] * 5,
+                "date": list(days) * 2 + list(days[-5:]),
+                "count": list(np.arange(120) % 7) * 2 + [1] * 5,
+            }
+        )
+        grid = {"learning_rate": [0.1, 0.3], "max_iter": [50], "max_leaf_nodes": [7]}
+
+        summary, models, predictions = train_per_repo(
+            prepare(counts), workers=2, param_grid=grid, budget_seconds=30
+        )
+
+        assert summary["repo"].tolist() == ["a/x", "b/y"]
+        assert summary["candidates"].tolist() == [2, 2]
+        assert set(models) == {"a/x", "b/y"}
+        assert set(predictions["repo"]) == {"a/x", "b/y"}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import unittest
+import uuid
+from contextlib import contextmanager, nullcontext
+from src import db_utils
+from src.db_utils import _reset, connection, cursor
+
+# A scratch database for the tests that need a server, e.g.
+# postgresql://postgres@localhost/postgres
+TEST_CONNECTION_STRING = os.environ.get("TEST_DATABASE_CONNECTION_STRING")
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.autocommit = False
+        self.events = []
+
+    def cursor(self):
+        return nullcontext(self)
+
+    def execute(self, query, params=None):
+        self.events.append(query)
+
+    def commit(self):
+        self.events.append("commit")
+
+    def rollback(self):
+        self.events.append("rollback")
+
+
+class RecordingPool:
+    def __init__(self, conn: RecordingConnection):
+        self.conn = conn
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+
+class TestPooledCursor(unittest.TestCase):
+    def setUp(self):
+        self.conn = RecordingConnection()
+        self.key = f"recording-{uuid.uuid4().hex}"
+        db_utils._pools[self.key] = RecordingPool(self.conn)  # type: ignore
+
+    def tearDown(self):
+        db_utils._pools.pop(self.key, None)
+
+    def test_commits_only_when_asked(self):
+        with cursor(self.key, commit=True) as cur:
+            cur.execute("INSERT")
+        with cursor(self.key) as cur:
+            cur.execute("SELECT")
+
+        assert self.conn.events == ["INSERT", "commit", "SELECT", "rollback"]
+
+    def test_errors_roll_back_and_propagate(self):
+        with self.assertRaises(ValueError):
+            with cursor(self.key, commit=True) as cur:
+                cur.execute("INSERT")
+                raise ValueError("bad row")
+
+        assert self.conn.events == ["INSERT", "rollback"]
+
+    def test_reset_keeps_prepared_statements(self):
+        _reset(self.conn)  # type: ignore
+
+        assert self.conn.events == ["RESET ALL", "DISCARD TEMP"]
+        assert not self.conn.autocommit
+
+
+@unittest.skipUnless(TEST_CONNECTION_STRING, "TEST_DATABASE_CONNECTION_STRING not set")
+class TestPoolAgainstServer(unittest.TestCase):
+    def test_commit_rollback_and_reuse_after_reset(self):
+        cs = str(TEST_CONNECTION_STRING)
+        table = f"pool_test_{uuid.uuid4().hex[:8]}"
+        with cursor(cs, commit=True) as cur:
+            cur.execute(f"CREATE TABLE {table} (id int)")
+        try:
+            with cursor(cs, commit=True) as cur:
+                cur.execute(f"INSERT INTO {table} VALUES (1)")
+            with self.assertRaises(ValueError):
+                with cursor(cs, commit=True) as cur:
+                    cur.execute(f"INSERT INTO {table} VALUES (2)")
+                    raise ValueError("bad row")
+            with cursor(cs) as cur:
+                cur.execute(f"SELECT id FROM {table}")
+                assert cur.fetchall() == [(1,)]
+
+            # Past psycopg's prepare threshold, then across checkouts
+            for _ in range(3):
+                with connection(cs) as conn:
+                    conn.execute("CREATE TEMP TABLE staging (data jsonb)")
+                    for _ in range(10):
+                        conn.execute("SELECT to_regclass(%s)", (table,))
+        finally:
+            with cursor(cs, commit=True) as cur:
+                cur.execute(f"DROP TABLE {table}")
+
+
+if __name__ == "__main__":
+    unittest.main()
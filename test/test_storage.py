@@ -0,0 +1,102 @@
+import tempfile
+import unittest
+from pathlib import Path
+from src import storage
+
+ROWS = [
+    {
+        "sha": "a",
+        "commit": {"committer": {"date": "2024-01-01T10:00:00Z"}},
+        "author": None,
+        "parents": [{"sha": "x"}],
+        "repo": "apache/kafka",
+    },
+    {
+        "sha": "b",
+        "commit": {"committer": {"date": "2024-01-01T11:00:00Z"}},
+        "author": {"login": "octocat", "id": 1},
+        "parents": [],
+        "repo": "apache/kafka",
+    },
+]
+
+
+class TestRawFormats(unittest.TestCase):
+    def test_appended_rows_round_trip_in_every_format(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for raw_format in storage.RAW_FORMATS.values():
+                path = Path(tmp_dir) / raw_format.filename
+                raw_format.write(path, ROWS[:1])
+                raw_format.write(path, ROWS[1:])
+
+                assert list(storage.iter_records(path)) == ROWS
+
+    def test_objects_of_nulls_are_not_read_back_as_null(self):
+        rows = [
+            {
+                "sha": "a",
+                "commit": {"verification": {"reason": None, "signature": None}},
+                "author": None,
+                "stats": {},
+            },
+            {
+                "sha": "b",
+                "commit": {"verification": {"reason": "valid", "signature": "s"}},
+                "author": {"login": "octocat"},
+                "stats": {},
+            },
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for raw_format in storage.RAW_FORMATS.values():
+                path = Path(tmp_dir) / raw_format.filename
+                raw_format.write(path, rows)
+
+                assert list(storage.iter_records(path)) == rows
+
+    def test_parquet_flattens_nested_fields_into_typed_columns(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "data.parquet"
+            storage.RAW_FORMATS["parquet"].write(path, ROWS)
+
+            df = storage.read_frame(path, normalize=True)
+
+            assert "commit.committer.date" in df.columns
+            assert str(df["commit.committer.date"].dtype).startswith("datetime64")
+
+    def test_parquet_appends_survive_column_type_drift(self):
+        batches = [
+            [{"id": 1, "size": 1, "tags": ["a"], "closed_at": "2024-01-01T10:00:00Z"}],
+            [{"id": "x", "size": 2.5, "tags": "a", "closed_at": "not a date"}],
+            [{"id": 3, "size": 3, "tags": [1, "b"], "closed_at": None}],
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "data.parquet"
+            for rows in batches:
+                storage.RAW_FORMATS["parquet"].write(path, rows)
+
+            records = list(storage.iter_records(path))
+
+            assert [r["id"] for r in records] == ["1", "x", "3"]
+            assert [r["size"] for r in records] == [1.0, 2.5, 3.0]
+            assert records[0]["tags"] == '["a"]'
+            assert [r["closed_at"] for r in records] == [
+                "2024-01-01T10:00:00Z",
+                "not a date",
+                None,
+            ]
+
+    def test_chunks_hold_whole_lines(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for raw_format in storage.RAW_FORMATS.values():
+                path = Path(tmp_dir) / raw_format.filename
+                raw_format.write(path, ROWS * 50)
+
+                chunks = list(storage.iter_chunks(path, chunk_size=100))
+
+                assert len(chunks) > 1
+                assert all(chunk.endswith(b"\n") for chunk in chunks)
+                assert b"".join(chunks) == b"".join(storage.iter_lines(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
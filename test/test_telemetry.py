@@ -0,0 +1,35 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from src.telemetry import Telemetry
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_phases_add_up_and_export(self):
+        telemetry = Telemetry()
+        for rows in [3, 4]:
+            with telemetry.phase("script", script="insert-commits") as script:
+                script.rows = rows
+        telemetry.observe_request(0.2, 100, endpoint="commits", status="200")
+        telemetry.observe_request(3.0, 50, endpoint="commits", status="200")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            telemetry.write(tmp_dir, "load")
+
+            metrics = json.loads((Path(tmp_dir) / "load.json").read_text())
+            prom = (Path(tmp_dir) / "load.prom").read_text()
+
+        [script] = metrics["phases"]
+        assert script["runs"] == 2 and script["rows"] == 7
+        assert (
+            'etl_phase_rows_total{job="load",phase="script",script="insert-commits"} 7'
+            in prom
+        )
+        bucket = 'etl_request_duration_seconds_bucket{job="load",endpoint="commits"'
+        assert f'{bucket},status="200",le="0.25"}} 1' in prom
+        assert f'{bucket},status="200",le="+Inf"}} 2' in prom
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import tempfile
+import unittest
+from pathlib import Path
+from src import storage
+from src.utils import count_by_day
+
+ROWS = [
+    {
+        "sha": "a",
+        "commit": {"committer": {"date": "2024-01-01T10:00:00Z"}},
+        "repo": "a/x",
+    },
+    {
+        "sha": "b",
+        "commit": {"committer": {"date": "2024-01-01T11:00:00Z"}},
+        "repo": "a/x",
+    },
+    {
+        "sha": "c",
+        "commit": {"committer": {"date": "2024-01-02T11:00:00Z"}},
+        "repo": "a/x",
+    },
+    {
+        "sha": "d",
+        "commit": {"committer": {"date": "2024-01-01T12:00:00Z"}},
+        "repo": "b/y",
+    },
+]
+
+
+class TestCountByDay(unittest.TestCase):
+    def test_counts_match_in_every_format_and_process_count(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for raw_format in storage.RAW_FORMATS.values():
+                path = Path(tmp_dir) / raw_format.name / raw_format.filename
+                path.parent.mkdir()
+                raw_format.write(path, ROWS)
+                files.append(path)
+
+            sequential = count_by_day(files, workers=1)
+            parallel = count_by_day(files, workers=2)
+            totals = count_by_day(files[:1], group_path=None, workers=1)
+
+        assert sequential.equals(parallel)
+        assert list(sequential.columns) == ["repo", "date", "count"]
+        assert sequential["count"].tolist() == [6, 3, 3]
+        assert totals["count"].tolist() == [3, 1]
+
+
+if __name__ == "__main__":
+    unittest.main()